@@ -0,0 +1,469 @@
+#!/usr/bin/python3
+"""
+OSC Analyze
+    OSCAnalyze.py
+
+    Written by: Shane Hutter
+
+    Required Dependencies:  python >= 3.5, numpy
+
+      The OSC Analyze module contains all of the functions and classes for
+      OSC Analyze, which reads capture files recorded by OSC Listen.
+
+      Capture files are memory mapped, and the record headers and OSC message
+      headers ( path , type tags , first argument ) are decoded into NumPy arrays
+      in bulk, so every statistic is computed without a Python loop per message.
+
+      OSC Analyze is a part of osctoolkit
+
+      osctoolkit is free software; you can redistribute it and/or modify
+      it under the terms of the GNU Lesser General Public License as published
+      by the Free Software Foundation, either version 3 of the License, or
+      (at your option) any later version.
+
+      osctoolkit is distributed in the hope that it will be useful,
+      but WITHOUT ANY WARRANTY; without even the implied warranty of
+      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+      GNU Lesser General Public License for more details.
+
+      You should have received a copy of the GNU Lesser General Public License
+      along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Import modules
+from .              import *
+from .OSCCapture    import FILE_MAGIC, BLOCK_MAGIC, BLOCK_HEADER, NANOSECONDS
+from argparse       import ArgumentParser
+from sys            import exit
+from mmap           import mmap, ACCESS_READ
+import numpy
+
+
+
+# Record headers, as written by OSCCapture.RECORD_HEADER
+RECORD_DTYPE = numpy.dtype(
+        [
+            ( 'time'    , '<i8' ) ,
+            ( 'port'    , '<u2' ) ,
+            ( 'pad'     , '<u2' ) ,
+            ( 'offset'  , '<u4' ) ,
+            ( 'length'  , '<u4' ) ,
+            ]
+        )
+
+# Record headers once loaded, offsets are into the whole file, which can be
+#   larger than 4 GiB
+LOADED_RECORD_DTYPE = numpy.dtype(
+        [
+            ( 'time'    , '<i8' ) ,
+            ( 'port'    , '<u2' ) ,
+            ( 'pad'     , '<u2' ) ,
+            ( 'offset'  , '<i8' ) ,
+            ( 'length'  , '<u4' ) ,
+            ]
+        )
+
+# OSC message header decoding
+PATH_WIDTH          = 64
+TYPES_WIDTH         = 16
+OSC_ALIGNMENT       = 4
+TYPES_START         = ord( ',' )
+FLOAT_TYPE          = ord( 'f' )
+
+# Records decoded at once, each chunk gathers PATH_WIDTH byte offsets per
+#   record, so this keeps a chunk to tens of megabytes
+DECODE_CHUNK        = 1 << 16
+
+MILLISECONDS        = 1000.0
+MICROSECONDS        = 1000000.0
+PERCENTILES         = ( 50 , 95 , 99 , )
+
+
+
+class ParseArgs:
+    """ Parse command line arguments for OSC Analyze. """
+
+    def __init__( self ):
+        # Run initilization methods
+        self.argData = self.parse()
+
+    def parse( self ):
+        parser = ArgumentParser(
+                description = 'Analyze OSC traffic captured by osclisten --record.' ,
+                )
+
+        # Capture files, in order ( FILE FILE.1 FILE.2 ... )
+        parser.add_argument(
+                'captureFiles'                                          ,
+                nargs       = '+'                                       ,
+                metavar     = 'FILE'                                    ,
+                help        = 'Capture files recorded by OSC Listen.'   ,
+                )
+
+        parser.add_argument(
+                '-b'                                                            ,
+                '--bin'                                                         ,
+                dest        = 'binSeconds'                                      ,
+                type        = float                                             ,
+                default     = 1.0                                               ,
+                help        = 'Width in seconds of the message rate time bins.' ,
+                )
+
+        parser.add_argument(
+                '-g'                                                                    ,
+                '--burst-gap'                                                           ,
+                dest        = 'burstGap'                                                ,
+                type        = float                                                     ,
+                default     = 1.0                                                       ,
+                help        = 'Milliseconds of silence that end a burst of messages.'   ,
+                )
+
+        parser.add_argument(
+                '-t'                                                    ,
+                '--top'                                                 ,
+                dest        = 'top'                                     ,
+                type        = int                                       ,
+                default     = 20                                        ,
+                help        = 'Number of paths to display, busiest first.' ,
+                )
+
+        parser.add_argument(
+                '-r'                                                                    ,
+                '--rates'                                                               ,
+                dest        = 'ratesFile'                                               ,
+                metavar     = 'CSV'                                                     ,
+                help        = 'Write the message rate of every path per time bin to CSV.' ,
+                )
+
+        args = parser.parse_args()
+        return {
+                'captureFiles'  : args.captureFiles     ,
+                'binSeconds'    : args.binSeconds       ,
+                'burstGap'      : args.burstGap         ,
+                'top'           : args.top              ,
+                'ratesFile'     : args.ratesFile        ,
+                }
+
+
+
+class CaptureFile:
+    """ Memory map a capture file and decode its record headers. """
+
+    def __init__(
+            self            ,
+            captureFileName ,
+            ):
+        self.captureFileName = captureFileName
+
+        # Run initialization functions
+        with open( captureFileName , 'rb' ) as captureFile:
+            self.captureMap = mmap( captureFile.fileno() , 0 , access = ACCESS_READ )
+        self.data       = numpy.frombuffer( self.captureMap , dtype = numpy.uint8 )
+        self.records    = self.readRecords()
+
+    def readRecords( self ):
+        """ Return every record header, with offsets made relative to the file. """
+        if self.captureMap[ : len( FILE_MAGIC ) ] != FILE_MAGIC:
+            exit( 'Error: ' + self.captureFileName + ' is not an OSC capture file' )
+
+        # Walk the blocks, decoding each block of record headers at once
+        blocks = []
+        offset = len( FILE_MAGIC )
+        while offset + BLOCK_HEADER.size <= len( self.captureMap ):
+            magic , recordCount , payloadSize = BLOCK_HEADER.unpack_from( self.captureMap , offset )
+            headersStart    = offset + BLOCK_HEADER.size
+            payloadStart    = headersStart + recordCount * RECORD_DTYPE.itemsize
+            if magic != BLOCK_MAGIC or payloadStart + payloadSize > len( self.captureMap ):
+                # A torn final block, from a capture that did not exit cleanly
+                break
+            records = numpy.frombuffer(
+                    self.captureMap                 ,
+                    dtype   = RECORD_DTYPE          ,
+                    count   = recordCount           ,
+                    offset  = headersStart          ,
+                    ).astype( LOADED_RECORD_DTYPE )
+            records[ 'offset' ] += payloadStart
+            blocks.append( records )
+            offset = payloadStart + payloadSize
+
+        if not blocks:
+            return numpy.zeros( 0 , dtype = LOADED_RECORD_DTYPE )
+        return numpy.concatenate( blocks )
+
+
+
+def stringLengths( window ):
+    """ Return the length of the null terminated string in each row of a byte window. """
+    nulls   = window == 0
+    lengths = nulls.argmax( axis = 1 )
+    lengths[ ~nulls.any( axis = 1 ) ] = window.shape[ 1 ]
+    return lengths
+
+
+def byteWindow(
+        data    ,
+        starts  ,
+        width   ,
+        ends    ,
+        ):
+    """ Gather width bytes from each start, with bytes at or past each end set to 0. """
+    columns     = numpy.arange( width , dtype = numpy.int32 )
+    positions   = starts[ : , None ] + columns
+    numpy.minimum( positions , len( data ) - 1 , out = positions )
+    window      = data[ positions ]
+    del positions
+    window[ columns >= ( ends - starts ).astype( numpy.int32 )[ : , None ] ] = 0
+    return window
+
+
+def decodeMessages(
+        data    ,
+        records ,
+        ):
+    """
+        Decode the OSC header of every record.
+
+        Returns ( path bytes , first argument as float or NaN ).  Paths longer
+        than PATH_WIDTH are cut short, and bundles are reported as #bundle.
+    """
+    starts  = records[ 'offset' ]
+    ends    = starts + records[ 'length' ]
+
+    # Path
+    window      = byteWindow( data , starts , PATH_WIDTH , ends )
+    pathLengths = stringLengths( window )
+    window[ numpy.arange( PATH_WIDTH ) >= pathLengths[ : , None ] ] = 0
+    paths       = window.view( 'S' + str( PATH_WIDTH ) ).ravel()
+
+    # Type tags start after the path and its padding
+    typesStart  = starts + ( pathLengths // OSC_ALIGNMENT + 1 ) * OSC_ALIGNMENT
+    types       = byteWindow( data , typesStart , TYPES_WIDTH , ends )
+    typeLengths = stringLengths( types )
+
+    # First argument, when it is a float
+    argStart    = typesStart + ( typeLengths // OSC_ALIGNMENT + 1 ) * OSC_ALIGNMENT
+    isFloat     = ( types[ : , 0 ] == TYPES_START ) & ( types[ : , 1 ] == FLOAT_TYPE ) & ( argStart + 4 <= ends )
+    argBytes    = byteWindow( data , argStart , 4 , ends )
+    values      = argBytes.copy().view( '>f4' ).ravel().astype( numpy.float64 )
+    values[ ~isFloat ] = numpy.nan
+
+    return paths , values
+
+
+
+class TrafficAnalysis:
+    """ Load capture files, and compute traffic statistics per path. """
+
+    def __init__(
+            self            ,
+            captureFiles    ,
+            binSeconds      ,
+            burstGap        ,
+            ):
+        self.binSeconds = binSeconds
+        self.burstGap   = burstGap
+
+        # Run initialization functions
+        self.times , self.pathIds , self.values , self.pathNames = self.load( captureFiles )
+        order           = numpy.argsort( self.times , kind = 'stable' )
+        self.times      = self.times[ order ]
+        self.pathIds    = self.pathIds[ order ]
+        self.values     = self.values[ order ]
+
+    def load(
+            self            ,
+            captureFiles    ,
+            ):
+        """ Decode every capture file, in chunks, into time , path id and value arrays. """
+        pathIndex   = {}
+        times       = []
+        pathIds     = []
+        values      = []
+        for captureFileName in captureFiles:
+            capture = CaptureFile( captureFileName )
+            for chunkStart in range( 0 , len( capture.records ) , DECODE_CHUNK ):
+                records = capture.records[ chunkStart : chunkStart + DECODE_CHUNK ]
+                paths , chunkValues = decodeMessages( capture.data , records )
+
+                # Map the paths of this chunk onto ids shared by every chunk
+                chunkPaths , inverse = numpy.unique( paths , return_inverse = True )
+                chunkIds = numpy.array(
+                        [ pathIndex.setdefault( path , len( pathIndex ) ) for path in chunkPaths ] ,
+                        dtype = numpy.int32 ,
+                        )
+                times.append( records[ 'time' ] )
+                pathIds.append( chunkIds[ inverse.ravel() ] )
+                values.append( chunkValues )
+
+        if not times:
+            exit( 'Error: no messages were captured' )
+
+        pathNames = [ path.decode( 'utf-8' , 'replace' ) for path in pathIndex ]
+        return (
+                numpy.concatenate( times )      ,
+                numpy.concatenate( pathIds )    ,
+                numpy.concatenate( values )     ,
+                pathNames                       ,
+                )
+
+    def rates( self ):
+        """ Return a ( paths , bins ) array of messages per second for each time bin. """
+        binWidth    = int( self.binSeconds * NANOSECONDS )
+        bins        = ( self.times - self.times[ 0 ] ) // binWidth
+        binCount    = int( bins[ -1 ] ) + 1
+        counts      = numpy.bincount(
+                self.pathIds.astype( numpy.int64 ) * binCount + bins    ,
+                minlength = len( self.pathNames ) * binCount            ,
+                )
+        return counts.reshape( len( self.pathNames ) , binCount ) / self.binSeconds
+
+    def groupedPercentiles(
+            self        ,
+            groupIds    ,
+            samples     ,
+            ):
+        """ Return ( counts , percentiles ) of samples for each group id, from one sort. """
+        order       = numpy.lexsort( ( samples , groupIds ) )
+        groupIds    = groupIds[ order ]
+        samples     = samples[ order ]
+        counts      = numpy.bincount( groupIds , minlength = len( self.pathNames ) )
+        groupStarts = numpy.concatenate( ( [ 0 ] , numpy.cumsum( counts )[ : -1 ] ) )
+
+        percentiles = numpy.full( ( len( self.pathNames ) , len( PERCENTILES ) ) , numpy.nan )
+        hasSamples  = counts > 0
+        for column , percentile in enumerate( PERCENTILES ):
+            positions = groupStarts + ( ( counts - 1 ) * percentile ) // 100
+            percentiles[ hasSamples , column ] = samples[ positions[ hasSamples ] ]
+        return counts , percentiles
+
+    def interArrival( self ):
+        """ Return per path percentiles of inter arrival time and jitter in milliseconds. """
+        order       = numpy.lexsort( ( self.times , self.pathIds ) )
+        pathIds     = self.pathIds[ order ]
+        times       = self.times[ order ]
+        samePath    = pathIds[ 1: ] == pathIds[ : -1 ]
+        intervals   = numpy.diff( times )[ samePath ] / NANOSECONDS * MILLISECONDS
+        intervalIds = pathIds[ 1: ][ samePath ]
+
+        # Jitter is the change between consecutive intervals of a path ( RFC 3550 D )
+        sameInterval    = intervalIds[ 1: ] == intervalIds[ : -1 ]
+        jitter          = numpy.abs( numpy.diff( intervals ) )[ sameInterval ]
+        jitterIds       = intervalIds[ 1: ][ sameInterval ]
+
+        return (
+                self.groupedPercentiles( intervalIds , intervals )[ 1 ] ,
+                self.groupedPercentiles( jitterIds , jitter )[ 1 ]      ,
+                )
+
+    def bursts( self ):
+        """ Return the size of every burst, messages separated by less than the burst gap. """
+        gaps        = numpy.diff( self.times ) / NANOSECONDS * MILLISECONDS
+        burstStarts = numpy.concatenate( ( [ 0 ] , numpy.nonzero( gaps > self.burstGap )[ 0 ] + 1 , [ len( self.times ) ] ) )
+        return numpy.diff( burstStarts )
+
+    def valueDistributions( self ):
+        """ Return per path ( count , min , max , mean , percentiles ) of float first arguments. """
+        isFloat = ~numpy.isnan( self.values )
+        pathIds = self.pathIds[ isFloat ]
+        values  = self.values[ isFloat ]
+        counts , percentiles = self.groupedPercentiles( pathIds , values )
+
+        minimums    = numpy.full( len( self.pathNames ) , numpy.nan )
+        maximums    = numpy.full( len( self.pathNames ) , numpy.nan )
+        numpy.fmin.at( minimums , pathIds , values )
+        numpy.fmax.at( maximums , pathIds , values )
+        sums        = numpy.bincount( pathIds , weights = values , minlength = len( self.pathNames ) )
+        with numpy.errstate( invalid = 'ignore' , divide = 'ignore' ):
+            means   = sums / counts
+        return counts , minimums , maximums , means , percentiles
+
+
+
+def writeRates(
+        analysis    ,
+        rates       ,
+        ratesFile   ,
+        ):
+    """ Write the per bin message rate of every path as CSV, one row per path. """
+    with open( ratesFile , 'w' ) as outFile:
+        outFile.write(
+                'path,' + ','.join(
+                    str( binIndex * analysis.binSeconds ) for binIndex in range( rates.shape[ 1 ] )
+                    ) + '\n'
+                )
+        for pathName , pathRates in zip( analysis.pathNames , rates ):
+            outFile.write( pathName + ',' + ','.join( '%g' % rate for rate in pathRates ) + '\n' )
+    return
+
+
+def displayAnalysis(
+        analysis    ,
+        top         ,
+        ratesFile   ,
+        ):
+    """ Display the traffic statistics, busiest paths first. """
+    duration = ( analysis.times[ -1 ] - analysis.times[ 0 ] ) / NANOSECONDS
+    rates = analysis.rates()
+    if ratesFile:
+        writeRates( analysis , rates , ratesFile )
+
+    intervals , jitter  = analysis.interArrival()
+    burstSizes          = analysis.bursts()
+    valueCounts , minimums , maximums , means , valuePercentiles = analysis.valueDistributions()
+    messageCounts       = numpy.bincount( analysis.pathIds , minlength = len( analysis.pathNames ) )
+
+    print( 'Messages: ' + str( len( analysis.times ) ) + '  Paths: ' + str( len( analysis.pathNames ) ) + '  Duration: ' + '%.3f' % duration + ' s' )
+    print(
+            'Bursts ( gap > %g ms ): %d  mean size %.1f  p99 size %d  max size %d' % (
+                analysis.burstGap                                   ,
+                len( burstSizes )                                   ,
+                burstSizes.mean()                                   ,
+                numpy.percentile( burstSizes , 99 )                 ,
+                burstSizes.max()                                    ,
+                )
+            )
+    print()
+
+    # Message rates and timing
+    print(
+            '%-40s %10s %10s %10s %10s %10s %10s %10s' % (
+                'PATH' , 'MESSAGES' , 'MEAN/S' , 'PEAK/S' , 'IAT p50' , 'IAT p99' , 'JIT p50' , 'JIT p99' ,
+                )
+            )
+    busiest = numpy.argsort( -messageCounts , kind = 'stable' )[ : top ]
+    for pathId in busiest:
+        print(
+                '%-40s %10d %10.1f %10.1f %10.3f %10.3f %10.3f %10.3f' % (
+                    analysis.pathNames[ pathId ][ : 40 ]    ,
+                    messageCounts[ pathId ]                 ,
+                    messageCounts[ pathId ] / max( duration , analysis.binSeconds ) ,
+                    rates[ pathId ].max()                   ,
+                    intervals[ pathId , 0 ]                 ,
+                    intervals[ pathId , 2 ]                 ,
+                    jitter[ pathId , 0 ]                    ,
+                    jitter[ pathId , 2 ]                    ,
+                    )
+                )
+    print()
+
+    # Float argument distributions
+    print(
+            '%-40s %10s %10s %10s %10s %10s %10s %10s' % (
+                'PATH' , 'FLOATS' , 'MIN' , 'MEAN' , 'p50' , 'p95' , 'p99' , 'MAX' ,
+                )
+            )
+    for pathId in busiest:
+        if valueCounts[ pathId ]:
+            print(
+                    '%-40s %10d %10.4g %10.4g %10.4g %10.4g %10.4g %10.4g' % (
+                        analysis.pathNames[ pathId ][ : 40 ]    ,
+                        valueCounts[ pathId ]                   ,
+                        minimums[ pathId ]                      ,
+                        means[ pathId ]                         ,
+                        valuePercentiles[ pathId , 0 ]          ,
+                        valuePercentiles[ pathId , 1 ]          ,
+                        valuePercentiles[ pathId , 2 ]          ,
+                        maximums[ pathId ]                      ,
+                        )
+                    )
+    return
@@ -0,0 +1,224 @@
+#!/usr/bin/python3
+"""
+OSC Capture
+    OSCCapture.py
+
+    Written by: Shane Hutter
+
+    Required Dependencies:  python >= 3.5
+
+      The OSC Capture module contains the capture file format shared by the
+      OSC Listen recording mode and the OSC Analyze capture analyzer.
+
+      A capture file starts with FILE_MAGIC, followed by blocks:
+          block header    BLOCK_MAGIC , record count , payload size
+          record headers  record count x ( receive time ns , port , offset , length )
+          payload         the raw datagrams of the block, back to back
+
+      Record headers are fixed size, so a reader can decode all of the headers
+      of a block in one step, and only walks from block to block.
+
+      OSC Capture is a part of osctoolkit
+
+      osctoolkit is free software; you can redistribute it and/or modify
+      it under the terms of the GNU Lesser General Public License as published
+      by the Free Software Foundation, either version 3 of the License, or
+      (at your option) any later version.
+
+      osctoolkit is distributed in the hope that it will be useful,
+      but WITHOUT ANY WARRANTY; without even the implied warranty of
+      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+      GNU Lesser General Public License for more details.
+
+      You should have received a copy of the GNU Lesser General Public License
+      along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Import modules
+from .          import *
+from struct     import Struct
+from os         import fsync
+from os.path    import isfile, getsize
+from time       import time
+from socket     import (
+        socket      , AF_INET       , SOCK_DGRAM    , SOL_SOCKET    , SO_RCVBUF ,
+        )
+try:
+    from socket import SO_TIMESTAMPNS
+except ImportError:
+    # Linux value, only used where the platform does not export it
+    SO_TIMESTAMPNS = 35
+
+
+## Capture file format
+FILE_MAGIC      = b'OSCCAP01'
+BLOCK_MAGIC     = b'OSCB'
+
+# Block header ( magic , record count , payload size )
+BLOCK_HEADER    = Struct( '<4sII' )
+
+# Record header ( receive time ns , port , padding , payload offset , length )
+RECORD_HEADER   = Struct( '<qHxxII' )
+
+# Kernel receive timestamp ( struct timespec )
+TIMESPEC        = Struct( '@ll' )
+NANOSECONDS     = 1000000000
+
+
+
+class CaptureWriter:
+    """
+        Append only writer for capture files.
+
+        Datagrams are gathered into blocks in memory, blocks are written when
+        full, and sync() writes any partial block and fsyncs the file.  The file
+        is rotated to CAPTURE.1 , CAPTURE.2 , ... when it grows past rotateSize.
+    """
+
+    BLOCK_RECORDS   = 4096
+    BLOCK_BYTES     = 1 << 20
+    SYNC_INTERVAL   = 1.0
+    MEGABYTES       = 1 << 20
+
+    def __init__(
+            self                ,
+            captureFileName     ,
+            rotateSize  = 1024  ,
+            ):
+        self.captureFileName    = captureFileName
+        self.rotateSize         = rotateSize * self.MEGABYTES
+        self.fileNumber         = 0
+
+        # Current block
+        self.recordHeaders      = bytearray()
+        self.payload            = bytearray()
+        self.recordCount        = 0
+
+        # Run initialization functions
+        self.captureFile = self.openCaptureFile()
+
+    def fileName( self ):
+        """ Return the file name for the current file number. """
+        if self.fileNumber:
+            return self.captureFileName + '.' + str( self.fileNumber )
+        return self.captureFileName
+
+    def openCaptureFile( self ):
+        """ Open the first capture file with room left, appending to it. """
+        while isfile( self.fileName() ) and self.rotateSize and getsize( self.fileName() ) >= self.rotateSize:
+            self.fileNumber += 1
+        captureFile = open( self.fileName() , 'ab' )
+        if not captureFile.tell():
+            captureFile.write( FILE_MAGIC )
+        return captureFile
+
+    def add(
+            self        ,
+            timestamp   ,
+            port        ,
+            datagram    ,
+            ):
+        """ Add a datagram to the current block. """
+        self.recordHeaders += RECORD_HEADER.pack(
+                timestamp           ,
+                port                ,
+                len( self.payload ) ,
+                len( datagram )     ,
+                )
+        self.payload        += datagram
+        self.recordCount    += 1
+        if self.recordCount >= self.BLOCK_RECORDS or len( self.payload ) >= self.BLOCK_BYTES:
+            self.writeBlock()
+
+    def writeBlock( self ):
+        """ Write the current block, and rotate the file if it is full. """
+        if not self.recordCount:
+            return
+        self.captureFile.write(
+                BLOCK_HEADER.pack(
+                    BLOCK_MAGIC         ,
+                    self.recordCount    ,
+                    len( self.payload ) ,
+                    )
+                )
+        self.captureFile.write( self.recordHeaders )
+        self.captureFile.write( self.payload )
+        self.recordHeaders  = bytearray()
+        self.payload        = bytearray()
+        self.recordCount    = 0
+
+        if self.rotateSize and self.captureFile.tell() >= self.rotateSize:
+            self.sync()
+            self.captureFile.close()
+            self.fileNumber += 1
+            self.captureFile = self.openCaptureFile()
+
+    def sync( self ):
+        """ Write any partial block and fsync the capture file. """
+        self.writeBlock()
+        self.captureFile.flush()
+        fsync( self.captureFile.fileno() )
+
+    def close( self ):
+        self.sync()
+        self.captureFile.close()
+
+
+
+class RecordingSocket:
+    """
+        A raw UDP listen port that records every datagram to a CaptureWriter.
+
+        It has the fileno() and recv() of a liblo Server, so the OSC Listen
+        listen loop can drain it like any other listen port, but datagrams are
+        never decoded.
+    """
+
+    MAX_DATAGRAM        = 65536
+    RECEIVE_BUFFER      = 4 * ( 1 << 20 )
+    ANCILLARY_SIZE      = 64
+
+    def __init__(
+            self    ,
+            port    ,
+            writer  ,
+            ):
+        self.port   = port
+        self.writer = writer
+
+        # Kernel receive timestamps, and room for bursts
+        self.listenSocket = socket( AF_INET , SOCK_DGRAM )
+        self.listenSocket.setsockopt( SOL_SOCKET , SO_RCVBUF , self.RECEIVE_BUFFER )
+        try:
+            self.listenSocket.setsockopt( SOL_SOCKET , SO_TIMESTAMPNS , 1 )
+        except OSError:
+            pass
+        self.listenSocket.bind( ( '' , port ) )
+        self.listenSocket.setblocking( False )
+
+    def fileno( self ):
+        return self.listenSocket.fileno()
+
+    def recv(
+            self            ,
+            timeout = None  ,
+            ):
+        """ Record one waiting datagram, and return False if there was none. """
+        try:
+            datagram , ancillaryData , flags , address = self.listenSocket.recvmsg(
+                    self.MAX_DATAGRAM   ,
+                    self.ANCILLARY_SIZE ,
+                    )
+        except BlockingIOError:
+            return False
+
+        timestamp = None
+        for level , kind , data in ancillaryData:
+            if level == SOL_SOCKET and kind == SO_TIMESTAMPNS:
+                seconds , nanoseconds = TIMESPEC.unpack( data[ : TIMESPEC.size ] )
+                timestamp = seconds * NANOSECONDS + nanoseconds
+        if timestamp is None:
+            timestamp = int( time() * NANOSECONDS )
+
+        self.writer.add( timestamp , self.port , datagram )
+        return True
@@ -26,17 +26,42 @@ OSC Listen
 """
 
 # Import modules
+#   liblo, argparse, and the modules of each output mode are imported where
+#   they are used, so each mode only loads what it needs
 from .          import *
-from argparse   import ArgumentParser
-from liblo      import Server, ServerError
-from sys        import exit
+from sys        import exit, stdout, stderr
 from os.path    import isfile
+from selectors  import DefaultSelector, EVENT_READ
+from time       import time, monotonic
+from math       import isfinite
 
 
 # Declare class variables
 exitCall = False
 oscListenServers = []
 
+# Messages received from one ready port before checking the other ports again
+MAX_DRAIN_MESSAGES = 256
+
+# Port range symbol ( 9001-9100 )
+PORT_RANGE_SYMBOL = '-'
+
+# Output formats, text is displayed as it arrives, the others are buffered
+OUTPUT_FORMATS = ( 'text' , 'jsonl' , 'csv' , 'tsv' , )
+
+
+def parsePorts( portData ):
+    """ Return a list of ports from a single port, or an inclusive port range. """
+    if PORT_RANGE_SYMBOL in portData:
+        firstPort , lastPort = portData.split( PORT_RANGE_SYMBOL , 1 )
+        return list(
+                range(
+                    int( firstPort )        ,
+                    int( lastPort ) + 1     ,
+                    )
+                )
+    return [ int( portData ) ]
+
 class ConfigFile():
     """Load and parse OSC Toolkit configuration file for OSC Listen."""
     ## Class variables for loading and parsing the configuration file
@@ -57,6 +82,9 @@ class ConfigFile():
         self.verboseMotd = False
         self.listenPorts = []
         self.motd = ''
+        self.outputFormat = 'text'
+        self.includePaths = []
+        self.excludePaths = []
     
         # Run initialization functions
         self.configData = self.parseConfigFile(
@@ -128,10 +156,30 @@ class ConfigFile():
                 ## OSC Settings
                 # Listen port
                 if lineReadProtoComment[ self.CONFIG_PROPERTY_ARG ] == 'osclisten.listen_port':
-                    self.listenPorts.append(
-                            int(
-                                lineReadProtoComment[ self.CONFIG_VALUE_ARG ]
+                    self.listenPorts += parsePorts(
+                            lineReadProtoComment[ self.CONFIG_VALUE_ARG ]
+                            )
+
+                ## Output Settings
+                # Output format ( text, jsonl, csv, tsv )
+                if lineReadProtoComment[ self.CONFIG_PROPERTY_ARG ] == 'osclisten.output_format':
+                    self.outputFormat = lineReadProtoComment[ self.CONFIG_VALUE_ARG ]
+                    if self.outputFormat not in OUTPUT_FORMATS:
+                        exit(
+                                'Error: osclisten.output_format ' + self.outputFormat +
+                                ' is not one of ' + ', '.join( OUTPUT_FORMATS )
                                 )
+
+                ## Path Filters
+                # Include and exclude path prefixes or OSC address patterns
+                if lineReadProtoComment[ self.CONFIG_PROPERTY_ARG ] == 'osclisten.include':
+                    self.includePaths.append(
+                            lineReadProtoComment[ self.CONFIG_VALUE_ARG ]
+                            )
+
+                if lineReadProtoComment[ self.CONFIG_PROPERTY_ARG ] == 'osclisten.exclude':
+                    self.excludePaths.append(
+                            lineReadProtoComment[ self.CONFIG_VALUE_ARG ]
                             )
 
         return {
@@ -139,6 +187,9 @@ class ConfigFile():
                 'listenPorts'           : self.listenPorts          ,
                 'verboseMotd'           : self.verboseMotd          , 
                 'motd'                  : self.motd                 ,
+                'outputFormat'          : self.outputFormat         ,
+                'includePaths'          : self.includePaths         ,
+                'excludePaths'          : self.excludePaths         ,
                 }
 
 
@@ -155,6 +206,12 @@ class ParseArgs():
         self.verboseListenPorts = configData[ 'verboseListenPorts' ]
         self.verboseMotd = configData[ 'verboseMotd' ]
         self.listenPorts = []
+        self.outputFormat = configData[ 'outputFormat' ]
+        self.dashboardFrameRate = None
+        self.includePaths = list( configData[ 'includePaths' ] )
+        self.excludePaths = list( configData[ 'excludePaths' ] )
+        self.recordFile = None
+        self.recordRotateSize = 1024
 
         # run initilization methods
         self.argData = self.parse()
@@ -162,6 +219,7 @@ class ParseArgs():
     def parse( self ):
         ## Parse Arguments
         # These values may potentially overwrite config arguments
+        from argparse import ArgumentParser
         parser = ArgumentParser(
                 description = 'Display incoming Open Sound Control messages.'   ,
                 )
@@ -173,8 +231,8 @@ class ParseArgs():
                 "--listen"                                                              , 
                 dest        = "ports"                                                   , 
                 nargs       = "+"                                                       , 
-                type        = int                                                       , 
-                help        = "List additional ports to listen for OSC messages on."    ,
+                type        = parsePorts                                                , 
+                help        = "List additional ports, or port ranges (9001-9100), to listen for OSC messages on." ,
                 )
 
         # Verbosely display listen ports
@@ -185,6 +243,63 @@ class ParseArgs():
                 help        = "Verbosely display listen ports and MOTD on startup." ,
                 )
 
+        # Output format
+        parser.add_argument(
+                "-o"                                                                        ,
+                "--output"                                                                  ,
+                dest        = "outputFormat"                                                ,
+                choices     = OUTPUT_FORMATS                                                ,
+                help        = "Display messages as text, or write JSON Lines, CSV, or TSV." ,
+                )
+
+        # Dashboard mode
+        parser.add_argument(
+                "-D"                                                                                ,
+                "--dashboard"                                                                       ,
+                dest        = "dashboardFrameRate"                                                  ,
+                nargs       = "?"                                                                   ,
+                const       = Dashboard.FRAME_RATE                                                  ,
+                type        = float                                                                 ,
+                metavar     = "FPS"                                                                 ,
+                help        = "Show live message rates, last values, and jitter instead of messages." ,
+                )
+
+        # Path filters
+        parser.add_argument(
+                "-i"                                                                            ,
+                "--include"                                                                     ,
+                dest        = "includePaths"                                                    ,
+                nargs       = "+"                                                               ,
+                metavar     = "PATH"                                                            ,
+                help        = "Only show paths under these prefixes or matching these OSC patterns." ,
+                )
+
+        parser.add_argument(
+                "-x"                                                                            ,
+                "--exclude"                                                                     ,
+                dest        = "excludePaths"                                                    ,
+                nargs       = "+"                                                               ,
+                metavar     = "PATH"                                                            ,
+                help        = "Never show paths under these prefixes or matching these OSC patterns." ,
+                )
+
+        # Binary recording mode
+        parser.add_argument(
+                "-r"                                                                            ,
+                "--record"                                                                      ,
+                dest        = "recordFile"                                                      ,
+                metavar     = "FILE"                                                            ,
+                help        = "Record raw datagrams with kernel receive timestamps to FILE."    ,
+                )
+
+        parser.add_argument(
+                "--rotate"                                                                      ,
+                dest        = "recordRotateSize"                                                ,
+                type        = int                                                               ,
+                metavar     = "MB"                                                              ,
+                help        = "Start a new recording file every MB megabytes (0 never rotates)." ,
+                )
+
         # Add specific verbosity for listen ports and MOTD (see as OSC Whispers arg parsing)
         # Add quiet mode to halt verbosity
         # Add specific quiet mode (see OSC Whispers arg parsing)
@@ -194,30 +309,53 @@ class ParseArgs():
         if args.verbose:
             self.verboseListenPorts = self.verboseMotd = args.verbose
         if args.ports:
-            for port in args.ports:
-                self.listenPorts.append( port )
+            for ports in args.ports:
+                self.listenPorts += ports
+        if args.outputFormat:
+            self.outputFormat = args.outputFormat
+        if args.dashboardFrameRate:
+            self.dashboardFrameRate = args.dashboardFrameRate
+        if args.includePaths:
+            self.includePaths += args.includePaths
+        if args.excludePaths:
+            self.excludePaths += args.excludePaths
+        if args.recordFile:
+            self.recordFile = args.recordFile
+        if args.recordRotateSize is not None:
+            self.recordRotateSize = args.recordRotateSize
         
         return {
                 'verboseListenPorts'    : self.verboseListenPorts   ,
                 'verboseMotd'           : self.verboseMotd          , 
                 'listenPorts'           : self.listenPorts          ,
+                'outputFormat'          : self.outputFormat         ,
+                'dashboardFrameRate'    : self.dashboardFrameRate   ,
+                'includePaths'          : self.includePaths         ,
+                'excludePaths'          : self.excludePaths         ,
+                'recordFile'            : self.recordFile           ,
+                'recordRotateSize'      : self.recordRotateSize     ,
                 }
         
     
 # Verbosely display listen ports
-def displayListenPorts( listenPorts ):
+def displayListenPorts(
+        listenPorts         ,
+        outFile = stdout    ,
+        ):
     for portIdNum in listenPorts:
         print(
                 'Listening for OSC on port number: '    , 
-                end = ''                                ,
+                end     = ''                            ,
+                file    = outFile                       ,
                 )
-        print( portIdNum )
-    print()
+        print( portIdNum , file = outFile )
+    print( file = outFile )
     return
             
     
 # Setup listen ports
 def setupOSCServers( listenPorts ):
+    from liblo import Server, ServerError
     try:
         for oscServerId in listenPorts:
             oscListenServers.append(
@@ -228,60 +366,677 @@ def setupOSCServers( listenPorts ):
     return
 
 
-# Build the functions for echoing messages on each port, then regiter as OSC servers
-def buildOSCServers( listenPorts ):
-    # Setup Constants for building OSC servers
-    global EXIT_ARG_INDEX  # ToDo: Fix this global!!!
-    EXIT_ARG_INDEX      = 0
-    COMMAND_OSC_PATH    = '/osclisten'
-    EXIT_COMMAND_PATH   = COMMAND_OSC_PATH + '/exit'
-
-    # Setup variables for building the OSC servers
-    oscSppDef           = []
-    oscSppRegistration  = []
-
-    # Build server per port (spp) fucntion strings
-    for eachPort in listenPorts:
-        oscSppDefLine = 'def oscServer_' + str( eachPort ) + '(path, args):\n'
-        #if the path is '/oscwhispers/exit, and the value is 1 then exit
-        '''
-            The COMMAND_OSC_PATH command parsing and execution should not happen here
-                i.e.
-                    /osclisten/exit (1 | True | !NULL)
-                    should happen elsewhere
-                    along with any other OSC Listen specific OSC commands
-
-            Fix  this in future commits
-        '''
-        oscSppDefLine += '    if path == "'  + EXIT_COMMAND_PATH  +  '" and int(args[EXIT_ARG_INDEX]) == 1:\n'
-        oscSppDefLine += '        exit()\n'
-        oscSppDefLine += '    else:\n'
-        # or else echo the incoming message
-        oscSppDefLine += '        print("' + str( eachPort ) + ': ", end = "")\n'
-        oscSppDefLine += '        print(path, end = " ")\n'
-        oscSppDefLine += '        print(args)\n'
-        oscSppDefLine += '    return'
-        oscSppDef.append( oscSppDefLine )
-
-    # Build server per port (spp) functions
-    for execSppDefLine in oscSppDef:
-        exec( execSppDefLine )
-
-    # Build server per port (spp) OSC method registration string
-    for eachPort in listenPorts:
-        oscSppBuild = 'oscListenServers[eachMethod[ENUMERATE_ITERATE_INDEX]].add_method(None, None, oscServer_' + str( eachPort ) + ')'
-        oscSppRegistration.append( oscSppBuild )
-    
-    # Register methods for listening on each port as an OSC Server
-    for eachMethod in enumerate( oscSppRegistration ):
-        exec(
-                eachMethod[ ENUMERATE_VALUE_INDEX ]
+# Open the capture file for recording mode
+def createCaptureWriter(
+        recordFile          ,
+        recordRotateSize    ,
+        ):
+    from .OSCCapture import CaptureWriter
+    try:
+        return CaptureWriter(
+                recordFile          ,
+                recordRotateSize    ,
                 )
+    except OSError as error:
+        exit( error )
+
+
+# Setup raw recording listen ports
+def setupRecordingSockets(
+        listenPorts ,
+        writer      ,
+        ):
+    """ Listen on each port without liblo, recording every datagram to writer. """
+    from .OSCCapture import RecordingSocket
+    try:
+        for port in listenPorts:
+            oscListenServers.append(
+                    RecordingSocket( port , writer )
+                    )
+    except OSError as error:
+        exit( error )
     return
 
-def displayMOTD( motd ):
+
+# OSC Listen command paths
+COMMAND_OSC_PATH    = '/osclisten'
+EXIT_COMMAND_PATH   = COMMAND_OSC_PATH + '/exit'
+EXIT_ARG_INDEX      = 0
+EXIT_ARG_VALUE      = 1
+
+# liblo tries the next registered method when a method returns non zero
+PASS_TO_NEXT_METHOD = 1
+MESSAGE_HANDLED     = 0
+
+
+class StructuredOutput:
+    """
+        Write incoming messages to stdout as JSON Lines, CSV, or TSV.
+
+        CSV and TSV rows have one args column, holding the arguments as a JSON
+        array, so every row matches CSV_HEADER.  inf and NaN float arguments
+        are written as strings, so every line is valid JSON.  Output goes
+        through a large write buffer that is flushed periodically by
+        listenLoop, instead of once per message.
+    """
+    OUTPUT_BUFFER_SIZE  = 1 << 20
+    FLUSH_INTERVAL      = 0.5
+    CSV_HEADER          = ( 'port' , 'time' , 'path' , 'types' , 'args' , )
+    DELIMITERS          = {
+            'csv'   : ','   ,
+            'tsv'   : '\t'  ,
+            }
+
+    def __init__(
+            self            ,
+            outputFormat    ,
+            ):
+        if outputFormat not in self.DELIMITERS and outputFormat != 'jsonl':
+            raise ValueError( 'unknown output format ' + str( outputFormat ) )
+
+        self.outputFile = open(
+                stdout.fileno()                             ,
+                'w'                                         ,
+                buffering   = self.OUTPUT_BUFFER_SIZE       ,
+                closefd     = False                         ,
+                newline     = ''                            ,
+                )
+
+        # JSON Lines, and the args column of CSV and TSV
+        from json import JSONEncoder
+        self.encode = JSONEncoder(
+                separators  = ( ',' , ':' ) ,
+                default     = self.encodeArg ,
+                allow_nan   = False         ,
+                ).encode
+
+        if outputFormat == 'jsonl':
+            self.write = self.writeJson
+        else:
+            from csv import writer as csvWriter
+            delimiter = self.DELIMITERS[ outputFormat ]
+            self.writeRow = csvWriter(
+                    self.outputFile             ,
+                    delimiter       = delimiter ,
+                    lineterminator  = '\n'      ,
+                    ).writerow
+            self.writeRow( self.CSV_HEADER )
+            self.write = self.writeCsv
+
+    def encodeArg(
+            self    ,
+            arg     ,
+            ):
+        """ Encode arguments JSON can not ( blobs as hex , anything else as a string ). """
+        if isinstance( arg , ( bytes , bytearray ) ):
+            return arg.hex()
+        return str( arg )
+
+    def finiteArg(
+            self    ,
+            arg     ,
+            ):
+        """ Replace inf and NaN floats, which JSON can not encode, with strings. """
+        if isinstance( arg , float ) and not isfinite( arg ):
+            return str( arg )
+        if isinstance( arg , ( list , tuple ) ):
+            return [ self.finiteArg( item ) for item in arg ]
+        return arg
+
+    def writeJson(
+            self    ,
+            port    ,
+            path    ,
+            types   ,
+            args    ,
+            ):
+        record = {
+                'port'  : port      ,
+                'time'  : time()    ,
+                'path'  : path      ,
+                'types' : types     ,
+                'args'  : args      ,
+                }
+        try:
+            line = self.encode( record )
+        except ValueError:
+            record[ 'args' ]    = self.finiteArg( args )
+            line                = self.encode( record )
+        self.outputFile.write( line + '\n' )
+
+    def writeCsv(
+            self    ,
+            port    ,
+            path    ,
+            types   ,
+            args    ,
+            ):
+        # Every argument in one column, as a JSON array
+        try:
+            encodedArgs = self.encode( args )
+        except ValueError:
+            encodedArgs = self.encode( self.finiteArg( args ) )
+        self.writeRow( [ port , time() , path , types , encodedArgs ] )
+
+    def flush( self ):
+        self.outputFile.flush()
+
+
+class Dashboard:
+    """
+        Live curses dashboard of message rates, last values, and jitter.
+
+        Incoming messages only update counters, and the screen is drawn
+        from the counters at a fixed frame rate by listenLoop.
+    """
+    FRAME_RATE          = 4.0
+    TOP_TALKERS         = 5
+    JITTER_GAIN         = 1.0 / 16.0
+    MILLISECONDS        = 1000.0
+    QUIT_KEYS           = ( ord( 'q' ) , ord( 'Q' ) , )
+
+    # Indexes of the per path statistics list
+    COUNT_INDEX             = 0
+    FRAME_COUNT_INDEX       = 1
+    LAST_TIME_INDEX         = 2
+    LAST_INTERVAL_INDEX     = 3
+    JITTER_INDEX            = 4
+    LAST_ARGS_INDEX         = 5
+    RATE_INDEX              = 6
+
+    def __init__(
+            self                ,
+            frameRate   = None  ,
+            ):
+        self.frameInterval  = 1.0 / ( frameRate or self.FRAME_RATE )
+        self.pathStats      = {}
+        self.portCounts     = {}
+        self.portRates      = {}
+        self.talkerCounts   = {}
+        self.talkerRates    = {}
+        self.lastFrame      = monotonic()
+        self.screen         = None
+
+    def start( self ):
+        """ Take over the terminal. """
+        import curses
+        self.curses = curses
+        self.screen = curses.initscr()
+        curses.noecho()
+        curses.cbreak()
+        curses.curs_set( 0 )
+        self.screen.nodelay( True )
+
+    def stop( self ):
+        """ Give the terminal back. """
+        if self.screen:
+            self.curses.nocbreak()
+            self.curses.echo()
+            self.curses.endwin()
+            self.screen = None
+
+    def count(
+            self    ,
+            port    ,
+            path    ,
+            args    ,
+            src     ,
+            ):
+        """ Update the counters for one message. """
+        now     = monotonic()
+        stats   = self.pathStats.get( path )
+        if stats is None:
+            self.pathStats[ path ] = [ 1 , 0 , now , 0.0 , 0.0 , args , 0.0 , ]
+        else:
+            # Inter arrival jitter, smoothed as in RFC 3550
+            interval = now - stats[ self.LAST_TIME_INDEX ]
+            stats[ self.JITTER_INDEX ] += (
+                    abs( interval - stats[ self.LAST_INTERVAL_INDEX ] ) - stats[ self.JITTER_INDEX ]
+                    ) * self.JITTER_GAIN
+            stats[ self.LAST_INTERVAL_INDEX ]   = interval
+            stats[ self.LAST_TIME_INDEX ]       = now
+            stats[ self.LAST_ARGS_INDEX ]       = args
+            stats[ self.COUNT_INDEX ]          += 1
+
+        self.portCounts[ port ] = self.portCounts.get( port , 0 ) + 1
+        talker = src.url
+        self.talkerCounts[ talker ] = self.talkerCounts.get( talker , 0 ) + 1
+
+    def updateRates(
+            self        ,
+            frameTime   ,
+            ):
+        """ Turn the counts since the last frame into rates. """
+        for stats in self.pathStats.values():
+            stats[ self.RATE_INDEX ] = ( stats[ self.COUNT_INDEX ] - stats[ self.FRAME_COUNT_INDEX ] ) / frameTime
+            stats[ self.FRAME_COUNT_INDEX ] = stats[ self.COUNT_INDEX ]
+        self.portRates      = dict(
+                ( port , count / frameTime ) for port , count in self.portCounts.items()
+                )
+        self.talkerRates    = dict(
+                ( talker , count / frameTime ) for talker , count in self.talkerCounts.items()
+                )
+        self.portCounts     = dict.fromkeys( self.portCounts , 0 )
+        self.talkerCounts   = {}
+
+    def addLine(
+            self    ,
+            row     ,
+            text    ,
+            ):
+        """ Add a line to the screen, ignoring anything past the bottom or right edge. """
+        height , width = self.screen.getmaxyx()
+        if row < height:
+            try:
+                self.screen.addnstr( row , 0 , text , width - 1 )
+            except self.curses.error:
+                pass
+        return row + 1
+
+    def draw( self ):
+        """ Draw one frame from the counters. """
+        if not self.screen:
+            return
+
+        # Quit from the keyboard
+        if self.screen.getch() in self.QUIT_KEYS:
+            exit()
+
+        now             = monotonic()
+        frameTime       = max( now - self.lastFrame , 1e-6 )
+        self.lastFrame  = now
+        self.updateRates( frameTime )
+
+        height , width = self.screen.getmaxyx()
+        self.screen.erase()
+
+        row = self.addLine(
+                0                                                                               ,
+                'OSC Listen  '                                                                  +
+                str( round( sum( self.portRates.values() ) ) )                                  +
+                ' msg/s  '                                                                      +
+                str( len( self.pathStats ) )                                                    +
+                ' paths  (q to quit)'                                                           ,
+                )
+
+        # Ports
+        row = self.addLine( row + 1 , '{:>8} {:>10}'.format( 'PORT' , 'MSG/S' ) )
+        for port in sorted( self.portRates ):
+            row = self.addLine( row , '{:>8} {:>10.1f}'.format( port , self.portRates[ port ] ) )
+
+        # Top talkers
+        row = self.addLine( row + 1 , '{:<32} {:>10}'.format( 'TALKER' , 'MSG/S' ) )
+        topTalkers = sorted(
+                self.talkerRates.items()                ,
+                key     = lambda talker : talker[ 1 ]   ,
+                reverse = True                          ,
+                )[ : self.TOP_TALKERS ]
+        for talker , rate in topTalkers:
+            row = self.addLine( row , '{:<32} {:>10.1f}'.format( talker , rate ) )
+
+        # Paths, busiest first, for as many rows as the screen has left
+        row = self.addLine(
+                row + 1                                                                         ,
+                '{:<40} {:>10} {:>12}  {}'.format( 'PATH' , 'MSG/S' , 'JITTER ms' , 'LAST' )    ,
+                )
+        paths = sorted(
+                self.pathStats.items()                                  ,
+                key     = lambda pathStat : pathStat[ 1 ][ self.RATE_INDEX ] ,
+                reverse = True                                          ,
+                )[ : max( height - row , 0 ) ]
+        for path , stats in paths:
+            row = self.addLine(
+                    row                                                 ,
+                    '{:<40} {:>10.1f} {:>12.3f}  {}'.format(
+                        path                                            ,
+                        stats[ self.RATE_INDEX ]                        ,
+                        stats[ self.JITTER_INDEX ] * self.MILLISECONDS  ,
+                        stats[ self.LAST_ARGS_INDEX ]                   ,
+                        )                                               ,
+                    )
+
+        self.screen.refresh()
+
+
+class PathFilter:
+    """
+        Include and exclude filters for incoming message paths.
+
+        Filters are path prefixes ( /ardour ) or OSC address patterns ( /*/fader[0-9] ).
+        Prefixes are compiled into a segment trie, and patterns into one regular
+        expression per filter group.  The decision for each path is cached, so a
+        repeated path costs one dictionary lookup and a hit count.
+    """
+    PATTERN_SYMBOLS     = '*?[]{}'
+    DECISION_CACHE_SIZE = 65536
+    TRIE_END            = None
+
+    def __init__(
+            self                ,
+            includePaths        ,
+            excludePaths        ,
+            ):
+        # Every filter gets a hit counter, and so do the two default decisions
+        self.names          = list( includePaths ) + list( excludePaths ) + [ '(no include matched)' , '(no filters)' ]
+        self.hits           = [ 0 ] * len( self.names )
+        self.noIncludeIndex = len( self.names ) - 2
+        self.noFilterIndex  = len( self.names ) - 1
+        self.accepted       = tuple(
+                index < len( includePaths ) or index == self.noFilterIndex for index in range( len( self.names ) )
+                )
+
+        self.includes       = self.compileGroup( includePaths , 0 )
+        self.excludes       = self.compileGroup( excludePaths , len( includePaths ) )
+        self.decisions      = {}
+
+    def patternRegex(
+            self    ,
+            pattern ,
+            ):
+        """ Translate an OSC address pattern into a regular expression. """
+        from re import escape
+        regex       = ''
+        inBrackets  = False
+        inBraces    = False
+        for character in pattern:
+            if inBrackets:
+                if character == ']':
+                    inBrackets = False
+                    regex += ']'
+                elif character == '!' and regex.endswith( '[' ):
+                    regex += '^'
+                else:
+                    regex += character if character == '-' else escape( character )
+            elif character == '*':
+                regex += '[^/]*'
+            elif character == '?':
+                regex += '[^/]'
+            elif character == '[':
+                inBrackets = True
+                regex += '['
+            elif character == '{':
+                inBraces = True
+                regex += '(?:'
+            elif character == '}' and inBraces:
+                inBraces = False
+                regex += ')'
+            elif character == ',' and inBraces:
+                regex += '|'
+            else:
+                regex += escape( character )
+        return regex
+
+    def compileGroup(
+            self        ,
+            paths       ,
+            firstIndex  ,
+            ):
+        """ Compile a group of filters into a ( prefix trie , pattern regex ) pair. """
+        trie        = {}
+        patterns    = []
+        for filterIndex , path in enumerate( paths , firstIndex ):
+            if any( symbol in path for symbol in self.PATTERN_SYMBOLS ):
+                patterns.append(
+                        '(?P<f' + str( filterIndex ) + '>' + self.patternRegex( path ) + ')'
+                        )
+            else:
+                node = trie
+                for segment in path.strip( '/' ).split( '/' ):
+                    node = node.setdefault( segment , {} )
+                node.setdefault( self.TRIE_END , filterIndex )
+
+        if patterns:
+            from re import compile as compileRegex
+            regex = compileRegex( '(?:' + '|'.join( patterns ) + ')$' )
+        else:
+            regex = None
+        return ( trie , regex , )
+
+    def match(
+            self    ,
+            group   ,
+            path    ,
+            ):
+        """ Return the index of the first filter in a group matching path, or None. """
+        trie , regex = group
+        node = trie
+        for segment in path[ 1: ].split( '/' ):
+            if self.TRIE_END in node:
+                return node[ self.TRIE_END ]
+            node = node.get( segment )
+            if node is None:
+                break
+        else:
+            if self.TRIE_END in node:
+                return node[ self.TRIE_END ]
+
+        if regex:
+            regexMatch = regex.match( path )
+            if regexMatch:
+                return int( regexMatch.lastgroup[ 1: ] )
+        return None
+
+    def decide(
+            self    ,
+            path    ,
+            ):
+        """ Return the index of the filter that decides whether path is shown. """
+        includeTrie , includeRegex = self.includes
+        if includeTrie or includeRegex:
+            decision = self.match( self.includes , path )
+            if decision is None:
+                return self.noIncludeIndex
+        else:
+            decision = self.noFilterIndex
+
+        excluded = self.match( self.excludes , path )
+        if excluded is not None:
+            return excluded
+        return decision
+
+    def accept(
+            self    ,
+            path    ,
+            ):
+        """ Count a path against its deciding filter, and return True if it is shown. """
+        decision = self.decisions.get( path )
+        if decision is None:
+            if len( self.decisions ) >= self.DECISION_CACHE_SIZE:
+                self.decisions.clear()
+            decision = self.decisions[ path ] = self.decide( path )
+        self.hits[ decision ] += 1
+        return self.accepted[ decision ]
+
+
+class PortContext:
+    """ Per port data passed to the shared OSC Listen methods as liblo user data. """
+    __slots__ = ( 'port' , 'label' , 'output' , 'pathFilter' , )
+
+    def __init__(
+            self                ,
+            port                ,
+            output      = None  ,
+            pathFilter  = None  ,
+            ):
+        self.port       = port
+        self.label      = str( port ) + ': '
+        self.output     = output
+        self.pathFilter = pathFilter
+
+
+def exitMessage(
+        path    ,
+        args    ,
+        types   ,
+        src     ,
+        context ,
+        ):
+    """ Exit on /osclisten/exit 1, anything else is echoed like any other message. """
+    try:
+        if int( args[ EXIT_ARG_INDEX ] ) == EXIT_ARG_VALUE:
+            exit()
+    except ( IndexError , TypeError , ValueError ):
+        pass
+    return PASS_TO_NEXT_METHOD
+
+
+def filterMessage(
+        path    ,
+        args    ,
+        types   ,
+        src     ,
+        context ,
+        ):
+    """ Stop rejected paths here, before the message is displayed or counted. """
+    if context.pathFilter.accept( path ):
+        return PASS_TO_NEXT_METHOD
+    return MESSAGE_HANDLED
+
+
+def echoMessage(
+        path    ,
+        args    ,
+        types   ,
+        src     ,
+        context ,
+        ):
+    """ Echo an incoming message, prefixed by the port it arrived on. """
+    print( context.label + path , args )
+
+
+def writeMessage(
+        path    ,
+        args    ,
+        types   ,
+        src     ,
+        context ,
+        ):
+    """ Write an incoming message to the structured output. """
+    context.output.write( context.port , path , types , args )
+
+
+def countMessage(
+        path    ,
+        args    ,
+        types   ,
+        src     ,
+        context ,
+        ):
+    """ Count an incoming message for the dashboard. """
+    context.output.count( context.port , path , args , src )
+
+
+# Register the shared methods on each OSC server
+def buildOSCServers(
+        listenPorts         ,
+        output      = None  ,
+        pathFilter  = None  ,
+        ):
+    if isinstance( output , Dashboard ):
+        messageMethod = countMessage
+    elif output:
+        messageMethod = writeMessage
+    else:
+        messageMethod = echoMessage
+
+    for oscServer , port in zip( oscListenServers , listenPorts ):
+        context = PortContext( port , output , pathFilter )
+
+        # The exit command is only checked for its own path, ahead of the echo method
+        oscServer.add_method(
+                EXIT_COMMAND_PATH   ,
+                None                ,
+                exitMessage         ,
+                context             ,
+                )
+
+        # Filters run ahead of the echo method, and stop rejected messages
+        if pathFilter:
+            oscServer.add_method(
+                    None                ,
+                    None                ,
+                    filterMessage       ,
+                    context             ,
+                    )
+        oscServer.add_method(
+                None                ,
+                None                ,
+                messageMethod       ,
+                context             ,
+                )
+    return
+
+
+# Wait on every listen port at once
+def listenLoop( periodicTasks = () ):
+    """
+        Sleep until any listen port has data, then drain each ready port.
+
+        periodicTasks is a list of ( interval , function ) pairs, each function
+        is called every interval seconds, and once more when the loop ends.
+    """
+    TASK_INTERVAL_INDEX = 0
+    TASK_FUNCTION_INDEX = 1
+
+    selector = DefaultSelector()
+    for oscServer in oscListenServers:
+        selector.register(
+                oscServer.fileno()  ,
+                EVENT_READ          ,
+                oscServer           ,
+                )
+
+    # Next due time of each periodic task
+    now         = monotonic()
+    tasksDue    = [ now + task[ TASK_INTERVAL_INDEX ] for task in periodicTasks ]
+
+    try:
+        while exitCall == False:
+            if tasksDue:
+                timeout = max( min( tasksDue ) - monotonic() , 0 )
+            else:
+                timeout = None
+
+            for key , events in selector.select( timeout ):
+                # Drain the ready port, up to MAX_DRAIN_MESSAGES so one busy port can not starve the others
+                for drained in range( MAX_DRAIN_MESSAGES ):
+                    if not key.data.recv( 0 ):
+                        break
+
+            # Run periodic tasks that are due
+            now = monotonic()
+            for taskIndex , task in enumerate( periodicTasks ):
+                if now >= tasksDue[ taskIndex ]:
+                    task[ TASK_FUNCTION_INDEX ]()
+                    tasksDue[ taskIndex ] = now + task[ TASK_INTERVAL_INDEX ]
+    finally:
+        for task in periodicTasks:
+            task[ TASK_FUNCTION_INDEX ]()
+        selector.close()
+    return
+
+
+def displayFilterHits(
+        pathFilter          ,
+        outFile = stderr    ,
+        ):
+    """ Display how many messages each path filter decided. """
+    print( file = outFile )
+    for name , hits in zip( pathFilter.names , pathFilter.hits ):
+        if hits:
+            print(
+                    'Path filter ' + name + ': ' + str( hits )  ,
+                    file = outFile                              ,
+                    )
+    return
+
+
+def displayMOTD(
+        motd                ,
+        outFile = stdout    ,
+        ):
     # MOTD variables
     # Set this in config, and maybe on the fly with an argument
-    print( motd )
-    print()
+    print( motd , file = outFile )
+    print( file = outFile )
     return
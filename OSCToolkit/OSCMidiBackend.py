@@ -0,0 +1,305 @@
+#!/usr/bin/python3
+"""
+OSC Midi Backend
+    OSCMidiBackend.py
+
+    Written by: Shane Hutter
+
+    Required Dependencies:  python >= 3.5, mido and rtmidi ( MidoBackend only )
+
+      The OSC Midi Backend module contains the MIDI backends used by OSC Midi
+      Client and OSC Midi Server.
+
+      A backend opens MIDI inputs, which call a callback with the bytes of each
+      MIDI message, and MIDI outputs, which write the bytes of a MIDI message.
+          MidoBackend       virtual ports and devices through mido and rtmidi
+          LoopbackBackend   in memory ports, an output delivers to every input
+                            of the same name, after a simulated delay
+
+      The loopback backend needs no MIDI hardware or MIDI system, so the MIDI
+      paths can be exercised and benchmarked on any machine.
+
+      OSC Midi Backend is a part of osctoolkit
+
+      osctoolkit is free software; you can redistribute it and/or modify
+      it under the terms of the GNU Lesser General Public License as published
+      by the Free Software Foundation, either version 3 of the License, or
+      (at your option) any later version.
+
+      osctoolkit is distributed in the hope that it will be useful,
+      but WITHOUT ANY WARRANTY; without even the implied warranty of
+      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+      GNU Lesser General Public License for more details.
+
+      You should have received a copy of the GNU Lesser General Public License
+      along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Import modules
+#   mido is imported where it is used
+from .          import *
+from heapq      import heappush, heappop
+from itertools  import count
+from threading  import Thread, Condition
+from time       import perf_counter
+
+
+# MIDI 1.0 wire speed, 31250 baud with 10 bits per byte
+MIDI_WIRE_BYTE_RATE = 3125.0
+
+
+
+class MidoBackend:
+    """ Virtual MIDI ports and MIDI devices, through mido. """
+
+    def openInput(
+            self                    ,
+            portName                ,
+            callback                ,
+            virtual     = False     ,
+            ):
+        """ Open an input, callback is called with the bytes of each MIDI message. """
+        from mido import open_input
+        return open_input(
+                portName                                                        ,
+                virtual     = virtual                                           ,
+                callback    = lambda midiMessage : callback( midiMessage.bytes() ) ,
+                )
+
+    def openOutput(
+            self                    ,
+            portName                ,
+            virtual     = False     ,
+            ):
+        return MidoOutput( portName , virtual )
+
+    def inputNames( self ):
+        from mido import get_input_names
+        return get_input_names()
+
+    def outputNames( self ):
+        from mido import get_output_names
+        return get_output_names()
+
+
+
+class SysexBuffer:
+    """
+        SysEx for outputs that send whole MIDI messages.  The chunks of a SysEx
+        are collected, and written as one message when the last one arrives.
+    """
+
+    def writeSysex(
+            self    ,
+            chunk   ,
+            last    ,
+            ):
+        self.sysexBuffer += chunk
+        if last:
+            self.write( bytes( self.sysexBuffer ) )
+            del self.sysexBuffer[ : ]
+
+    def abortSysex( self ):
+        del self.sysexBuffer[ : ]
+
+
+
+class MidoOutput( SysexBuffer ):
+    """
+        A virtual MIDI port or MIDI device, written through mido.
+
+        With mido's rtmidi backend, the MIDI bytes are written straight to the
+        port's rtmidi output, as mido itself does after turning a message back
+        into bytes, so nothing is parsed.  Other mido backends only take
+        mido messages, so the bytes are parsed into one.
+    """
+
+    def __init__(
+            self                    ,
+            portName                ,
+            virtual     = False     ,
+            ):
+        from mido import open_output, Message
+        self.sysexBuffer    = bytearray()
+        self.midiPort       = open_output(
+                portName            ,
+                virtual = virtual   ,
+                )
+        rtmidiOutput = getattr( self.midiPort , '_rt' , None )
+        if rtmidiOutput is not None:
+            self.write = self.writeRtmidi
+            self.sendMessage = rtmidiOutput.send_message
+        else:
+            self.fromBytes = Message.from_bytes
+
+    def write(
+            self                ,
+            midiBytes           ,
+            dataBytes   = None  ,
+            ):
+        self.midiPort.send( self.fromBytes( midiBytes ) )
+
+    def writeRtmidi(
+            self                ,
+            midiBytes           ,
+            dataBytes   = None  ,
+            ):
+        self.sendMessage( midiBytes )
+
+    def close( self ):
+        self.midiPort.close()
+
+
+
+class LoopbackBackend:
+    """
+        In memory MIDI ports.
+
+        Writing to an output delivers a copy of the message to every open input
+        of the same name, from the backend's own delivery thread, like a MIDI
+        system would.  Delivery is delayed by latency seconds, plus the time the
+        message takes on a MIDI wire when wireByteRate is set ( MIDI_WIRE_BYTE_RATE ),
+        with messages on one output queueing behind each other as on a cable.
+    """
+
+    # Sleep until a delivery is this close, then spin
+    SPIN_THRESHOLD = 0.0002
+
+    def __init__(
+            self                        ,
+            latency         = 0.0       ,
+            wireByteRate    = None      ,
+            ):
+        self.latency        = latency
+        self.wireByteRate   = wireByteRate
+        self.inputs         = {}
+
+        # Deliveries waiting ( due time , sequence , port name , MIDI bytes )
+        self.deliveries     = []
+        self.sequence       = count()
+        self.condition      = Condition()
+        self.running        = True
+        self.deliveryThread = Thread(
+                target  = self.deliver          ,
+                name    = 'oscmidi-loopback'    ,
+                daemon  = True                  ,
+                )
+        self.deliveryThread.start()
+
+    def openInput(
+            self                    ,
+            portName                ,
+            callback                ,
+            virtual     = False     ,
+            ):
+        return LoopbackInput( self , portName , callback )
+
+    def openOutput(
+            self                    ,
+            portName                ,
+            virtual     = False     ,
+            ):
+        return LoopbackOutput( self , portName )
+
+    def inputNames( self ):
+        return sorted( self.inputs )
+
+    def outputNames( self ):
+        return sorted( self.inputs )
+
+    def schedule(
+            self        ,
+            portName    ,
+            midiBytes   ,
+            dueTime     ,
+            ):
+        with self.condition:
+            heappush(
+                    self.deliveries                                             ,
+                    ( dueTime , next( self.sequence ) , portName , midiBytes )  ,
+                    )
+            self.condition.notify()
+
+    def deliver( self ):
+        """ Delivery thread, call the input callbacks as each message comes due. """
+        deliveries = self.deliveries
+        while self.running:
+            with self.condition:
+                while self.running and not deliveries:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                wait = deliveries[ 0 ][ 0 ] - perf_counter()
+                if wait > self.SPIN_THRESHOLD:
+                    self.condition.wait( wait - self.SPIN_THRESHOLD )
+                    continue
+                if wait > 0:
+                    continue
+                dueTime , sequence , portName , midiBytes = heappop( deliveries )
+
+            for callback in self.inputs.get( portName , () ):
+                callback( midiBytes )
+
+    def close( self ):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.deliveryThread.join()
+
+
+
+class LoopbackInput:
+    """ An in memory MIDI input. """
+
+    def __init__(
+            self        ,
+            backend     ,
+            portName    ,
+            callback    ,
+            ):
+        self.backend    = backend
+        self.portName   = portName
+        self.callback   = callback
+        backend.inputs.setdefault( portName , [] ).append( callback )
+
+    def close( self ):
+        callbacks = self.backend.inputs.get( self.portName , [] )
+        if self.callback in callbacks:
+            callbacks.remove( self.callback )
+
+
+
+class LoopbackOutput( SysexBuffer ):
+    """ An in memory MIDI output, with the timing of a MIDI cable when the backend has a wire rate. """
+
+    def __init__(
+            self        ,
+            backend     ,
+            portName    ,
+            ):
+        self.backend        = backend
+        self.portName       = portName
+        self.wireFree       = 0.0
+        self.sysexBuffer    = bytearray()
+
+    def write(
+            self                ,
+            midiBytes           ,
+            dataBytes   = None  ,
+            ):
+        backend = self.backend
+        now     = perf_counter()
+        if backend.wireByteRate:
+            # Messages queue behind each other on the wire
+            self.wireFree = max( now , self.wireFree ) + len( midiBytes ) / backend.wireByteRate
+            dueTime = self.wireFree + backend.latency
+        else:
+            dueTime = now + backend.latency
+        backend.schedule(
+                self.portName               ,
+                bytes( midiBytes )          ,
+                dueTime                     ,
+                )
+
+    def close( self ):
+        return
@@ -27,12 +27,60 @@ OSC Midi Client
 """
 
 # Import Modules
+#   mido and argparse are imported where they are used
 from .          import *
-from argparse   import ArgumentParser
-from liblo      import Address, AddressError, send
-from mido       import open_input, open_output, Parser
-from sys        import exit
+from .OSCShout  import MessageTemplate, createOSCSocket, parseTarget, encodeBundle, OSC_ALIGNMENT
+from .OSCMidiBackend    import MidoBackend
+from sys        import exit, stderr
 from os.path    import isfile
+from collections    import deque
+from threading      import Thread, Event
+from time           import perf_counter
+from itertools      import count
+from struct         import Struct
+
+
+## MIDI to OSC translation
+# OSC paths are /oscmidi/( port name )/( midi channel number )/( event )
+OSC_MIDI_PATH_PREFIX    = '/oscmidi'
+
+# MIDI channel messages, by status byte without the channel
+CHANNEL_STATUS_FIRST    = 0x80
+CHANNEL_STATUS_LAST     = 0xEF
+STATUS_MASK             = 0xF0
+CHANNEL_MASK            = 0x0F
+MIDI_CHANNELS           = 16
+PITCHWHEEL_STATUS       = 0xE0
+PITCHWHEEL_CENTER       = 8192
+CONTROL_CHANGE_STATUS   = 0xB0
+MIDI_CONTROLLERS        = 128
+
+# Controllers whose order matters, never thinned:
+#   bank select , data entry , pedals and legato , data increment and RPN / NRPN select
+ORDERED_CONTROLLERS     = frozenset(
+        ( 0 , 32 , 6 , 38 , ) + tuple( range( 64 , 70 ) ) + tuple( range( 96 , 102 ) )
+        )
+DATA_BITS               = 7
+MIDI_EVENTS = {
+        0x80    : ( 'note_off'          , 'ii'  , )   ,
+        0x90    : ( 'note_on'           , 'ii'  , )   ,
+        0xA0    : ( 'polytouch'         , 'ii'  , )   ,
+        0xB0    : ( 'control_change'    , 'ii'  , )   ,
+        0xC0    : ( 'program_change'    , 'i'   , )   ,
+        0xD0    : ( 'aftertouch'        , 'i'   , )   ,
+        0xE0    : ( 'pitchwheel'        , 'i'   , )   ,
+        }
+
+# SysEx is sent as /oscmidi/( port name )/sysex messages, one chunk each, with
+#   transfer id , chunk sequence , SysEx length , blob
+SYSEX_STATUS            = 0xF0
+SYSEX_EVENT             = 'sysex'
+SYSEX_TYPE_TAGS         = 'iiib'
+SYSEX_CHUNK_SIZE        = 1024
+SYSEX_CHUNK_HEADER      = Struct( '>iiii' )
+
+# Characters kept from a MIDI port name in its OSC path element
+OSC_NAME_SYMBOLS        = '_.-'
 
 
 
@@ -91,6 +139,10 @@ class ConfigFile:
         # OSC Port settings
         self.oscServerListenPort        = 9010
         self.oscServerCommandPort       = 9011
+        self.oscTarget                  = '127.0.0.1:9000'
+        self.bundleEvents               = False
+        self.eventQueueSize             = 4096
+        self.ccRate                     = 0.0
 
         # Midi ports and devices
         self.midiVirtualPorts           = []
@@ -188,6 +240,26 @@ class ConfigFile:
 
 
 
+                if lineData[ self.CONFIG_PROPERTY_INDEX ] == self.CONFIG_PROPERTY_PREFIX + '.osc_target':
+                    self.oscTarget = lineData[ self.CONFIG_VALUE_INDEX ]
+
+                if lineData[ self.CONFIG_PROPERTY_INDEX ] == self.CONFIG_PROPERTY_PREFIX + '.bundle_events':
+                    self.bundleEvents = bool(
+                            int(
+                                lineData[ self.CONFIG_VALUE_INDEX ]
+                                )
+                            )
+
+                if lineData[ self.CONFIG_PROPERTY_INDEX ] == self.CONFIG_PROPERTY_PREFIX + '.event_queue_size':
+                    self.eventQueueSize = int(
+                            lineData[ self.CONFIG_VALUE_INDEX ]
+                            )
+
+                if lineData[ self.CONFIG_PROPERTY_INDEX ] == self.CONFIG_PROPERTY_PREFIX + '.cc_rate':
+                    self.ccRate = float(
+                            lineData[ self.CONFIG_VALUE_INDEX ]
+                            )
+
                 # MIDI Settings
                 if lineData[ self.CONFIG_PROPERTY_INDEX ] == self.CONFIG_PROPERTY_PREFIX + '.midi_virtual_ports':
                     for data in enumerate( lineData ):
@@ -217,13 +289,501 @@ class ConfigFile:
                 'verboseMidiData'           : self.verboseMidiData          ,
                 'oscServerListenPort'       : self.oscServerListenPort      ,
                 'oscSeverCommandPort'       : self.oscServerCommandPort     ,
+                'oscTarget'                 : self.oscTarget                ,
+                'bundleEvents'              : self.bundleEvents             ,
+                'eventQueueSize'            : self.eventQueueSize           ,
+                'ccRate'                    : self.ccRate                   ,
                 'midiVirtualPorts'          : self.midiVirtualPorts         ,
                 'midiDevices'               : self.midiDevices              ,
                 }
 
 
 
-#class ParseArgs:
-#    """Parse command line arguments for OSC Midi Client"""
+class ParseArgs:
+    """Parse command line arguments for OSC Midi Client"""
+
+    def __init__(
+            self        ,
+            configData  ,
+            ):
+        self.configData = configData
+
+        # Run initialization functions
+        self.argData = self.parse()
+
+    def parse( self ):
+        from argparse import ArgumentParser
+        parser = ArgumentParser(
+                description = 'Send MIDI events from virtual MIDI ports and MIDI devices as OSC messages.' ,
+                )
+
+        parser.add_argument(
+                '-l'                                                ,
+                '--list'                                            ,
+                action  = 'store_true'                              ,
+                help    = 'List MIDI input device names and exit.'  ,
+                )
+
+        parser.add_argument(
+                '-d'                                                ,
+                '--device'                                          ,
+                dest    = 'midiDevices'                             ,
+                action  = 'append'                                  ,
+                default = []                                        ,
+                metavar = 'NAME'                                    ,
+                help    = 'Listen to a MIDI device.'                ,
+                )
+
+        parser.add_argument(
+                '-p'                                                ,
+                '--virtual-port'                                    ,
+                dest    = 'midiVirtualPorts'                        ,
+                action  = 'append'                                  ,
+                default = []                                        ,
+                metavar = 'NAME'                                    ,
+                help    = 'Create a virtual MIDI port, sent as /oscmidi/NAME/CHANNEL/EVENT.' ,
+                )
+
+        parser.add_argument(
+                '-t'                                                ,
+                '--target'                                          ,
+                metavar = 'IP:PORT'                                 ,
+                help    = 'OSC target for the translated MIDI events.' ,
+                )
+
+        parser.add_argument(
+                '-b'                                                ,
+                '--bundle'                                          ,
+                action  = 'store_true'                              ,
+                help    = 'Send MIDI events that arrive together as one OSC bundle.' ,
+                )
+
+        parser.add_argument(
+                '-c'                                                ,
+                '--cc-rate'                                         ,
+                type    = float                                     ,
+                metavar = 'HZ'                                      ,
+                help    = 'Send each controller at most HZ times per second, with its latest value ( 0 sends every controller event ).' ,
+                )
+
+        args = parser.parse_args()
+        oscTarget = args.target or self.configData[ 'oscTarget' ]
+        try:
+            oscTargetIp , oscTargetPort , oscTargetPath = parseTarget( oscTarget )
+        except ( IndexError , ValueError ):
+            parser.error( 'invalid OSC target ' + oscTarget )
+
+        return {
+                'listMidiDevices'   : args.list                                                 ,
+                'midiDevices'       : self.configData[ 'midiDevices' ] + args.midiDevices           ,
+                'midiVirtualPorts'  : self.configData[ 'midiVirtualPorts' ] + args.midiVirtualPorts ,
+                'oscTargetIp'       : oscTargetIp                                               ,
+                'oscTargetPort'     : oscTargetPort                                             ,
+                'bundleEvents'      : args.bundle or self.configData[ 'bundleEvents' ]              ,
+                'ccRate'            : self.configData[ 'ccRate' ] if args.cc_rate is None else args.cc_rate ,
+                }
+
+
+
+def oscPortName( portName ):
+    """ Return a MIDI port name as a single OSC path element. """
+    return ''.join(
+            character if character.isalnum() or character in OSC_NAME_SYMBOLS else '_'
+            for character in portName
+            ).strip( '_' ) or 'midi'
+
+
+def sysexPath( portName ):
+    """ Return the OSC path of SysEx chunks from a port. """
+    return '/'.join(
+            (
+                OSC_MIDI_PATH_PREFIX    ,
+                oscPortName( portName ) ,
+                SYSEX_EVENT             ,
+                )
+            )
+
+
+def midiEventPath(
+        portName    ,
+        channel     ,
+        event       ,
+        ):
+    """ Return the OSC path of a MIDI event, channels are numbered 1 to 16. """
+    return '/'.join(
+            (
+                OSC_MIDI_PATH_PREFIX    ,
+                oscPortName( portName ) ,
+                str( channel + 1 )      ,
+                event                   ,
+                )
+            )
+
+
+
+class PortQueue:
+    """ The bounded event queue of one MIDI port, with the path table of the port. """
+
+    def __init__(
+            self        ,
+            portName    ,
+            pathTable   ,
+            ccBase      ,
+            queueSize   ,
+            ):
+        self.portName       = portName
+        self.pathTable      = pathTable
+        self.ccBase         = ccBase
+        self.midiEvents     = deque( maxlen = queueSize )
+        self.droppedEvents  = 0
+
+        # Chunks of the SysEx being streamed, the port's later events wait for it
+        self.sysexStream    = None
+
+
+
+class MidiToOSC:
+    """
+        Translate MIDI events from named ports into OSC messages.
+
+        Every port gets a path table with one pre encoded message template per
+        channel status byte, built when the port is added.  Translating an
+        event is a table lookup on its status byte, packing the data bytes into
+        the template, and one send.
+
+        Ports are read with MIDI backend callbacks, mido by default, with
+        events arriving on backend threads rather than being polled.  The
+        callback of each port only appends to the port's own bounded queue, and
+        a single sender thread drains the queues round robin, one event from
+        each port in turn, so the events of each port stay in order and a busy
+        port can not starve the others.  With bundleEvents, the events waiting
+        in the queues together are sent as one OSC bundle.  When a port's queue
+        is full its oldest events are dropped, and counted for that port.
+
+        SysEx is streamed as SYSEX_CHUNK_SIZE blob chunks, sliced from the
+        message with memoryview and sent with scatter gather, so the SysEx is
+        never copied.  One chunk from every port streaming SysEx goes out
+        between drains of the queues, so a long dump does not hold up other
+        ports.  The later events of the streaming port wait in its queue until
+        the last chunk is sent, so they can not land inside the SysEx.
+
+        With ccRate, controller events are thinned to at most ccRate per second
+        for each port , channel , and controller.  The latest value of every
+        controller is kept in one fixed size list, MIDI_CHANNELS *
+        MIDI_CONTROLLERS slots per port, and the controllers that changed are
+        sent once per tick.  Notes and all other events are sent immediately,
+        after the controllers still waiting on their channel, so the order of
+        each channel is kept.  ORDERED_CONTROLLERS, such as bank select, data
+        entry, sustain, and RPN / NRPN, are never thinned.
+    """
+
+    QUEUE_SIZE          = 4096
+    MAX_BUNDLE_BYTES    = 1400
+
+    def __init__(
+            self                        ,
+            oscTargetIp                 ,
+            oscTargetPort               ,
+            bundleEvents    = False     ,
+            queueSize       = None      ,
+            midiBackend     = None      ,
+            ccRate          = None      ,
+            ):
+        self.oscSocket      = createOSCSocket( oscTargetIp , oscTargetPort )
+        self.midiBackend    = midiBackend or MidoBackend()
+        self.pathTables     = {}
+        self.midiPorts      = []
+        self.bundleEvents   = bundleEvents
+
+        # Controller thinning, latest ( path table , MIDI bytes ) of every
+        #   port , channel , and controller, or None when it has not changed,
+        #   and the controller slots that changed on every port and channel
+        self.ccInterval     = 1.0 / ccRate if ccRate else None
+        self.ccLatest       = []
+        self.ccChanged      = []
+
+        # Event queues of every port, drained round robin by the sender
+        self.queueSize      = queueSize or self.QUEUE_SIZE
+        self.portQueues     = []
+        self.eventsWaiting  = Event()
+        self.running        = False
+        self.sender         = None
+        self.transferIds    = count()
+
+    def buildPathTable( self , portName ):
+        """ Return a list, indexed by status byte - CHANNEL_STATUS_FIRST, of event encoders. """
+        pathTable = []
+        for status in range( CHANNEL_STATUS_FIRST , CHANNEL_STATUS_LAST + 1 ):
+            event , typeTags = MIDI_EVENTS[ status & STATUS_MASK ]
+            encode = MessageTemplate(
+                    midiEventPath( portName , status & CHANNEL_MASK , event )   ,
+                    typeTags                                                    ,
+                    ).encode
+
+            # Each encoder takes the MIDI bytes, and returns the encoded OSC message
+            if status & STATUS_MASK == PITCHWHEEL_STATUS:
+                def encoder( midiData , encode = encode ):
+                    return encode( ( ( midiData[ 2 ] << DATA_BITS | midiData[ 1 ] ) - PITCHWHEEL_CENTER , ) )
+            elif len( typeTags ) == 1:
+                def encoder( midiData , encode = encode ):
+                    return encode( ( midiData[ 1 ] , ) )
+            else:
+                def encoder( midiData , encode = encode ):
+                    return encode( ( midiData[ 1 ] , midiData[ 2 ] , ) )
+            pathTable.append( encoder )
+
+        # SysEx, at SYSEX_STATUS - CHANNEL_STATUS_FIRST, starts a chunk stream
+        sysexPrefix = MessageTemplate( sysexPath( portName ) , SYSEX_TYPE_TAGS ).prefix
+        pathTable.append(
+                lambda midiData , sysexPrefix = sysexPrefix : self.sysexChunks( sysexPrefix , midiData )
+                )
+        return pathTable
+
+    def sysexChunks(
+            self        ,
+            sysexPrefix ,
+            midiData    ,
+            ):
+        """ Yield the OSC message of each chunk of a SysEx message, as a list of buffers. """
+        if not isinstance( midiData , ( bytes , bytearray ) ):
+            midiData = bytes( midiData )
+        sysexData   = memoryview( midiData )
+        transferId  = next( self.transferIds )
+        for sequence , offset in enumerate( range( 0 , len( sysexData ) , SYSEX_CHUNK_SIZE ) ):
+            chunk = sysexData[ offset : offset + SYSEX_CHUNK_SIZE ]
+            yield [
+                    sysexPrefix                                                                 ,
+                    SYSEX_CHUNK_HEADER.pack( transferId , sequence , len( sysexData ) , len( chunk ) ) ,
+                    chunk                                                                       ,
+                    b'\0' * ( -len( chunk ) % OSC_ALIGNMENT )                                   ,
+                    ]
+
+    def addPort( self , portName ):
+        """ Build the path table and queue for a port, and return its callback for MIDI bytes. """
+        pathTable       = self.pathTables[ portName ] = self.buildPathTable( portName )
+        portQueue       = PortQueue(
+                portName                ,
+                pathTable               ,
+                len( self.ccLatest )    ,
+                self.queueSize          ,
+                )
+        midiEvents      = portQueue.midiEvents
+        eventsWaiting   = self.eventsWaiting
+        queueSize       = self.queueSize
+        if self.ccInterval:
+            self.ccLatest.extend( [ None ] * ( MIDI_CHANNELS * MIDI_CONTROLLERS ) )
+            self.ccChanged.extend( [] for channel in range( MIDI_CHANNELS ) )
+        self.portQueues.append( portQueue )
+
+        # Only this port's backend thread appends to its queue, and counts its drops
+        def midiCallback( midiData ):
+            if len( midiEvents ) >= queueSize:
+                portQueue.droppedEvents += 1
+            midiEvents.append( midiData )
+            eventsWaiting.set()
+        return midiCallback
+
+    def droppedEvents( self ):
+        """ Return the number of events dropped from the queues of every port. """
+        return sum( portQueue.droppedEvents for portQueue in self.portQueues )
+
+    def start( self ):
+        """ Start the sender thread. """
+        self.running    = True
+        self.sender     = Thread(
+                target  = self.sendEvents   ,
+                name    = 'oscmidi-sender'  ,
+                daemon  = True              ,
+                )
+        self.sender.start()
+
+    def stop( self ):
+        """ Send what is left in the queue, and stop the sender thread. """
+        self.running = False
+        self.eventsWaiting.set()
+        if self.sender:
+            self.sender.join()
+            self.sender = None
+
+    def sendEvents( self ):
+        """ Sender thread, drain the queues each time events are waiting. """
+        portQueues      = self.portQueues
+        eventsWaiting   = self.eventsWaiting
+        send            = self.oscSocket.send
+        sendBuffers     = self.oscSocket.sendmsg
+        bundle          = []
+        bundleBytes     = 0
+
+        # True while any port is streaming SysEx, so the sender does not wait
+        streaming       = False
+
+        # Channels with controllers waiting for the tick, in order of change
+        ccInterval      = self.ccInterval
+        ccLatest        = self.ccLatest
+        ccChanged       = self.ccChanged
+        ccChannels      = []
+        nextTick        = 0.0
+
+        def sendMessage( oscMessage ):
+            nonlocal bundle , bundleBytes
+            try:
+                if not self.bundleEvents:
+                    send( oscMessage )
+                    return
+
+                # Events that were waiting together go out together
+                if bundleBytes + len( oscMessage ) > self.MAX_BUNDLE_BYTES and bundle:
+                    send( encodeBundle( bundle ) )
+                    bundle , bundleBytes = [] , 0
+                bundle.append( bytes( oscMessage ) )
+                bundleBytes += len( oscMessage )
+            except OSError:
+                pass
+
+        def sendControllers( channelSlot ):
+            # Latest value of each controller that changed on a channel
+            for ccSlot in ccChanged[ channelSlot ]:
+                pathTable , midiData = ccLatest[ ccSlot ]
+                ccLatest[ ccSlot ] = None
+                sendMessage( pathTable[ midiData[ 0 ] - CHANNEL_STATUS_FIRST ]( midiData ) )
+            del ccChanged[ channelSlot ][ : ]
+
+        while self.running or streaming or ccChannels or any( portQueue.midiEvents for portQueue in portQueues ):
+            # Only wait for events when no SysEx is being streamed, and until
+            # the next tick when controllers are waiting for it
+            if streaming:
+                pass
+            elif ccChannels:
+                eventsWaiting.wait( max( nextTick - perf_counter() , 0.0 ) )
+            else:
+                eventsWaiting.wait()
+            # Clear before draining, so an event queued while draining sets it again
+            eventsWaiting.clear()
+
+            # One event from each port in turn, until every queue is empty or
+            # waits behind the SysEx its port is streaming
+            draining = True
+            while draining:
+                draining = False
+                for portQueue in portQueues:
+                    if not portQueue.midiEvents or portQueue.sysexStream:
+                        continue
+                    draining    = True
+                    pathTable   = portQueue.pathTable
+                    midiData    = portQueue.midiEvents.popleft()
+                    status      = midiData[ 0 ]
+                    if status == SYSEX_STATUS:
+                        # Controllers waiting on the port go out before the SysEx
+                        if ccInterval:
+                            channelBase = portQueue.ccBase // MIDI_CONTROLLERS
+                            for channelSlot in range( channelBase , channelBase + MIDI_CHANNELS ):
+                                sendControllers( channelSlot )
+                        portQueue.sysexStream = pathTable[ SYSEX_STATUS - CHANNEL_STATUS_FIRST ]( midiData )
+                        continue
+                    if not CHANNEL_STATUS_FIRST <= status <= CHANNEL_STATUS_LAST:
+                        continue
+                    if ccInterval:
+                        channelSlot = portQueue.ccBase // MIDI_CONTROLLERS + ( status & CHANNEL_MASK )
+                        if status & STATUS_MASK == CONTROL_CHANGE_STATUS and midiData[ 1 ] not in ORDERED_CONTROLLERS:
+                            ccSlot = channelSlot * MIDI_CONTROLLERS + midiData[ 1 ]
+                            if ccLatest[ ccSlot ] is None:
+                                if not ccChanged[ channelSlot ]:
+                                    ccChannels.append( channelSlot )
+                                ccChanged[ channelSlot ].append( ccSlot )
+                            ccLatest[ ccSlot ] = ( pathTable , midiData )
+                            continue
+
+                        # Any other event on the channel goes out after its waiting controllers
+                        if ccChanged[ channelSlot ]:
+                            sendControllers( channelSlot )
+                    sendMessage( pathTable[ status - CHANNEL_STATUS_FIRST ]( midiData ) )
+
+            # Latest value of each controller that changed, once per tick,
+            #   channels already sent before another event are empty by now
+            if ccChannels and perf_counter() >= nextTick:
+                for channelSlot in ccChannels:
+                    sendControllers( channelSlot )
+                del ccChannels[ : ]
+
+                # Next tick one interval on, or one interval from now after an idle tick
+                now         = perf_counter()
+                nextTick    = max( nextTick , now ) + ccInterval
+
+            if bundle:
+                try:
+                    send( encodeBundle( bundle ) if len( bundle ) > 1 else bundle[ 0 ] )
+                except OSError:
+                    pass
+                bundle , bundleBytes = [] , 0
+
+            # One chunk from every port streaming SysEx, a port's events are
+            # drained again once its last chunk is sent
+            streaming = False
+            for portQueue in portQueues:
+                if not portQueue.sysexStream:
+                    continue
+                streaming = True
+                try:
+                    sendBuffers( next( portQueue.sysexStream ) )
+                except StopIteration:
+                    portQueue.sysexStream = None
+                except OSError:
+                    pass
+
+    def openPorts(
+            self                ,
+            midiVirtualPorts    ,
+            midiDevices         ,
+            ):
+        """ Open every virtual port and device with a callback into the translator. """
+        if not self.sender:
+            self.start()
+        try:
+            for portName in midiVirtualPorts:
+                self.midiPorts.append(
+                        self.midiBackend.openInput(
+                            portName                        ,
+                            self.addPort( portName )        ,
+                            virtual     = True              ,
+                            )
+                        )
+            for portName in midiDevices:
+                self.midiPorts.append(
+                        self.midiBackend.openInput(
+                            portName                        ,
+                            self.addPort( portName )        ,
+                            )
+                        )
+        except ( OSError , IOError , ImportError ) as error:
+            self.close()
+            exit( error )
+
+    def close( self ):
+        for midiPort in self.midiPorts:
+            midiPort.close()
+        self.midiPorts = []
+        self.stop()
+        for portQueue in self.portQueues:
+            if portQueue.droppedEvents:
+                print( 'Dropped MIDI events from ' + portQueue.portName + ': ' + str( portQueue.droppedEvents ) , file = stderr )
+
+
+
+def listMidiDevices( midiBackend = None ):
+    """ Display the MIDI input device names. """
+    for deviceName in ( midiBackend or MidoBackend() ).inputNames():
+        print( deviceName )
+    return
+
+
+def displayMidiPorts(
+        midiVirtualPorts    ,
+        midiDevices         ,
+        ):
+    for portName in midiVirtualPorts:
+        print( 'Virtual MIDI port: ' + portName + ' -> ' + OSC_MIDI_PATH_PREFIX + '/' + oscPortName( portName ) )
+    for portName in midiDevices:
+        print( 'MIDI device: ' + portName + ' -> ' + OSC_MIDI_PATH_PREFIX + '/' + oscPortName( portName ) )
+    return
 
 
@@ -27,9 +27,457 @@ OSC Midi Server
 """
 
 # Import modules
-from .          import *
-from argparse   import ArgumentParser
-from liblo      import Server, ServerError
-from mido       import open_input, open_output, Parser
-from sys        import exit
-from os.path    import isfile
+#   liblo, mido, and argparse are imported where they are used
+from .              import *
+from .OSCMidiClient import (
+        MIDI_EVENTS         , MIDI_CHANNELS     , PITCHWHEEL_STATUS , PITCHWHEEL_CENTER ,
+        DATA_BITS           , OSC_MIDI_PATH_PREFIX                  , midiEventPath     ,
+        oscPortName         , sysexPath         ,
+        )
+from .OSCMidiBackend import MidoBackend
+from sys            import exit, stderr
+from os.path        import isfile
+
+
+## OSC to MIDI translation
+DATA_MASK               = 0x7F
+PITCHWHEEL_MAX          = ( 1 << ( 2 * DATA_BITS ) ) - 1
+SYSTEM_STATUS_FIRST     = 0xF0
+REALTIME_STATUS_FIRST   = 0xF8
+SYSEX_END               = b'\xf7'
+MIDI_NUMBERS            = 128
+
+# Short paths, /oscmidi/( port )/( channel )/( short event )/( number ) with one value
+SHORT_EVENTS = {
+        'cc'    : 0xB0  ,
+        'note'  : 0x90  ,
+        }
+
+
+
+class ConfigFile:
+    """Load and parse OSC Toolkit configuration file for OSC Midi Server"""
+
+    ## Class variables for configuration file parsing
+    # Declare configuration file contants
+    CONFIG_PROPERTY_INDEX       = 0
+    CONFIG_VALUE_INDEX          = 1
+    CONFIG_PROTO_COMMENT_INDEX  = 0
+    CONFIG_COMMENT_SYMBOL       = '#'
+    CONFIG_PROPERTY_PREFIX      = 'oscmidi-server'
+
+    def __init__(
+            self                ,
+            configFileLocations ,
+            ):
+
+        ## Declare config arguments with default values defaults
+        # Verbosity settings
+        self.verboseListenPort          = False
+        self.verboseMidiPorts           = False
+
+        # OSC Port settings
+        self.listenPort                 = 9020
+
+        # Midi ports and devices
+        self.midiVirtualPorts           = []
+        self.midiDevices                = []
+        self.rawMidiDevices             = []
+
+        # Run initialization fucntions
+        self.configData = self.parseConfigFile(
+                self.loadConfigFile(
+                    configFileLocations
+                    )
+                )
+
+    def loadConfigFile(
+            self                ,
+            configFileLocations ,
+            ):
+        ## Load config file
+        for checkConf in configFileLocations:
+            if isfile( checkConf ):
+                configFileLocation = checkConf
+                break
+        configFile = open( configFileLocation, 'r' )
+        configLines = configFile.read().split( '\n' )
+        configFile.close()
+        return configLines
+
+    def parseConfigFile(
+            self        ,
+            configLines ,
+            ):
+        # Parse config file lines
+        for lineRead in configLines:
+            if lineRead:
+                # Seperate the data in each line by whitespace
+                lineData = lineRead.split( self.CONFIG_COMMENT_SYMBOL )[ self.CONFIG_PROTO_COMMENT_INDEX ].split()
+                if not lineData:
+                    continue
+
+                # Verbosity settings
+                if lineData[ self.CONFIG_PROPERTY_INDEX ] == self.CONFIG_PROPERTY_PREFIX + '.verbose_listen_port':
+                    self.verboseListenPort = bool(
+                            int(
+                                lineData[ self.CONFIG_VALUE_INDEX ]
+                                )
+                            )
+
+                if lineData[ self.CONFIG_PROPERTY_INDEX ] == self.CONFIG_PROPERTY_PREFIX + '.verbose_midi_ports':
+                    self.verboseMidiPorts = bool(
+                            int(
+                                lineData[ self.CONFIG_VALUE_INDEX ]
+                                )
+                            )
+
+                # OSC Settings
+                if lineData[ self.CONFIG_PROPERTY_INDEX ] == self.CONFIG_PROPERTY_PREFIX + '.listen_port':
+                    self.listenPort = int(
+                            lineData[ self.CONFIG_VALUE_INDEX ]
+                            )
+
+                # MIDI Settings
+                if lineData[ self.CONFIG_PROPERTY_INDEX ] == self.CONFIG_PROPERTY_PREFIX + '.midi_virtual_ports':
+                    self.midiVirtualPorts += lineData[ self.CONFIG_VALUE_INDEX : ]
+
+                if lineData[ self.CONFIG_PROPERTY_INDEX ] == self.CONFIG_PROPERTY_PREFIX + '.midi_devices':
+                    self.midiDevices += lineData[ self.CONFIG_VALUE_INDEX : ]
+
+                if lineData[ self.CONFIG_PROPERTY_INDEX ] == self.CONFIG_PROPERTY_PREFIX + '.raw_midi_devices':
+                    self.rawMidiDevices += lineData[ self.CONFIG_VALUE_INDEX : ]
+
+        return {
+                'verboseListenPort'         : self.verboseListenPort        ,
+                'verboseMidiPorts'          : self.verboseMidiPorts         ,
+                'listenPort'                : self.listenPort               ,
+                'midiVirtualPorts'          : self.midiVirtualPorts         ,
+                'midiDevices'               : self.midiDevices              ,
+                'rawMidiDevices'            : self.rawMidiDevices           ,
+                }
+
+
+
+class ParseArgs:
+    """Parse command line arguments for OSC Midi Server"""
+
+    def __init__(
+            self        ,
+            configData  ,
+            ):
+        self.configData = configData
+
+        # Run initialization functions
+        self.argData = self.parse()
+
+    def parse( self ):
+        from argparse import ArgumentParser
+        parser = ArgumentParser(
+                description = 'Send incoming OSC messages to virtual MIDI ports and MIDI devices.' ,
+                )
+
+        parser.add_argument(
+                '-L'                                                ,
+                '--list'                                            ,
+                action  = 'store_true'                              ,
+                help    = 'List MIDI output device names and exit.' ,
+                )
+
+        parser.add_argument(
+                '-l'                                                ,
+                '--listen-port'                                     ,
+                type    = int                                       ,
+                help    = 'OSC listen port.'                        ,
+                )
+
+        parser.add_argument(
+                '-d'                                                ,
+                '--device'                                          ,
+                dest    = 'midiDevices'                             ,
+                action  = 'append'                                  ,
+                default = []                                        ,
+                metavar = 'NAME'                                    ,
+                help    = 'Send to a MIDI device.'                  ,
+                )
+
+        parser.add_argument(
+                '-p'                                                ,
+                '--virtual-port'                                    ,
+                dest    = 'midiVirtualPorts'                        ,
+                action  = 'append'                                  ,
+                default = []                                        ,
+                metavar = 'NAME'                                    ,
+                help    = 'Create a virtual MIDI port, sent to by /oscmidi/NAME/CHANNEL/EVENT.' ,
+                )
+
+        parser.add_argument(
+                '-r'                                                ,
+                '--raw-device'                                      ,
+                dest    = 'rawMidiDevices'                          ,
+                action  = 'append'                                  ,
+                default = []                                        ,
+                metavar = 'FILE'                                    ,
+                help    = 'Write to a raw MIDI device file ( /dev/midi1 ) using running status.' ,
+                )
+
+        args = parser.parse_args()
+        return {
+                'listMidiDevices'   : args.list                                                     ,
+                'listenPort'        : args.listen_port or self.configData[ 'listenPort' ]               ,
+                'midiDevices'       : self.configData[ 'midiDevices' ] + args.midiDevices               ,
+                'midiVirtualPorts'  : self.configData[ 'midiVirtualPorts' ] + args.midiVirtualPorts     ,
+                'rawMidiDevices'    : self.configData[ 'rawMidiDevices' ] + args.rawMidiDevices         ,
+                }
+
+
+
+class RawMidiOutput:
+    """
+        A raw MIDI device file, written as a MIDI byte stream.
+
+        The status byte is left out when it is the same as the last one sent
+        ( running status ), so a dense controller stream on one channel costs
+        two bytes per message instead of three.  System messages cancel
+        running status, real time messages leave it alone.
+    """
+
+    def __init__(
+            self        ,
+            devicePath  ,
+            ):
+        self.midiFile       = open( devicePath , 'wb' , buffering = 0 )
+        self.runningStatus  = None
+        self.savedBytes     = 0
+
+    def write(
+            self        ,
+            midiBytes   ,
+            dataBytes   ,
+            ):
+        status = midiBytes[ 0 ]
+        if status == self.runningStatus:
+            self.midiFile.write( dataBytes )
+            self.savedBytes += 1
+            return
+        self.midiFile.write( midiBytes )
+        if status < SYSTEM_STATUS_FIRST:
+            self.runningStatus = status
+        elif status < REALTIME_STATUS_FIRST:
+            self.runningStatus = None
+
+    def writeSysex(
+            self    ,
+            chunk   ,
+            last    ,
+            ):
+        """ Write a SysEx chunk as it arrives. """
+        self.midiFile.write( chunk )
+        self.runningStatus = None
+
+    def abortSysex( self ):
+        """ End a SysEx that lost a chunk, so the device does not wait for the rest. """
+        self.midiFile.write( SYSEX_END )
+
+    def close( self ):
+        self.midiFile.close()
+
+
+
+def compileTranslator(
+        write       ,
+        midiBytes   ,
+        dataSlots   ,
+        ):
+    """
+        Return a function that patches OSC arguments into the data bytes of a
+        preallocated MIDI message, and writes it.  dataSlots is the number of
+        data bytes taken from arguments, or PITCHWHEEL_STATUS for one signed
+        pitchwheel value.
+    """
+    dataBytes = memoryview( midiBytes )[ 1 : ]
+
+    if dataSlots == PITCHWHEEL_STATUS:
+        def translate( args ):
+            value = min( max( int( args[ 0 ] ) + PITCHWHEEL_CENTER , 0 ) , PITCHWHEEL_MAX )
+            midiBytes[ 1 ] = value & DATA_MASK
+            midiBytes[ 2 ] = value >> DATA_BITS
+            write( midiBytes , dataBytes )
+    elif dataSlots == 2:
+        def translate( args ):
+            midiBytes[ 1 ] = int( args[ 0 ] ) & DATA_MASK
+            midiBytes[ 2 ] = int( args[ 1 ] ) & DATA_MASK
+            write( midiBytes , dataBytes )
+    else:
+        # The last data byte comes from the only argument
+        def translate( args ):
+            midiBytes[ -1 ] = int( args[ 0 ] ) & DATA_MASK
+            write( midiBytes , dataBytes )
+    return translate
+
+
+
+class OSCToMidi:
+    """
+        Translate incoming OSC messages into MIDI messages on named outputs.
+
+        Every path an output accepts is compiled when the output is added, into
+        a preallocated MIDI message and a translator that patches only its data
+        bytes:
+            /oscmidi/NAME/CHANNEL/EVENT  DATA...    every channel event, as sent by OSC Midi Client
+            /oscmidi/NAME/CHANNEL/cc/N   VALUE      controller N
+            /oscmidi/NAME/CHANNEL/note/N VELOCITY   note N, velocity 0 is note off
+            /oscmidi/NAME/sysex          ID SEQUENCE LENGTH BLOB
+                                                    a SysEx chunk, as sent by OSC Midi Client
+
+        Translating a message is one dictionary lookup on its path.  SysEx
+        chunks are written to the output as they arrive, a chunk that is lost
+        or out of order ends the SysEx and the rest of its chunks are dropped.
+    """
+
+    def __init__(
+            self                    ,
+            midiBackend = None      ,
+            ):
+        self.midiBackend    = midiBackend or MidoBackend()
+        self.translators    = {}
+        self.midiOutputs    = {}
+
+    def addOutput(
+            self        ,
+            portName    ,
+            midiOutput  ,
+            ):
+        """ Compile every path of a MIDI output. """
+        self.midiOutputs[ portName ] = midiOutput
+        write = midiOutput.write
+
+        for channel in range( MIDI_CHANNELS ):
+            # Channel events, with all data bytes as arguments
+            for status , ( event , typeTags ) in MIDI_EVENTS.items():
+                if status == PITCHWHEEL_STATUS:
+                    dataSlots , dataCount = PITCHWHEEL_STATUS , 2
+                else:
+                    dataSlots , dataCount = len( typeTags ) , len( typeTags )
+                self.translators[ midiEventPath( portName , channel , event ) ] = compileTranslator(
+                        write                                               ,
+                        bytearray( [ status | channel ] + [ 0 ] * dataCount )   ,
+                        dataSlots                                           ,
+                        )
+
+            # Short events, with the first data byte in the path
+            for event , status in SHORT_EVENTS.items():
+                eventPath = midiEventPath( portName , channel , event ) + '/'
+                for number in range( MIDI_NUMBERS ):
+                    self.translators[ eventPath + str( number ) ] = compileTranslator(
+                            write                                           ,
+                            bytearray( [ status | channel , number , 0 ] )  ,
+                            1                                               ,
+                            )
+
+        # SysEx chunks
+        self.translators[ sysexPath( portName ) ] = self.compileSysex( midiOutput )
+
+    def compileSysex(
+            self        ,
+            midiOutput  ,
+            ):
+        """ Return a function that writes each SysEx chunk of a transfer to a MIDI output, in sequence. """
+        # Transfer being received [ transfer id , next sequence , bytes received ]
+        transfer = [ None , 0 , 0 ]
+
+        def translate( args ):
+            transferId , sequence , sysexLength , chunk = args
+            if sequence == 0:
+                if transfer[ 0 ] is not None:
+                    midiOutput.abortSysex()
+                transfer[ : ] = [ transferId , 0 , 0 ]
+            elif transferId != transfer[ 0 ] or sequence != transfer[ 1 ]:
+                if transfer[ 0 ] is not None:
+                    midiOutput.abortSysex()
+                    transfer[ 0 ] = None
+                return
+
+            chunk = bytes( chunk )
+            transfer[ 1 ] += 1
+            transfer[ 2 ] += len( chunk )
+            last = transfer[ 2 ] >= sysexLength
+            if last:
+                transfer[ 0 ] = None
+            midiOutput.writeSysex( chunk , last )
+        return translate
+
+    def oscMessage(
+            self    ,
+            path    ,
+            args    ,
+            ):
+        translate = self.translators.get( path )
+        if translate:
+            try:
+                translate( args )
+            except ( IndexError , TypeError , ValueError , OSError ):
+                pass
+
+    def setupOSCServer( self , listenPort ):
+        """ Listen for OSC, every message goes through oscMessage. """
+        from liblo import Server, ServerError
+        try:
+            oscServer = Server( listenPort )
+        except ServerError as error:
+            exit( error )
+        oscServer.add_method(
+                None            ,
+                None            ,
+                self.oscMessage ,
+                )
+        return oscServer
+
+    def close( self ):
+        for midiOutput in self.midiOutputs.values():
+            midiOutput.close()
+
+
+
+def openMidiOutputs(
+        oscToMidi           ,
+        midiVirtualPorts    ,
+        midiDevices         ,
+        rawMidiDevices      ,
+        ):
+    """ Open and add every MIDI output. """
+    try:
+        for portName in midiVirtualPorts:
+            oscToMidi.addOutput( portName , oscToMidi.midiBackend.openOutput( portName , virtual = True ) )
+        for portName in midiDevices:
+            oscToMidi.addOutput( portName , oscToMidi.midiBackend.openOutput( portName ) )
+        for devicePath in rawMidiDevices:
+            oscToMidi.addOutput( devicePath.rsplit( '/' , 1 )[ -1 ] , RawMidiOutput( devicePath ) )
+    except ( OSError , IOError , ImportError ) as error:
+        oscToMidi.close()
+        exit( error )
+    return
+
+
+def listMidiDevices( midiBackend = None ):
+    """ Display the MIDI output device names. """
+    for deviceName in ( midiBackend or MidoBackend() ).outputNames():
+        print( deviceName )
+    return
+
+
+def displayMidiOutputs( oscToMidi ):
+    for portName in oscToMidi.midiOutputs:
+        print( 'MIDI output: ' + portName + ' <- ' + OSC_MIDI_PATH_PREFIX + '/' + oscPortName( portName ) )
+    return
+
+
+def displayRunningStatus( oscToMidi ):
+    """ Display the bytes running status saved on each raw MIDI device. """
+    for portName , midiOutput in oscToMidi.midiOutputs.items():
+        if isinstance( midiOutput , RawMidiOutput ):
+            print(
+                    portName + ': running status saved ' + str( midiOutput.savedBytes ) + ' bytes' ,
+                    file = stderr ,
+                    )
+    return
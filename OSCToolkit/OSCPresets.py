@@ -5,7 +5,7 @@ OSC Presets
 
     Written by: Shane Hutter
 
-    Required Dependencies:  python >= 3.5, pyliblo, mido, rtmidi
+    Required Dependencies:  python >= 3.5, pyliblo
 
       The OSC Presets module contains all of the functions and classes
       required to run OSC Presets
@@ -27,9 +27,906 @@ OSC Presets
 """
 
 # Import Modules
+#   liblo, shlex, and argparse are imported where they are used
 from .          import *
-from argparse   import ArgumentParser
-from liblo      import Address, AddressError, send
-from mido       import open_input, open_output, Parser
-from sys        import exit
+from .OSCShout  import parseTarget, convertArg, encodeMessage, encodeBundle, createOSCSocket
+from sys        import exit, stderr
 from os.path    import isfile
+from struct     import Struct
+from zlib       import crc32
+from collections    import deque
+from heapq          import heappush, heappop
+from itertools      import count
+from threading      import Thread, Condition
+from time           import perf_counter
+
+
+## Preset triggers
+#   /oscpresets/fire ID  or  /oscpresets/fire/ID , a cue sequence ID starts the sequence
+#   /oscpresets/stop ID  or  /oscpresets/stop/ID , stops a cue sequence
+PRESET_FIRE_PATH    = '/oscpresets/fire'
+PRESET_STOP_PATH    = '/oscpresets/stop'
+
+# The messages of a preset to one target are sent in bundles of up to this size
+MAX_BUNDLE_BYTES    = 1400
+
+## Compiled preset libraries
+#   header      magic , preset count , target count , targets offset , index offset , sequences offset
+#   presets     one record per preset
+#                   ID length , ID , datagram count , ( target number , datagram length , datagram ) ...
+#   targets     ( IP length , IP , port ) ...
+#   index       ( CRC32 of the ID , record offset ) ... sorted
+#   sequences   sequence count , ( ID length , ID , loop seconds , step count , ( seconds , ID length , ID ) ... ) ...
+LIBRARY_MAGIC       = b'OTPLIB\0\2'
+LIBRARY_HEADER      = Struct( '>8sIIQQQ' )
+LIBRARY_INDEX_ENTRY = Struct( '>IQ' )
+LIBRARY_LENGTH      = Struct( '>H' )
+LIBRARY_PORT        = Struct( '>H' )
+LIBRARY_DATAGRAM    = Struct( '>HI' )
+LIBRARY_COUNT       = Struct( '>I' )
+LIBRARY_SECONDS     = Struct( '>d' )
+
+
+
+class ConfigFile:
+    """Load and parse OSC Toolkit configuration file for OSC Presets"""
+
+    ## Class variables for configuration file parsing
+    # Declare configuration file contants
+    CONFIG_PROPERTY_INDEX       = 0
+    CONFIG_VALUE_INDEX          = 1
+    CONFIG_PROTO_COMMENT_INDEX  = 0
+    CONFIG_COMMENT_SYMBOL       = '#'
+    CONFIG_PROPERTY_PREFIX      = 'oscpresets'
+
+    def __init__(
+            self                ,
+            configFileLocations ,
+            ):
+
+        ## Declare config arguments with default values defaults
+        # Verbosity settings
+        self.verboseListenPort          = False
+        self.verboseRecievedId          = False
+
+        # OSC Port settings
+        self.listenPort                 = 9030
+
+        # OTP files or compiled preset library loaded when none are given
+        self.otpFiles                   = []
+        self.presetLibrary              = None
+
+        # Run initialization fucntions
+        self.configData = self.parseConfigFile(
+                self.loadConfigFile(
+                    configFileLocations
+                    )
+                )
+
+    def loadConfigFile(
+            self                ,
+            configFileLocations ,
+            ):
+        ## Load config file
+        for checkConf in configFileLocations:
+            if isfile( checkConf ):
+                configFileLocation = checkConf
+                break
+        configFile = open( configFileLocation, 'r' )
+        configLines = configFile.read().split( '\n' )
+        configFile.close()
+        return configLines
+
+    def parseConfigFile(
+            self        ,
+            configLines ,
+            ):
+        # Parse config file lines
+        for lineRead in configLines:
+            if lineRead:
+                # Seperate the data in each line by whitespace
+                lineData = lineRead.split( self.CONFIG_COMMENT_SYMBOL )[ self.CONFIG_PROTO_COMMENT_INDEX ].split()
+                if not lineData:
+                    continue
+
+                # Verbosity settings
+                if lineData[ self.CONFIG_PROPERTY_INDEX ] == self.CONFIG_PROPERTY_PREFIX + '.verbose_listen_port':
+                    self.verboseListenPort = bool(
+                            int(
+                                lineData[ self.CONFIG_VALUE_INDEX ]
+                                )
+                            )
+
+                if lineData[ self.CONFIG_PROPERTY_INDEX ] == self.CONFIG_PROPERTY_PREFIX + '.verbose_recieved_id':
+                    self.verboseRecievedId = bool(
+                            int(
+                                lineData[ self.CONFIG_VALUE_INDEX ]
+                                )
+                            )
+
+                # OSC Settings
+                if lineData[ self.CONFIG_PROPERTY_INDEX ] == self.CONFIG_PROPERTY_PREFIX + '.listen_port':
+                    self.listenPort = int(
+                            lineData[ self.CONFIG_VALUE_INDEX ]
+                            )
+
+                # Preset Settings
+                if lineData[ self.CONFIG_PROPERTY_INDEX ] == self.CONFIG_PROPERTY_PREFIX + '.otp_file':
+                    self.otpFiles += lineData[ self.CONFIG_VALUE_INDEX : ]
+
+                if lineData[ self.CONFIG_PROPERTY_INDEX ] == self.CONFIG_PROPERTY_PREFIX + '.preset_library':
+                    self.presetLibrary = lineData[ self.CONFIG_VALUE_INDEX ]
+
+        return {
+                'verboseListenPort'         : self.verboseListenPort        ,
+                'verboseRecievedId'         : self.verboseRecievedId        ,
+                'listenPort'                : self.listenPort               ,
+                'otpFiles'                  : self.otpFiles                 ,
+                'presetLibrary'             : self.presetLibrary            ,
+                }
+
+
+
+class ParseArgs:
+    """Parse command line arguments for OSC Presets"""
+
+    def __init__(
+            self        ,
+            configData  ,
+            ):
+        self.configData = configData
+
+        # Run initialization functions
+        self.argData = self.parse()
+
+    def parse( self ):
+        from argparse import ArgumentParser
+        parser = ArgumentParser(
+                description = 'Send a preset list of OSC messages when a preset is fired with ' + PRESET_FIRE_PATH + ' ID.' ,
+                )
+
+        parser.add_argument(
+                'otpFiles'                                          ,
+                nargs   = '*'                                       ,
+                metavar = 'FILE'                                    ,
+                help    = 'OTP preset files, oscpresets.otp_file from the configuration file by default.' ,
+                )
+
+        parser.add_argument(
+                '-l'                                                ,
+                '--listen-port'                                     ,
+                type    = int                                       ,
+                help    = 'OSC listen port.'                        ,
+                )
+
+        libraryGroup = parser.add_mutually_exclusive_group()
+
+        libraryGroup.add_argument(
+                '-c'                                                ,
+                '--compile'                                         ,
+                metavar = 'LIBRARY'                                 ,
+                help    = 'Compile the OTP files into a preset library and exit.' ,
+                )
+
+        libraryGroup.add_argument(
+                '-L'                                                ,
+                '--library'                                         ,
+                metavar = 'LIBRARY'                                 ,
+                help    = 'Fire presets from a compiled preset library.' ,
+                )
+
+        args = parser.parse_args()
+
+        # OTP files on the command line come before any preset library in the configuration file
+        otpFiles        = args.otpFiles
+        presetLibrary   = args.library
+        if not otpFiles and not presetLibrary:
+            if args.compile or not self.configData[ 'presetLibrary' ]:
+                otpFiles = self.configData[ 'otpFiles' ]
+            else:
+                presetLibrary = self.configData[ 'presetLibrary' ]
+        if args.library and otpFiles:
+            parser.error( 'OTP files cannot be used with --library' )
+        if not otpFiles and not presetLibrary:
+            parser.error( 'no OTP files given, and no oscpresets.otp_file or oscpresets.preset_library in the configuration file' )
+
+        return {
+                'otpFiles'          : otpFiles                                                      ,
+                'presetLibrary'     : presetLibrary                                                 ,
+                'compileLibrary'    : args.compile                                                  ,
+                'listenPort'        : args.listen_port or self.configData[ 'listenPort' ]               ,
+                }
+
+
+
+class OTPFiles:
+    """
+        Load OTP preset files.
+
+        Each line adds one OSC message to a preset, in the format of an OSC
+        Shout batch line with the preset ID in front:
+            PRESET_ID   IP:PORT/path/to/message   args...
+        Messages of a preset are sent in the order they appear.
+
+        Lines with @ add a cue to a timed cue sequence, fired SECONDS after the
+        sequence starts.  A cue fires a preset or sequence, or sends messages
+        given in place, those of one cue are sent together:
+            SEQUENCE_ID @SECONDS    PRESET_ID
+            SEQUENCE_ID @SECONDS    IP:PORT/path/to/message   args...
+            SEQUENCE_ID @loop       SECONDS
+        A sequence with @loop starts again every SECONDS until it is stopped.
+    """
+
+    OTP_PRESET_ID_INDEX     = 0
+    OTP_TARGET_INDEX        = 1
+    OTP_ARGS_INDEX          = 2
+    OTP_CUE_INDEX           = 1
+    OTP_CUE_ACTION_INDEX    = 2
+    OTP_COMMENT_SYMBOL      = '#'
+    OTP_QUOTE_SYMBOLS       = ( '"' , "'" , )
+    OTP_CUE_SYMBOL          = '@'
+    OTP_LOOP_KEYWORD        = 'loop'
+
+    # Sequence data ( loop seconds or None , [ ( seconds , preset ID ) , ... ] )
+    SEQUENCE_LOOP_INDEX     = 0
+    SEQUENCE_CUES_INDEX     = 1
+
+    def __init__(
+            self        ,
+            otpFiles    ,
+            ):
+        # Preset ID : [ ( IP , port , path , args ) , ... ]
+        self.presetMessages = {}
+
+        # Sequence ID : ( loop seconds or None , ( ( seconds , preset ID ) , ... ) ) , cues in time order
+        self.cueSequences   = {}
+
+        # Run initialization functions
+        for otpFileName in otpFiles:
+            self.parseOtpFile( otpFileName )
+        self.checkCueSequences()
+
+    def parseOtpFile(
+            self        ,
+            otpFileName ,
+            ):
+        from shlex import split as splitLine
+
+        try:
+            otpFile = open( otpFileName , 'r' )
+        except OSError as error:
+            exit( error )
+        with otpFile:
+            for lineNumber , lineRead in enumerate( otpFile , 1 ):
+                try:
+                    # Only lines with quoted arguments need shlex
+                    if any( quote in lineRead for quote in self.OTP_QUOTE_SYMBOLS ):
+                        lineData = splitLine( lineRead , comments = True )
+                    else:
+                        lineData = lineRead.split( self.OTP_COMMENT_SYMBOL , 1 )[ 0 ].split()
+                    if not lineData:
+                        continue
+                    if lineData[ self.OTP_CUE_INDEX ].startswith( self.OTP_CUE_SYMBOL ):
+                        self.parseCueLine( lineData )
+                        continue
+                    oscTargetIp , oscTargetPort , oscTargetPath = parseTarget( lineData[ self.OTP_TARGET_INDEX ] )
+                except ( IndexError , ValueError ):
+                    exit(
+                            'Error: OTP file ' + otpFileName + ' line ' + str( lineNumber ) +
+                            ' is not PRESET_ID IP:PORT/path args... or SEQUENCE_ID @SECONDS cue'
+                            )
+
+                self.presetMessages.setdefault( lineData[ self.OTP_PRESET_ID_INDEX ] , [] ).append(
+                        (
+                            oscTargetIp                                                             ,
+                            oscTargetPort                                                           ,
+                            oscTargetPath                                                           ,
+                            [ convertArg( oscArg ) for oscArg in lineData[ self.OTP_ARGS_INDEX : ] ] ,
+                            )
+                        )
+
+
+    def isMessageTarget( self , token ):
+        """ True for an IP:PORT/path target, rather than a preset ID. """
+        port , pathSymbol , path = token.partition( ':' )[ 2 ].partition( '/' )
+        return port.isdigit() and bool( pathSymbol )
+
+    def parseCueLine( self , lineData ):
+        """ Add the cue, or the loop time, of a SEQUENCE_ID @... line. """
+        sequenceId  = lineData[ self.OTP_PRESET_ID_INDEX ]
+        cue         = lineData[ self.OTP_CUE_INDEX ][ len( self.OTP_CUE_SYMBOL ) : ]
+        sequence    = self.cueSequences.setdefault( sequenceId , [ None , [] ] )
+
+        if cue == self.OTP_LOOP_KEYWORD:
+            loopTime = float( lineData[ self.OTP_CUE_ACTION_INDEX ] )
+            if loopTime <= 0:
+                raise ValueError( loopTime )
+            sequence[ self.SEQUENCE_LOOP_INDEX ] = loopTime
+            return
+
+        cueTime = float( cue )
+        if cueTime < 0:
+            raise ValueError( cueTime )
+        action = lineData[ self.OTP_CUE_ACTION_INDEX ]
+
+        # A preset or sequence ID
+        if not self.isMessageTarget( action ):
+            sequence[ self.SEQUENCE_CUES_INDEX ].append( ( cueTime , action ) )
+            return
+
+        # Messages in place make up a preset of their own, one for each cue time
+        oscTargetIp , oscTargetPort , oscTargetPath = parseTarget( action )
+        presetId = sequenceId + self.OTP_CUE_SYMBOL + cue
+        if presetId not in self.presetMessages:
+            sequence[ self.SEQUENCE_CUES_INDEX ].append( ( cueTime , presetId ) )
+        self.presetMessages.setdefault( presetId , [] ).append(
+                (
+                    oscTargetIp                                                                 ,
+                    oscTargetPort                                                               ,
+                    oscTargetPath                                                               ,
+                    [ convertArg( oscArg ) for oscArg in lineData[ self.OTP_CUE_ACTION_INDEX + 1 : ] ] ,
+                    )
+                )
+
+    def checkCueSequences( self ):
+        """ Put the cues of every sequence in time order, and check what they fire. """
+        for sequenceId , ( loopTime , cues ) in self.cueSequences.items():
+            if sequenceId in self.presetMessages:
+                exit( 'Error: OTP ID ' + sequenceId + ' is both a preset and a sequence' )
+            if not cues:
+                exit( 'Error: OTP sequence ' + sequenceId + ' has no cues' )
+            cues = tuple( sorted( cues , key = lambda cue : cue[ 0 ] ) )
+            for cueTime , presetId in cues:
+                if presetId not in self.presetMessages and presetId not in self.cueSequences:
+                    exit( 'Error: OTP sequence ' + sequenceId + ' fires unknown preset ' + presetId )
+            if loopTime is not None and loopTime < cues[ -1 ][ 0 ]:
+                exit( 'Error: OTP sequence ' + sequenceId + ' loops before its last cue' )
+            self.cueSequences[ sequenceId ] = ( loopTime , cues )
+        for sequenceId in self.cueSequences:
+            self.checkSequenceCycle( [ sequenceId ] , set() )
+
+    def checkSequenceCycle(
+            self        ,
+            firing      ,
+            checked     ,
+            ):
+        """ Exit when a sequence fires itself, through any chain of sequences firing sequences. """
+        for cueTime , presetId in self.cueSequences[ firing[ -1 ] ][ self.SEQUENCE_CUES_INDEX ]:
+            if presetId not in self.cueSequences or presetId in checked:
+                continue
+            if presetId in firing:
+                exit(
+                        'Error: OTP sequence ' + presetId + ' fires itself through ' +
+                        ' -> '.join( firing[ firing.index( presetId ) : ] + [ presetId ] )
+                        )
+            self.checkSequenceCycle( firing + [ presetId ] , checked )
+        checked.add( firing[ -1 ] )
+
+
+
+def presetKey( presetId ):
+    """ Return the preset ID of an OSC argument or path element, as it is written in OTP files. """
+    if isinstance( presetId , float ) and presetId.is_integer():
+        presetId = int( presetId )
+    return str( presetId )
+
+
+def encodeDatagrams( encodedMessages ):
+    """ Yield the messages as bundles of up to MAX_BUNDLE_BYTES, a lone message is sent as it is. """
+    bundle , bundleBytes = [] , 0
+    for encodedMessage in encodedMessages:
+        if bundle and bundleBytes + len( encodedMessage ) > MAX_BUNDLE_BYTES:
+            yield bytes( encodeBundle( bundle ) ) if len( bundle ) > 1 else bundle[ 0 ]
+            bundle , bundleBytes = [] , 0
+        bundle.append( encodedMessage )
+        bundleBytes += len( encodedMessage )
+    if bundle:
+        yield bytes( encodeBundle( bundle ) ) if len( bundle ) > 1 else bundle[ 0 ]
+
+
+def encodePreset( messages ):
+    """ Return [ ( ( IP , port ) , datagram ) , ... ] for the messages of a preset. """
+    # Encoded messages of each target, targets in order of their first message
+    targetMessages  = {}
+    targetOrder     = []
+    for oscTargetIp , oscTargetPort , oscTargetPath , oscArgs in messages:
+        target = ( oscTargetIp , oscTargetPort )
+        if target not in targetMessages:
+            targetMessages[ target ] = []
+            targetOrder.append( target )
+        # Template buffers are reused, so keep a copy of the message
+        targetMessages[ target ].append( bytes( encodeMessage( oscTargetPath , oscArgs ) ) )
+
+    return [
+            ( target , datagram )
+            for target in targetOrder
+            for datagram in encodeDatagrams( targetMessages[ target ] )
+            ]
+
+
+
+class CueScheduler:
+    """
+        Fire the cues of timed cue sequences, from one scheduler thread.
+
+        Every playing sequence has one entry on a heap of due times, its next
+        cue, so any number of sequences play at once without a thread each.
+        The thread sleeps until a cue is SPIN_THRESHOLD away, then spins to its
+        due time on the monotonic perf_counter clock.  How late each cue fires
+        is kept, for the last JITTER_SAMPLES cues, as the timing jitter.
+    """
+
+    # Sleep until a cue is this close, then spin
+    SPIN_THRESHOLD  = 0.0005
+    JITTER_SAMPLES  = 10000
+
+    # Playing sequence [ sequence ID , loop seconds , cues , start time , next cue , playing ]
+    PLAY_ID_INDEX       = 0
+    PLAY_LOOP_INDEX     = 1
+    PLAY_CUES_INDEX     = 2
+    PLAY_START_INDEX    = 3
+    PLAY_NEXT_INDEX     = 4
+    PLAY_PLAYING_INDEX  = 5
+
+    def __init__( self , fire ):
+        self.fire           = fire
+        self.playing        = {}
+        self.lateness       = deque( maxlen = self.JITTER_SAMPLES )
+        self.cuesFired      = 0
+
+        # Cues waiting ( due time , order , playing sequence )
+        self.cues           = []
+        self.order          = count()
+        self.condition      = Condition()
+        self.running        = True
+        self.schedulerThread = Thread(
+                target  = self.schedule             ,
+                name    = 'oscpresets-cues'         ,
+                daemon  = True                      ,
+                )
+        self.schedulerThread.start()
+
+    def play(
+            self        ,
+            sequenceId  ,
+            loopTime    ,
+            cues        ,
+            ):
+        """ Start a sequence from its first cue, a sequence that is already playing starts over. """
+        startTime   = perf_counter()
+        play        = [ sequenceId , loopTime , cues , startTime , 0 , True ]
+        with self.condition:
+            if sequenceId in self.playing:
+                self.playing[ sequenceId ][ self.PLAY_PLAYING_INDEX ] = False
+            self.playing[ sequenceId ] = play
+            heappush( self.cues , ( startTime + cues[ 0 ][ 0 ] , next( self.order ) , play ) )
+            self.condition.notify()
+
+    def stop( self , sequenceId ):
+        """ Stop a sequence, its waiting cue is dropped when it comes due. """
+        with self.condition:
+            play = self.playing.pop( sequenceId , None )
+            if play:
+                play[ self.PLAY_PLAYING_INDEX ] = False
+        return play is not None
+
+    def schedule( self ):
+        """ Scheduler thread, fire each cue as it comes due. """
+        cues = self.cues
+        while self.running:
+            with self.condition:
+                while self.running and not cues:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                wait = cues[ 0 ][ 0 ] - perf_counter()
+                if wait > self.SPIN_THRESHOLD:
+                    self.condition.wait( wait - self.SPIN_THRESHOLD )
+                    continue
+                if wait > 0:
+                    continue
+                dueTime , order , play = heappop( cues )
+                if not play[ self.PLAY_PLAYING_INDEX ]:
+                    continue
+
+                # Queue the next cue of the sequence, from the start of the sequence
+                #   so that lateness does not add up
+                sequenceCues    = play[ self.PLAY_CUES_INDEX ]
+                cueTime , presetId = sequenceCues[ play[ self.PLAY_NEXT_INDEX ] ]
+                play[ self.PLAY_NEXT_INDEX ] += 1
+                if play[ self.PLAY_NEXT_INDEX ] == len( sequenceCues ) and play[ self.PLAY_LOOP_INDEX ]:
+                    play[ self.PLAY_NEXT_INDEX ]    = 0
+                    play[ self.PLAY_START_INDEX ]  += play[ self.PLAY_LOOP_INDEX ]
+                if play[ self.PLAY_NEXT_INDEX ] < len( sequenceCues ):
+                    heappush(
+                            cues                                                                                    ,
+                            (
+                                play[ self.PLAY_START_INDEX ] + sequenceCues[ play[ self.PLAY_NEXT_INDEX ] ][ 0 ]   ,
+                                next( self.order )                                                                  ,
+                                play                                                                                ,
+                                )                                                                                   ,
+                            )
+                elif self.playing.get( play[ self.PLAY_ID_INDEX ] ) is play:
+                    del self.playing[ play[ self.PLAY_ID_INDEX ] ]
+
+            self.lateness.append( perf_counter() - dueTime )
+            self.cuesFired += 1
+            self.fire( presetId )
+
+    def jitter( self ):
+        """ Return ( cues fired , median , 99th percentile , most lateness ) in seconds, of the last JITTER_SAMPLES cues. """
+        lateness = sorted( self.lateness )
+        if not lateness:
+            return ( 0 , 0.0 , 0.0 , 0.0 , )
+        return (
+                self.cuesFired                                                  ,
+                lateness[ len( lateness ) // 2 ]                                ,
+                lateness[ min( len( lateness ) * 99 // 100 , len( lateness ) - 1 ) ] ,
+                lateness[ -1 ]                                                  ,
+                )
+
+    def close( self ):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.schedulerThread.join()
+
+
+
+class OSCPresets:
+    """
+        Fire presets of OSC messages.
+
+        Every preset is encoded when it is loaded, into the datagrams for each
+        of its targets, with the messages to one target sent as one bundle of
+        up to MAX_BUNDLE_BYTES.  The presets are kept in a dictionary keyed by
+        preset ID, so firing a preset is one lookup and a send per datagram,
+        however many presets are loaded.  Firing a cue sequence ID plays the
+        sequence on the CueScheduler.
+    """
+
+    def __init__(
+            self                            ,
+            presetMessages                  ,
+            verboseRecievedId   = False     ,
+            cueSequences        = None      ,
+            ):
+        self.verboseRecievedId  = verboseRecievedId
+        self.oscSockets         = {}
+        self.setupCueSequences( cueSequences )
+        self.presets            = {
+                presetId : tuple(
+                    ( self.targetSend( *target ) , datagram )
+                    for target , datagram in encodePreset( messages )
+                    )
+                for presetId , messages in presetMessages.items()
+                }
+
+    def targetSend(
+            self            ,
+            oscTargetIp     ,
+            oscTargetPort   ,
+            ):
+        """ Return the send function of the socket for a target, one socket per target. """
+        target = ( oscTargetIp , oscTargetPort )
+        if target not in self.oscSockets:
+            self.oscSockets[ target ] = createOSCSocket( oscTargetIp , oscTargetPort )
+        return self.oscSockets[ target ].send
+
+    def setupCueSequences( self , cueSequences ):
+        """ Keep the cue sequences, and start the scheduler when there are any. """
+        self.cueSequences   = cueSequences or {}
+        self.cueScheduler   = CueScheduler( self.fire ) if self.cueSequences else None
+
+    def presetCount( self ):
+        return len( self.presets )
+
+    def presetDatagrams( self , presetId ):
+        """ Return ( ( send , datagram ) , ... ) for a preset, or None when there is no such preset. """
+        return self.presets.get( presetId )
+
+    def fire( self , presetId ):
+        """ Send every message of a preset, or play a cue sequence, return False when there is no such preset. """
+        cueSequence = self.cueSequences.get( presetId )
+        if cueSequence:
+            self.cueScheduler.play( presetId , *cueSequence )
+            return True
+
+        datagrams = self.presetDatagrams( presetId )
+        if datagrams is None:
+            return False
+        for send , datagram in datagrams:
+            try:
+                send( datagram )
+            except ConnectionRefusedError:
+                # A target that is not listening yet
+                pass
+            except OSError as error:
+                print( 'Preset ' + presetId + ': ' + str( error ) , file = stderr )
+        return True
+
+    def oscMessage(
+            self    ,
+            path    ,
+            args    ,
+            ):
+        """ Fire or stop the preset of a /oscpresets/fire or /oscpresets/stop message, with its ID as an argument or path element. """
+        for triggerPath , trigger , action in (
+                ( PRESET_FIRE_PATH , self.fire , '' )                  ,
+                ( PRESET_STOP_PATH , self.stop , ' stopped' )          ,
+                ):
+            if path == triggerPath and args:
+                presetId = presetKey( args[ 0 ] )
+            elif path.startswith( triggerPath + '/' ):
+                presetId = path[ len( triggerPath ) + 1 : ]
+            else:
+                continue
+            found = trigger( presetId )
+            if self.verboseRecievedId:
+                print( 'Preset ' + presetId + action + ( '' if found else ' ( not found )' ) )
+            return
+
+    def stop( self , sequenceId ):
+        """ Stop a cue sequence, return False when it is not playing. """
+        return bool( self.cueScheduler ) and self.cueScheduler.stop( sequenceId )
+
+    def setupOSCServer( self , listenPort ):
+        """ Listen for OSC, every message goes through oscMessage. """
+        from liblo import Server, ServerError
+        try:
+            oscServer = Server( listenPort )
+        except ServerError as error:
+            exit( error )
+        oscServer.add_method(
+                None            ,
+                None            ,
+                self.oscMessage ,
+                )
+        return oscServer
+
+    def close( self ):
+        if self.cueScheduler:
+            self.cueScheduler.close()
+        for oscSocket in self.oscSockets.values():
+            oscSocket.close()
+
+
+
+def compilePresetLibrary(
+        presetMessages              ,
+        libraryFileName             ,
+        cueSequences        = None  ,
+        ):
+    """ Encode every preset, and write them and the cue sequences as a preset library. """
+    targetNumbers   = {}
+    indexEntries    = []
+
+    with open( libraryFileName , 'wb' ) as libraryFile:
+        libraryFile.write( bytes( LIBRARY_HEADER.size ) )
+
+        # Preset records
+        for presetId , messages in presetMessages.items():
+            encodedId   = presetId.encode( 'utf-8' )
+            datagrams   = encodePreset( messages )
+            indexEntries.append( ( crc32( encodedId ) , libraryFile.tell() ) )
+            record = [
+                    LIBRARY_LENGTH.pack( len( encodedId ) ) ,
+                    encodedId                               ,
+                    LIBRARY_LENGTH.pack( len( datagrams ) ) ,
+                    ]
+            for target , datagram in datagrams:
+                targetNumber = targetNumbers.setdefault( target , len( targetNumbers ) )
+                record.append( LIBRARY_DATAGRAM.pack( targetNumber , len( datagram ) ) )
+                record.append( datagram )
+            libraryFile.write( b''.join( record ) )
+
+        # Targets, in target number order
+        targetsOffset = libraryFile.tell()
+        for ( oscTargetIp , oscTargetPort ) , targetNumber in sorted( targetNumbers.items() , key = lambda item : item[ 1 ] ):
+            encodedIp = oscTargetIp.encode( 'utf-8' )
+            libraryFile.write(
+                    LIBRARY_LENGTH.pack( len( encodedIp ) ) + encodedIp + LIBRARY_PORT.pack( oscTargetPort )
+                    )
+
+        # Index, sorted for binary search
+        indexOffset = libraryFile.tell()
+        libraryFile.write(
+                b''.join( LIBRARY_INDEX_ENTRY.pack( *indexEntry ) for indexEntry in sorted( indexEntries ) )
+                )
+
+        # Cue sequences
+        sequencesOffset = libraryFile.tell()
+        cueSequences    = cueSequences or {}
+        sequences       = [ LIBRARY_COUNT.pack( len( cueSequences ) ) ]
+        for sequenceId , ( loopTime , cues ) in cueSequences.items():
+            encodedId = sequenceId.encode( 'utf-8' )
+            sequences += [
+                    LIBRARY_LENGTH.pack( len( encodedId ) )     ,
+                    encodedId                                   ,
+                    LIBRARY_SECONDS.pack( loopTime or 0.0 )     ,
+                    LIBRARY_LENGTH.pack( len( cues ) )          ,
+                    ]
+            for cueTime , presetId in cues:
+                encodedId = presetId.encode( 'utf-8' )
+                sequences += [
+                        LIBRARY_SECONDS.pack( cueTime )             ,
+                        LIBRARY_LENGTH.pack( len( encodedId ) )     ,
+                        encodedId                                   ,
+                        ]
+        libraryFile.write( b''.join( sequences ) )
+
+        libraryFile.seek( 0 )
+        libraryFile.write(
+                LIBRARY_HEADER.pack(
+                    LIBRARY_MAGIC           ,
+                    len( indexEntries )     ,
+                    len( targetNumbers )    ,
+                    targetsOffset           ,
+                    indexOffset             ,
+                    sequencesOffset         ,
+                    )
+                )
+    return len( indexEntries )
+
+
+
+class PresetLibrary( OSCPresets ):
+    """
+        Fire presets from a compiled preset library.
+
+        The library is memory mapped, and opening it reads only its header,
+        targets, and cue sequences, however many presets it holds.  Firing a
+        preset the first time binary searches the index on the CRC32 of its ID,
+        checks the ID of the record, and keeps the record's datagrams as slices
+        of the mapping, so only the pages of the index and of presets that fire
+        are read in.  Sockets are created when a target is first sent to.
+    """
+
+    def __init__(
+            self                            ,
+            libraryFileName                 ,
+            verboseRecievedId   = False     ,
+            ):
+        from mmap import mmap, ACCESS_READ
+
+        self.verboseRecievedId  = verboseRecievedId
+        self.oscSockets         = {}
+
+        # Presets that have fired, preset ID : ( ( send , datagram ) , ... )
+        self.presets            = {}
+
+        try:
+            with open( libraryFileName , 'rb' ) as libraryFile:
+                self.libraryMap = mmap( libraryFile.fileno() , 0 , access = ACCESS_READ )
+            (
+                    magic                   ,
+                    self.libraryPresets     ,
+                    targetCount             ,
+                    targetsOffset           ,
+                    self.indexOffset        ,
+                    sequencesOffset         ,
+                    ) = LIBRARY_HEADER.unpack_from( self.libraryMap , 0 )
+        except ( OSError , ValueError ) as error:
+            exit( str( libraryFileName ) + ': ' + str( error ) )
+        if magic != LIBRARY_MAGIC:
+            exit( libraryFileName + ': not an OSC Presets library' )
+        self.libraryView = memoryview( self.libraryMap )
+
+        # Targets, by target number
+        self.targets    = []
+        offset          = targetsOffset
+        for targetNumber in range( targetCount ):
+            oscTargetIp , offset = self.readString( offset )
+            oscTargetPort , = LIBRARY_PORT.unpack_from( self.libraryMap , offset )
+            offset += LIBRARY_PORT.size
+            self.targets.append( ( oscTargetIp , oscTargetPort ) )
+
+        self.setupCueSequences( self.readCueSequences( sequencesOffset ) )
+
+    def readString( self , offset ):
+        """ Return ( string , offset after it ) of a length prefixed string. """
+        length , = LIBRARY_LENGTH.unpack_from( self.libraryMap , offset )
+        offset += LIBRARY_LENGTH.size
+        return bytes( self.libraryView[ offset : offset + length ] ).decode( 'utf-8' ) , offset + length
+
+    def readCueSequences( self , offset ):
+        """ Return the cue sequences of the library, as OTPFiles.cueSequences. """
+        cueSequences = {}
+        sequenceCount , = LIBRARY_COUNT.unpack_from( self.libraryMap , offset )
+        offset += LIBRARY_COUNT.size
+        for sequenceNumber in range( sequenceCount ):
+            sequenceId , offset = self.readString( offset )
+            loopTime , = LIBRARY_SECONDS.unpack_from( self.libraryMap , offset )
+            offset += LIBRARY_SECONDS.size
+            cueCount , = LIBRARY_LENGTH.unpack_from( self.libraryMap , offset )
+            offset += LIBRARY_LENGTH.size
+            cues = []
+            for cueNumber in range( cueCount ):
+                cueTime , = LIBRARY_SECONDS.unpack_from( self.libraryMap , offset )
+                presetId , offset = self.readString( offset + LIBRARY_SECONDS.size )
+                cues.append( ( cueTime , presetId ) )
+            cueSequences[ sequenceId ] = ( loopTime or None , tuple( cues ) )
+        return cueSequences
+
+    def presetCount( self ):
+        return self.libraryPresets
+
+    def presetDatagrams( self , presetId ):
+        """ Return ( ( send , datagram ) , ... ) for a preset, reading it from the library the first time it fires. """
+        datagrams = self.presets.get( presetId )
+        if datagrams is None:
+            datagrams = self.readPreset( presetId )
+            if datagrams is not None:
+                self.presets[ presetId ] = datagrams
+        return datagrams
+
+    def readPreset( self , presetId ):
+        libraryMap  = self.libraryMap
+        encodedId   = presetId.encode( 'utf-8' )
+        idHash      = crc32( encodedId )
+        entrySize   = LIBRARY_INDEX_ENTRY.size
+        indexEntry  = lambda entry : LIBRARY_INDEX_ENTRY.unpack_from( libraryMap , self.indexOffset + entry * entrySize )
+
+        # First index entry with the hash of the ID
+        low , high = 0 , self.libraryPresets
+        while low < high:
+            middle = ( low + high ) // 2
+            if indexEntry( middle )[ 0 ] < idHash:
+                low = middle + 1
+            else:
+                high = middle
+
+        # Entries with the same hash, the record with the same ID is the preset
+        for entry in range( low , self.libraryPresets ):
+            entryIdHash , offset = indexEntry( entry )
+            if entryIdHash != idHash:
+                return None
+            idLength , = LIBRARY_LENGTH.unpack_from( libraryMap , offset )
+            offset += LIBRARY_LENGTH.size
+            if self.libraryView[ offset : offset + idLength ] == encodedId:
+                return self.readRecord( offset + idLength )
+        return None
+
+    def readRecord( self , offset ):
+        """ Return ( ( send , datagram ) , ... ) of the record datagrams starting at offset. """
+        datagramCount , = LIBRARY_LENGTH.unpack_from( self.libraryMap , offset )
+        offset += LIBRARY_LENGTH.size
+        datagrams = []
+        for datagramNumber in range( datagramCount ):
+            targetNumber , datagramLength = LIBRARY_DATAGRAM.unpack_from( self.libraryMap , offset )
+            offset += LIBRARY_DATAGRAM.size
+            datagrams.append(
+                    (
+                        self.targetSend( *self.targets[ targetNumber ] )        ,
+                        self.libraryView[ offset : offset + datagramLength ]    ,
+                        )
+                    )
+            offset += datagramLength
+        return tuple( datagrams )
+
+    def close( self ):
+        OSCPresets.close( self )
+        # Datagram slices must be released before the mapping is closed, when
+        #   any are still held elsewhere the mapping closes once they are freed
+        self.presets = {}
+        try:
+            self.libraryView.release()
+            self.libraryMap.close()
+        except BufferError:
+            pass
+
+
+
+def displayCueJitter( oscPresets ):
+    """ Display how late cues of cue sequences fired. """
+    if not oscPresets.cueScheduler or not oscPresets.cueScheduler.cuesFired:
+        return
+    cuesFired , median , percentile99 , most = oscPresets.cueScheduler.jitter()
+    print(
+            'Cues fired: ' + str( cuesFired ) + ', late by '                +
+            'median ' + '%.3f' % ( median * 1000.0 ) + ' ms, '              +
+            'p99 ' + '%.3f' % ( percentile99 * 1000.0 ) + ' ms, '           +
+            'most ' + '%.3f' % ( most * 1000.0 ) + ' ms'                    ,
+            file = stderr                                                   ,
+            )
+    return
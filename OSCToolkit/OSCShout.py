@@ -30,11 +30,370 @@ OSC Shout
 """
 
 # Import modules
+#   liblo, argparse, and the batch and load generator modules are imported
+#   where they are used, so each mode only loads what it needs
 from .          import *
-from argparse   import ArgumentParser
-from liblo      import Address, AddressError, send
-from sys        import exit
+from sys        import exit, stdin, stderr
 from os.path    import isfile
+from struct     import Struct
+from time       import perf_counter, sleep
+from functools  import lru_cache
+
+
+
+# Batch input comment symbol
+BATCH_COMMENT_SYMBOL = '#'
+
+# OSC encoding
+OSC_ALIGNMENT       = 4
+OSC_INT32_RANGE     = range( -2 ** 31 , 2 ** 31 )
+TEMPLATE_CACHE_SIZE = 512
+OSC_TYPE_FORMATS    = {
+        'i' : 'i'   ,
+        'f' : 'f'   ,
+        'd' : 'd'   ,
+        'h' : 'q'   ,
+        }
+
+# Immediate bundle header ( #bundle , time tag 1 ) and bundle element size
+OSC_BUNDLE_HEADER   = b'#bundle\0' + Struct( '>Q' ).pack( 1 )
+OSC_ELEMENT_SIZE    = Struct( '>i' )
+
+
+
+def parseTarget( oscIpPortPath ):
+    """ Split an IP:PORT/path/to/message target into ( ip , port , path ). """
+    # Target parsing constants
+    IP_INDEX                = 0
+    PORT_PATH_INDEX         = 1
+    PORT_INDEX              = 0
+    TOP_LEVEL_PATH_INDEX    = 1
+
+    # Store target IP address
+    oscTargetIp = oscIpPortPath.split( ':' )[ IP_INDEX ]
+
+    # Store target port number
+    oscTargetPort = int(
+            oscIpPortPath.split( ':' )[ PORT_PATH_INDEX ].split( '/' )[ PORT_INDEX ]
+            )
+
+    # Store OSC message path
+    oscTargetPath = ''
+    for pathElement in enumerate(
+            oscIpPortPath.split( ':' )[ PORT_PATH_INDEX ].split( '/' )
+            ):
+        if pathElement[ ENUMERATE_ITERATE_INDEX ] >= TOP_LEVEL_PATH_INDEX:
+            oscTargetPath += '/' + pathElement[ ENUMERATE_VALUE_INDEX ]
+
+    return oscTargetIp , oscTargetPort , oscTargetPath
+
+
+def convertArg( oscArg ):
+    """ Convert a command line argument to an integer, floating point value, or string. """
+    try:
+        # Conver to an integer
+        return int( oscArg )
+    except ValueError:
+        try:
+            # Convert to a floating point value
+            return float( oscArg )
+        except ValueError:
+            # Keep as a string
+            return str( oscArg )
+
+
+
+def oscString( text ):
+    """ Encode a string as a null terminated, 4 byte aligned OSC string. """
+    encoded = text.encode( 'utf-8' ) + b'\0'
+    return encoded + b'\0' * ( -len( encoded ) % OSC_ALIGNMENT )
+
+
+def oscTypeTag( oscArg ):
+    """ Return the OSC type tag for an integer, floating point value, or string. """
+    if isinstance( oscArg , int ):
+        return 'i' if oscArg in OSC_INT32_RANGE else 'h'
+    if isinstance( oscArg , float ):
+        return 'f'
+    return 's'
+
+
+
+class MessageTemplate:
+    """
+        A pre encoded OSC message with argument slots.
+
+        The path and type tags are encoded once.  When every argument has a
+        fixed size ( i , f , d , h ), the message is kept in one buffer and
+        encode() only packs the arguments into their slots.
+    """
+
+    def __init__(
+            self        ,
+            path        ,
+            typeTags    ,
+            ):
+        self.path       = path
+        self.typeTags   = typeTags
+        self.prefix     = oscString( path ) + oscString( ',' + typeTags )
+        self.fixed      = all( typeTag in OSC_TYPE_FORMATS for typeTag in typeTags )
+
+        if self.fixed:
+            self.argStruct  = Struct(
+                    '>' + ''.join( OSC_TYPE_FORMATS[ typeTag ] for typeTag in typeTags )
+                    )
+            self.buffer     = bytearray( self.prefix ) + bytearray( self.argStruct.size )
+
+    def encode(
+            self    ,
+            args    ,
+            ):
+        """ Return the encoded message, patching only the argument slots when possible. """
+        if self.fixed:
+            self.argStruct.pack_into( self.buffer , len( self.prefix ) , *args )
+            return self.buffer
+
+        encoded = bytearray( self.prefix )
+        for typeTag , oscArg in zip( self.typeTags , args ):
+            if typeTag == 's':
+                encoded += oscString( oscArg )
+            else:
+                encoded += Struct( '>' + OSC_TYPE_FORMATS[ typeTag ] ).pack( oscArg )
+        return encoded
+
+
+
+@lru_cache( maxsize = TEMPLATE_CACHE_SIZE )
+def messageTemplate(
+        path        ,
+        typeTags    ,
+        ):
+    """ Return the shared MessageTemplate for a path and its type tags. """
+    return MessageTemplate( path , typeTags )
+
+
+def encodeMessage(
+        path    ,
+        args    ,
+        ):
+    """ Encode an OSC message, reusing the pre encoded template for its path and type tags. """
+    return messageTemplate(
+            path                                                ,
+            ''.join( oscTypeTag( oscArg ) for oscArg in args )  ,
+            ).encode( args )
+
+
+def encodeBundle( encodedMessages ):
+    """ Encode already encoded OSC messages as an immediate OSC bundle. """
+    encoded = bytearray( OSC_BUNDLE_HEADER )
+    for encodedMessage in encodedMessages:
+        encoded += OSC_ELEMENT_SIZE.pack( len( encodedMessage ) )
+        encoded += encodedMessage
+    return encoded
+
+
+
+def compileArgGenerator( generatorData ):
+    """
+        Compile a load generator argument into ( type tag , function ).
+
+            rand:LOW:HIGH           uniform floating point value
+            randint:LOW:HIGH        uniform integer
+            seq:LOW:HIGH            integers counting from LOW to HIGH, then again
+            sine:LOW:HIGH:PERIOD    floating point sine wave, PERIOD in seconds
+            anything else           a constant integer, floating point value, or string
+    """
+    from math   import sin, pi
+    from random import random, randint
+
+    GENERATOR_SYMBOL    = ':'
+    GENERATOR_NAMES     = ( 'rand' , 'randint' , 'seq' , 'sine' , )
+
+    generatorName , _ , generatorParams = generatorData.partition( GENERATOR_SYMBOL )
+
+    # Constant argument
+    if generatorName not in GENERATOR_NAMES:
+        oscArg = convertArg( generatorData )
+        return oscTypeTag( oscArg ) , lambda oscArg = oscArg : oscArg
+
+    try:
+        params = [ float( param ) for param in generatorParams.split( GENERATOR_SYMBOL ) ]
+        if generatorName == 'rand':
+            low , high = params
+            def generator( low = low , span = high - low ):
+                return low + random() * span
+            return 'f' , generator
+        if generatorName == 'randint':
+            low , high = params
+            low , high = int( low ) , int( high )
+            if low > high:
+                raise ValueError( generatorData )
+            def generator( low = low , high = high ):
+                return randint( low , high )
+            return 'i' , generator
+        if generatorName == 'seq':
+            low , high  = params
+            low , high  = int( low ) , int( high )
+            if low > high:
+                raise ValueError( generatorData )
+            counter     = [ low - 1 ]
+            def generator( low = low , high = high , counter = counter ):
+                counter[ 0 ] = low if counter[ 0 ] >= high else counter[ 0 ] + 1
+                return counter[ 0 ]
+            return 'i' , generator
+        if generatorName == 'sine':
+            low , high , period = params
+            middle , amplitude  = ( low + high ) / 2.0 , ( high - low ) / 2.0
+            def generator( middle = middle , amplitude = amplitude , speed = 2.0 * pi / period ):
+                return middle + amplitude * sin( perf_counter() * speed )
+            return 'f' , generator
+    except ( ValueError , ZeroDivisionError ):
+        pass
+    exit( 'Error: invalid argument generator ' + generatorData )
+
+
+
+class LoadGenerator:
+    """
+        Send OSC messages to one target at a steady rate.
+
+        Sends are scheduled against a monotonic clock: every message has a due
+        time of start + n / rate, all messages already due are sent together,
+        and the generator only sleeps when it is ahead of the schedule.  The
+        lateness of each send against its due time is the send side jitter.
+    """
+
+    # Sleep only when ahead by more than this, spin for shorter waits
+    SPIN_THRESHOLD      = 0.0005
+    PATH_TABLE_SIZE     = 4096
+    JITTER_SAMPLES      = 1 << 20
+    PATH_WEIGHT_SYMBOL  = '='
+
+    def __init__(
+            self            ,
+            oscTargetIp     ,
+            oscTargetPort   ,
+            paths           ,
+            argGenerators   ,
+            rate            ,
+            count           ,
+            ):
+        self.rate   = rate
+        self.count  = count
+
+        # Connected UDP socket, so each send skips the address lookup
+        self.oscSocket = createOSCSocket( oscTargetIp , oscTargetPort )
+
+        # Argument generators share one set of type tags
+        self.argGenerators  = [ compileArgGenerator( generatorData ) for generatorData in argGenerators ]
+        typeTags            = ''.join( typeTag for typeTag , generator in self.argGenerators )
+        self.generators     = tuple( generator for typeTag , generator in self.argGenerators )
+
+        # One template per path, and a table of path choices following the path weights
+        pathNames , pathWeights = [] , []
+        for pathData in paths:
+            pathName , _ , pathWeight = pathData.partition( self.PATH_WEIGHT_SYMBOL )
+            pathNames.append( pathName )
+            pathWeights.append( float( pathWeight ) if pathWeight else 1.0 )
+        self.templates  = [ MessageTemplate( pathName , typeTags ) for pathName in pathNames ]
+        from bisect     import bisect
+        from itertools  import accumulate
+        from random     import random
+
+        cumulativeWeights   = list( accumulate( pathWeights ) )
+        self.pathTable      = [
+                bisect( cumulativeWeights , random() * cumulativeWeights[ -1 ] )
+                for choice in range( self.PATH_TABLE_SIZE )
+                ]
+
+    def run( self ):
+        """ Send every message, and return a report of the achieved rate and jitter. """
+        from array import array
+
+        send            = self.oscSocket.send
+        templates       = self.templates
+        pathTable       = self.pathTable
+        generators      = self.generators
+        count           = self.count
+        rate            = self.rate
+        sampleEvery     = max( 1 , count // self.JITTER_SAMPLES )
+        lateness        = array( 'd' )
+        sentBytes       = 0
+        sendErrors      = 0
+        sent            = 0
+
+        start = perf_counter()
+        while sent < count:
+            now = perf_counter()
+            if rate:
+                due = min( int( ( now - start ) * rate ) + 1 , count )
+                if due <= sent:
+                    wait = start + sent / rate - now
+                    if wait > self.SPIN_THRESHOLD:
+                        sleep( wait - self.SPIN_THRESHOLD )
+                    continue
+            else:
+                due = count
+
+            while sent < due:
+                if rate and not sent % sampleEvery:
+                    lateness.append( perf_counter() - start - sent / rate )
+                encoded = templates[ pathTable[ sent % self.PATH_TABLE_SIZE ] ].encode(
+                        [ generator() for generator in generators ]
+                        )
+                try:
+                    sentBytes += send( encoded )
+                except OSError:
+                    sendErrors += 1
+                sent += 1
+        elapsed = perf_counter() - start
+
+        return {
+                'sent'          : sent                                  ,
+                'elapsed'       : elapsed                               ,
+                'rate'          : sent / elapsed if elapsed else 0.0    ,
+                'bytesPerSec'   : sentBytes / elapsed if elapsed else 0.0 ,
+                'sendErrors'    : sendErrors                            ,
+                'lateness'      : sorted( lateness )                    ,
+                }
+
+
+
+def displayLoadReport( report ):
+    """ Display the achieved rate and send side jitter of a load generator run. """
+    MICROSECONDS    = 1000000.0
+    MEGABITS        = 8.0 / 1000000.0
+    PERCENTILES     = ( 50 , 99 , 99.9 , )
+
+    print(
+            'Sent '                                 +
+            str( report[ 'sent' ] )                 +
+            ' messages in '                         +
+            '%.3f' % report[ 'elapsed' ]            +
+            ' s, '                                  +
+            '%.1f' % report[ 'rate' ]               +
+            ' msg/s, '                              +
+            '%.1f' % ( report[ 'bytesPerSec' ] * MEGABITS ) +
+            ' Mbit/s, '                             +
+            str( report[ 'sendErrors' ] )           +
+            ' send errors'
+            )
+
+    lateness = report[ 'lateness' ]
+    if lateness:
+        print(
+                'Send jitter (lateness against schedule): '     +
+                ', '.join(
+                    'p' + '%g' % percentile + ' ' + '%.1f' % (
+                        lateness[ min( int( len( lateness ) * percentile / 100 ) , len( lateness ) - 1 ) ] * MICROSECONDS
+                        ) + ' us'
+                    for percentile in PERCENTILES
+                    )                                           +
+                ', max '                                        +
+                '%.1f' % ( lateness[ -1 ] * MICROSECONDS )      +
+                ' us'
+                )
+    return
 
 
 
@@ -47,9 +406,15 @@ class ParseArgs():
         # Argument parsing variables
         self.oscPathElements    = []
         self.oscTargetPath      = ''
-        self.targetIp           = ''
-        self.targetPort         = ''
+        self.oscTargetIp        = ''
+        self.oscTargetPort      = ''
         self.oscArgList         = []
+        self.batchFile          = None
+        self.bundleSize         = 0
+        self.load               = False
+        self.loadPaths          = []
+        self.loadRate           = None
+        self.loadCount          = None
 
         # Run intitialization methods
         self.argData = self.parse()
@@ -57,14 +422,9 @@ class ParseArgs():
     def parse( self ):
         # Argument parsing constant
         TARGET_ARG_INDEX        = 0
-        IP_PORT_PATH_ARG_INDEX  = 1
-        IP_PORT_PATH_INDEX      = 0
-        IP_INDEX                = 0
-        PORT_PATH_INDEX         = 1
-        PORT_INDEX              = 0
-        TOP_LEVEL_PATH_INDEX    = 1
 
         ## Parse Arguments
+        from argparse import ArgumentParser
         parser = ArgumentParser()
 
         ## Add Arguments
@@ -79,66 +439,124 @@ class ParseArgs():
         # OSC Target (IP:PORT/PATH)
         parser.add_argument(
                 "target"                            , 
-                nargs   = 1                         , 
+                nargs   = "?"                       , 
                 help    = "IP:PORT/Path/to/message" ,
                 )
             
         # OSC messages
         parser.add_argument(
                 "message"                                                                                   , 
-                nargs       = "+"                                                                           , 
+                nargs       = "*"                                                                           , 
                 help        = "Strings, integers, and floating point values to be sent in the OSC message." ,
                 )
+
+        # Batch mode, one IP:PORT/path args... message per line
+        parser.add_argument(
+                "-f"                                                                                ,
+                "--file"                                                                            ,
+                dest        = "batchFile"                                                           ,
+                metavar     = "FILE"                                                                ,
+                help        = "Send every IP:PORT/path args... line of FILE, or of stdin for -."    ,
+                )
+
+        # Bundle consecutive batch messages to the same target
+        parser.add_argument(
+                "-B"                                                                        ,
+                "--bundle"                                                                  ,
+                dest        = "bundleSize"                                                  ,
+                type        = int                                                           ,
+                default     = 0                                                             ,
+                metavar     = "SIZE"                                                        ,
+                help        = "Send up to SIZE consecutive batch messages to a target as one bundle." ,
+                )
         
-        args = parser.parse_args()
+        # Load generator mode
+        parser.add_argument(
+                "-L"                                                                                ,
+                "--load"                                                                            ,
+                action      = "store_true"                                                          ,
+                help        = "Generate load, messages are argument generators (rand:0:1 randint:0:127 seq:0:127 sine:0:1:2)." ,
+                )
 
-        ## Gather ip, port, and path from args.target
-        oscIpPortPath = args.target[ TARGET_ARG_INDEX ]
+        parser.add_argument(
+                "-r"                                                        ,
+                "--rate"                                                    ,
+                type        = float                                         ,
+                default     = 1000.0                                        ,
+                help        = "Load generator messages per second (0 for as fast as possible)." ,
+                )
 
-        # Store target IP address
-        self.oscTargetIp = oscIpPortPath.split( ':' )[ IP_INDEX ]
+        loadLength = parser.add_mutually_exclusive_group()
+        loadLength.add_argument(
+                "-d"                                                        ,
+                "--duration"                                                ,
+                type        = float                                         ,
+                help        = "Load generator run time in seconds."         ,
+                )
 
-        # Store target port number
-        self.oscTargetPort = int(
-                oscIpPortPath.split( ':' )[ PORT_PATH_INDEX ].split( '/' )[ PORT_INDEX ]
+        loadLength.add_argument(
+                "-n"                                                        ,
+                "--count"                                                   ,
+                type        = int                                           ,
+                help        = "Load generator number of messages."          ,
                 )
 
-        # Store OSC message path
-        oscPathElements = []
-        for pathElement in enumerate(
-                oscIpPortPath.split( ':' )[ PORT_PATH_INDEX ].split( '/' )
-                ):
-            if pathElement[ ENUMERATE_ITERATE_INDEX ] >= TOP_LEVEL_PATH_INDEX:
-                oscPathElements.append(
-                        pathElement[ ENUMERATE_VALUE_INDEX ]
-                        )
-        for pathElement in oscPathElements:    
-            self.oscTargetPath += '/' + pathElement
-
-        # Gather oscArgList from args.message and convert to an integer, floating point, or string
-        for oscArg in args.message:
-            # If the message is surrounded by " or ' then do not convert from a string
-            try:
-                # Conver to an integer
+        parser.add_argument(
+                "-p"                                                                        ,
+                "--path"                                                                    ,
+                dest        = "loadPaths"                                                   ,
+                action      = "append"                                                      ,
+                metavar     = "PATH[=WEIGHT]"                                               ,
+                help        = "Load generator path, repeat for a weighted mix of paths."    ,
+                )
+        
+        args = parser.parse_args()
+        self.batchFile  = args.batchFile
+        self.bundleSize = args.bundleSize
+        self.load       = args.load
+
+        # Load generator target, paths, and length
+        if self.load:
+            if not args.target:
+                parser.error( "the load generator requires a target" )
+            self.oscTargetIp , self.oscTargetPort , self.oscTargetPath = parseTarget( args.target )
+            self.loadPaths = args.loadPaths or [ self.oscTargetPath ]
+            self.oscArgList = args.message
+            if args.count is not None:
+                self.loadCount = args.count
+            elif args.duration is not None:
+                self.loadCount = int( args.duration * args.rate )
+            else:
+                parser.error( "the load generator requires --duration or --count" )
+            if not args.rate and args.count is None:
+                parser.error( "a rate of 0 requires --count" )
+            self.loadRate = args.rate
+
+        # A single message needs a target and at least one argument
+        if not self.batchFile and not self.load:
+            if not args.target or not args.message:
+                parser.error( "the following arguments are required: target, message" )
+
+            ## Gather ip, port, and path from args.target
+            self.oscTargetIp , self.oscTargetPort , self.oscTargetPath = parseTarget( args.target )
+
+            # Gather oscArgList from args.message and convert to an integer, floating point, or string
+            for oscArg in args.message:
                 self.oscArgList.append(
-                        int( oscArg )
+                        convertArg( oscArg )
                         )
-            except:
-                try:
-                    # Convert to a floating point value
-                    self.oscArgList.append(
-                            float( oscArg )
-                            )
-                except:
-                    # Keep as a string
-                    self.oscArgList.append(
-                            str( oscArg )
-                            )
+
         return {
                 'oscTargetIp'   : self.oscTargetIp      ,
                 'oscTargetPort' : self.oscTargetPort    ,
                 'oscTargetPath' : self.oscTargetPath    ,
                 'oscArgList'    : self.oscArgList       ,
+                'batchFile'     : self.batchFile        ,
+                'bundleSize'    : self.bundleSize       ,
+                'load'          : self.load             ,
+                'loadPaths'     : self.loadPaths        ,
+                'loadRate'      : self.loadRate         ,
+                'loadCount'     : self.loadCount        ,
                 }
 
 
@@ -147,22 +565,12 @@ def sendOSC(
         path        , 
         messages    ,
         ):
-    ## Sends OSC Message
-    # Create a string for a liblo.send() command
-    libloSend = 'send(target, path'
-    '''
-        OSC message arguments are sent into the function as a list called messages.  The list 
-        entries of messages must be added to the end of a string executed as a liblo.send() 
-        command.  Each entry in the messages list must be added near the end of the command
-        string, one by one, as the messages list itself, enumerating through each of the 
-        indicies in messages.
-    '''
-    for eachMessage in enumerate( messages ):
-        libloSend += ', messages[' + str(
-                eachMessage[ ENUMERATE_ITERATE_INDEX ]
-                ) + ']'
-    libloSend += ')'
-    exec( libloSend )
+    """ Send one OSC message, with the arguments in messages. """
+    from liblo import send, Message
+    send(
+            target                      ,
+            Message( path , *messages ) ,
+            )
     return
 
 
@@ -171,6 +579,7 @@ def createOSCClient(
         oscTargetPort   ,
         ):
     # Create OSC Client
+    from liblo import Address, AddressError
     try:
         return Address(
                 oscTargetIp     , 
@@ -178,3 +587,158 @@ def createOSCClient(
                 )
     except AddressError as error:
         exit( error )
+
+
+
+def createOSCSocket(
+        oscTargetIp     ,
+        oscTargetPort   ,
+        ):
+    """ Create a UDP socket connected to an OSC target, for sending pre encoded messages. """
+    from socket import socket, AF_INET, SOCK_DGRAM
+    oscSocket = socket( AF_INET , SOCK_DGRAM )
+    try:
+        oscSocket.connect( ( oscTargetIp , oscTargetPort ) )
+    except OSError as error:
+        exit( error )
+    return oscSocket
+
+
+
+def shoutBatch(
+        batchLines          ,
+        bundleSize  = 0     ,
+        ):
+    """
+        Send an OSC message for every IP:PORT/path args... line.
+
+        Lines are read one at a time, so input of any size streams through in
+        constant memory.  One socket is created per target, messages reuse the
+        pre encoded template for their path and type tags, and when bundleSize
+        is set, consecutive messages to the same target are sent as bundles of
+        up to bundleSize messages.  A None line, from StreamLines when no more
+        input is ready, sends the bundle waiting so far.
+    """
+    from shlex import shlex
+
+    # Bundle state constants
+    BUNDLE_TARGET_INDEX     = 0
+    BUNDLE_MESSAGES_INDEX   = 1
+
+    oscSockets  = {}
+    pending     = [ None , [] ]
+
+    def sendOSCData(
+            target  ,
+            oscData ,
+            ):
+        try:
+            oscSockets[ target ].send( oscData )
+        except OSError as error:
+            print( str( target ) + ': ' + str( error ) , file = stderr )
+
+    def splitLine( batchLine ):
+        lexer                   = shlex( batchLine , posix = True )
+        lexer.whitespace_split  = True
+        lexer.commenters        = BATCH_COMMENT_SYMBOL
+        return list( lexer )
+
+    def sendPending():
+        if pending[ BUNDLE_MESSAGES_INDEX ]:
+            sendOSCData(
+                    pending[ BUNDLE_TARGET_INDEX ]                      ,
+                    encodeBundle( pending[ BUNDLE_MESSAGES_INDEX ] )    ,
+                    )
+            pending[ BUNDLE_MESSAGES_INDEX ] = []
+
+    lineNumber = 0
+    for batchLine in batchLines:
+        # Input is idle, so do not hold back a partial bundle
+        if batchLine is None:
+            sendPending()
+            continue
+        lineNumber += 1
+
+        # Skip blank lines and comments
+        try:
+            lineData = splitLine( batchLine )
+        except ValueError as error:
+            print( 'Line ' + str( lineNumber ) + ': ' + str( error ) , file = stderr )
+            continue
+        if not lineData:
+            continue
+
+        try:
+            oscTargetIp , oscTargetPort , oscTargetPath = parseTarget( lineData[ 0 ] )
+        except ( IndexError , ValueError ):
+            print( 'Line ' + str( lineNumber ) + ': invalid target ' + lineData[ 0 ] , file = stderr )
+            continue
+
+        # One socket per target
+        target = ( oscTargetIp , oscTargetPort )
+        if target not in oscSockets:
+            oscSockets[ target ] = createOSCSocket( oscTargetIp , oscTargetPort )
+
+        message = encodeMessage(
+                oscTargetPath                                           ,
+                [ convertArg( oscArg ) for oscArg in lineData[ 1: ] ]   ,
+                )
+
+        if not bundleSize:
+            sendOSCData( target , message )
+            continue
+
+        # Bundle consecutive messages to the same target
+        if target != pending[ BUNDLE_TARGET_INDEX ] or len( pending[ BUNDLE_MESSAGES_INDEX ] ) >= bundleSize:
+            sendPending()
+            pending[ BUNDLE_TARGET_INDEX ] = target
+        # Template buffers are reused, so keep a copy of the message
+        pending[ BUNDLE_MESSAGES_INDEX ].append( bytes( message ) )
+
+    sendPending()
+    return
+
+
+class StreamLines:
+    """
+        Lines of stdin, read as they arrive.  None is yielded each time no more
+        input is ready, so streaming input such as tail -f is never held back
+        waiting for a line that may not come.
+    """
+    READ_SIZE = 1 << 16
+
+    def __init__( self , streamFile ):
+        self.fileDescriptor = streamFile.fileno()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self , *exception ):
+        return False
+
+    def __iter__( self ):
+        from os     import read
+        from select import select
+        partialLine = b''
+        while True:
+            if not select( [ self.fileDescriptor ] , [] , [] , 0 )[ 0 ]:
+                yield None
+            streamData = read( self.fileDescriptor , self.READ_SIZE )
+            if not streamData:
+                break
+            lines       = ( partialLine + streamData ).split( b'\n' )
+            partialLine = lines.pop()
+            for line in lines:
+                yield line.decode( 'utf-8' , 'replace' )
+        if partialLine:
+            yield partialLine.decode( 'utf-8' , 'replace' )
+
+
+def openBatchFile( batchFile ):
+    """ Open a batch file, or stdin for -. """
+    if batchFile == '-':
+        return StreamLines( stdin )
+    try:
+        return open( batchFile , 'r' )
+    except OSError as error:
+        exit( error )
@@ -30,14 +30,19 @@ OSC Whispers
 
 ## Import modules
 from .          import *
-from argparse   import ArgumentParser
-from getpass    import getuser
 from sys        import exit
-from pathlib    import Path
 from os.path    import isfile
 from os         import (
         getpid  , access    , W_OK  ,
         )
+from re         import compile as compileRegex
+from operator   import eq, ne, lt, le, gt, ge
+from math       import log10
+from functools  import lru_cache
+from time       import monotonic
+from socket     import gethostname, gethostbyname, gethostbyname_ex, gaierror
+from select     import select
+from struct     import Struct
 from logging    import (
         FileHandler , StreamHandler , Formatter , getLogger ,
         DEBUG       , INFO          , WARNING   , ERROR     , CRITICAL  ,
@@ -46,7 +51,10 @@ from logging    import (
 # This should import inside of the OSC class, and use exception handling
 #   This will allow for a critical dependancy error to be logged if
 #   python-pyliblo is not installed
-from liblo      import Address, AddressError, send, Server, ServerError
+from liblo      import (
+        Address , AddressError  , Server    , ServerError   ,
+        Message , Bundle        ,
+        )
 
 '''
 ToDo:
@@ -88,7 +96,7 @@ class Logger:
 
     # Class variables and CONSTANTS
     LOG_DIR             = "/var/log/osctoolkit/"
-    LOG_DIR_LOCAL       = "/home/" + getuser() + "/.osctoolkit/log/"
+    LOG_DIR_LOCAL       = "/home/{user}/.osctoolkit/log/"
     ERROR_LOG_NAME      = "Error"
     ERROR_LOG_FILE      = "oscwhispers.error_log"
     MAIN_LOG_NAME       = "Main"
@@ -98,18 +106,14 @@ class Logger:
     STREAM_LOG_FORMAT   = "%(name)s: %(levelname)s - %(message)s"
 
     debugMode       = False
-    
-    # Find log location with write permisions
-    if access( LOG_DIR , W_OK ):
-        logDir      = LOG_DIR
-    else:
-        logDir      = LOG_DIR_LOCAL
-        Path( logDir ).mkdir( parents = True , exist_ok = True )
 
     def __init__( self ):
         """
             Initialization of logging
         """
+        # Find log location with write permisions
+        self.logDir = self.findLogDir()
+
         # Create logger
         self.errorLog   = getLogger( self.ERROR_LOG_NAME )
         self.mainLog    = getLogger( self.MAIN_LOG_NAME )
@@ -156,6 +160,18 @@ class Logger:
         self.mainLog.addHandler( self.mainFileHandler )
         self.debugLog.addHandler( self.debugStreamHandler )
 
+
+    def findLogDir( self ):
+        """ Return the system log directory if writable, else create and return the local one. """
+        from getpass    import getuser
+        from pathlib    import Path
+
+        if access( self.LOG_DIR , W_OK ):
+            return self.LOG_DIR
+        logDir = self.LOG_DIR_LOCAL.format( user = getuser() )
+        Path( logDir ).mkdir( parents = True , exist_ok = True )
+        return logDir
+
     
     def log(
             self            ,
@@ -207,15 +223,14 @@ class Logger:
         if not( level ) and not( self.debugMode ):
             # Debug mode is turned off, do not log.
             return
-        exec(
-                "self."                                             + 
-                self.logLevels[ level ][ LOG_LEVELS_LOG_INDEX ]     + 
-                "Log."                                              + 
-                self.logLevels[ level ][ LOG_LEVELS_LEVEL_INDEX ]   + 
-                "(\""                                               + 
-                message                                             + 
-                "\")"
-                )
+        # Dispatch by name, the message is passed as data and never evaluated
+        getattr(
+                getattr(
+                    self                                                    ,
+                    self.logLevels[ level ][ LOG_LEVELS_LOG_INDEX ] + "Log" ,
+                    )                                               ,
+                self.logLevels[ level ][ LOG_LEVELS_LEVEL_INDEX ]   ,
+                )( "%s" , message )
 
 
 ## Load config file and parse arguments
@@ -240,6 +255,14 @@ class ConfigFile:
         self.serverListenPort       = 9000
         self.daemonFiles            = []
 
+        # Runtime forwarding loop guard ( a budget of 0 disables the guard )
+        self.loopHopBudget          = 8
+        self.loopWindow             = 100
+
+        # Command port and late join state mirror ( a size of 0 disables the mirror )
+        self.commandListenPort      = None
+        self.stateMirrorBytes       = 0
+
         # Set up logger
         self.logger = logger
 
@@ -287,10 +310,36 @@ class ConfigFile:
                             lineData[ self.CONFIG_VALUE_ARG ]
                             )
 
+                # Forwarding loop guard
+                if lineData[ self.CONFIG_PROPERTY_ARG ] == 'oscwhispers.loop_hop_budget':
+                    self.loopHopBudget = int(
+                            lineData[ self.CONFIG_VALUE_ARG ]
+                            )
+
+                if lineData[ self.CONFIG_PROPERTY_ARG ] == 'oscwhispers.loop_window_ms':
+                    self.loopWindow = int(
+                            lineData[ self.CONFIG_VALUE_ARG ]
+                            )
+
+                # Command port and state mirror
+                if lineData[ self.CONFIG_PROPERTY_ARG ] == 'oscwhispers.command_listen_port':
+                    self.commandListenPort = int(
+                            lineData[ self.CONFIG_VALUE_ARG ]
+                            )
+
+                if lineData[ self.CONFIG_PROPERTY_ARG ] == 'oscwhispers.state_mirror_kb':
+                    self.stateMirrorBytes = int(
+                            lineData[ self.CONFIG_VALUE_ARG ]
+                            ) * 1024
+
         
         return {
                 'serverListenPort'          : self.serverListenPort         ,
                 'daemonFiles'               : self.daemonFiles              ,
+                'loopHopBudget'             : self.loopHopBudget            ,
+                'loopWindow'                : self.loopWindow               ,
+                'commandListenPort'         : self.commandListenPort        ,
+                'stateMirrorBytes'          : self.stateMirrorBytes         ,
                 }
 
 
@@ -317,6 +366,7 @@ class ParseArgs:
         # Declare argument variables with default values
         self.daemonFiles            = configData[ 'daemonFiles' ]
         self.otwFileLocations       = []
+        self.peers                  = []
         
         '''
             A pid file is only created if OSC Whispers is run in daemon mode.
@@ -339,6 +389,7 @@ class ParseArgs:
 
 
     def parse( self ):
+        from argparse import ArgumentParser
         parser = ArgumentParser(
                 description = 'An Open Sound Control forwarding agent.' ,
                 )
@@ -364,10 +415,28 @@ class ParseArgs:
                 action      = 'store_true'              ,
                 help        = 'Start in daemon mode.'   ,
                 )
+
+        # Other OSC Whispers instances, checked for forwarding loops
+        parser.add_argument(
+                '-p'                                                                            ,
+                '--peer'                                                                        ,
+                dest        = 'peers'                                                           ,
+                nargs       = '+'                                                               ,
+                action      = 'append'                                                          ,
+                metavar     = ( 'IP:PORT' , 'FILE' )                                            ,
+                help        = 'Another OSC Whispers listening on IP:PORT with its OTW files.'  ,
+                )
    
         # Set argument values
         args = parser.parse_args()
 
+        # Peer OSC Whispers instances ( IP:PORT , FILE , FILE , ... )
+        if args.peers:
+            for peer in args.peers:
+                if len( peer ) < 2:
+                    parser.error( 'a peer requires IP:PORT and at least one OTW file' )
+                self.peers.append( peer )
+
         # Load and parse otw files passed as arguments
         if args.otw:
             # Load OTW Files into a list for the argData dictionary
@@ -383,6 +452,7 @@ class ParseArgs:
     
         return {
                 'otwFileLocations'          : self.otwFileLocations         ,
+                'peers'                     : self.peers                    ,
                 }
 
 
@@ -398,6 +468,8 @@ class OTWFiles:
     OTW_COMMENT_SYMBOL              = '#'
     OTW_PATH_SYMBOL                 = '/'
     OTW_PORT_SYMBOL                 = ':'
+    OTW_PREDICATE_SYMBOL            = '?'
+    OTW_TRANSFORM_SYMBOL            = '|'
     OTW_NO_PATH_REPLACEMENT_LENGTH  = 1
     
     PATH_PREFIX_INDEX           = 0
@@ -407,10 +479,37 @@ class OTWFiles:
     OSC_TARGETS_ID_INDEX        = 0
     OSC_TARGETS_TARGET_INDEX    = 1
 
+    # Predicate clauses ( ?types=ff , ?arg0>=-60 , ?arg0=0..1 )
+    PREDICATE_TYPES_KEYWORD     = 'types='
+    PREDICATE_RANGE_SYMBOL      = '..'
+    PREDICATE_ARG_PATTERN       = compileRegex( r'^arg(\d+)(>=|<=|!=|==|>|<|=)(.+)$' )
+    PREDICATE_OPERATORS         = {
+            '>='    : ge    ,
+            '<='    : le    ,
+            '!='    : ne    ,
+            '=='    : eq    ,
+            '>'     : gt    ,
+            '<'     : lt    ,
+            '='     : eq    ,
+            }
+
+    # Transform stages ( IP:PORT|scale=0:1:0:127|int , IP:PORT|order=1:0|gain1 )
+    TRANSFORM_STAGE_PATTERN     = compileRegex( r'^([a-z]+)(\d*)(?:=(.*))?$' )
+    TRANSFORM_PARAM_SYMBOL      = ':'
+    TRANSFORM_DEFAULT_ARG_INDEX = 0
+    TRANSFORM_LUT_SIZE          = 128
+    TRANSFORM_DB_FLOOR          = -144.0
+
+    # Path rewrite templates ( /ardour/strip/{1}/gain  IP:PORT/mixer/ch{1}/vol )
+    REWRITE_CAPTURE_PATTERN     = compileRegex( r'\{(\d+)\}' )
+    REWRITE_CACHE_SIZE          = 512
+
     # These indexes refer to data inside of oscTargets
     OSC_TARGET_IP_INDEX                 = 0
     OSC_TARGET_PORT_INDEX               = 1
     OSC_TARGET_PATH_REPLACEMENT_INDEX   = 2
+    OSC_TARGET_TRANSFORM_INDEX          = 3
+    OSC_TARGET_REWRITE_INDEX            = 4
     
     # Used for splitting path aliases from ports
     OSC_TARGET_PORT_SPLIT_PORT_INDEX                    = 0
@@ -429,6 +528,10 @@ class OTWFiles:
         # Setup the logger
         self.logger = logger
 
+        # Compiled transforms and rewrites, keyed by their OTW specification
+        self.transforms = {}
+        self.rewrites   = {}
+
         # Run initialization functions
         self.otwFileData = self.parseOtwFiles(
                 self.loadOtwFiles( otwFiles )
@@ -462,8 +565,336 @@ class OTWFiles:
     
 
 
+    def isPredicateClause( self , token = '' ):
+        """ Return True if an OTW rule token is a predicate clause rather than a target. """
+        return token.startswith( self.OTW_PREDICATE_SYMBOL )
+
+
+
+    def predicateValue( self , value = '' ):
+        """ Convert a predicate value to an integer, floating point, or string. """
+        try:
+            return int( value )
+        except ValueError:
+            try:
+                return float( value )
+            except ValueError:
+                return value
+
+
+
+    def compilePredicate( self , clause = '' ):
+        """
+            Compile a predicate clause into a closure taking ( args , types ).
+
+            Clauses are parsed once when the OTW files are loaded, so that
+            forwardMessage only calls the closures for each incoming message.
+                ?types=ff       type tags must match exactly
+                ?arg0>=-60      compare an argument against a value
+                ?arg0=0..127    argument must be inside an inclusive range
+        """
+        ARG_INDEX_GROUP     = 1
+        OPERATOR_GROUP      = 2
+        VALUE_GROUP         = 3
+
+        body = clause[ len( self.OTW_PREDICATE_SYMBOL ): ]
+
+        # Type tag predicate
+        if body.startswith( self.PREDICATE_TYPES_KEYWORD ):
+            typeTags = body[ len( self.PREDICATE_TYPES_KEYWORD ): ]
+            def typesPredicate( args , types , typeTags = typeTags ):
+                return types == typeTags
+            return typesPredicate
+
+        # Argument predicate
+        argMatch = self.PREDICATE_ARG_PATTERN.match( body )
+        if not argMatch:
+            print( 'Error: OTW file contains an invalid predicate ' + clause )
+            exit( ERROR )
+
+        argIndex    = int( argMatch.group( ARG_INDEX_GROUP ) )
+        operator    = argMatch.group( OPERATOR_GROUP )
+        value       = argMatch.group( VALUE_GROUP )
+
+        # Inclusive range, only valid with the = operator
+        if operator == '=' and self.PREDICATE_RANGE_SYMBOL in value:
+            low , high = value.split( self.PREDICATE_RANGE_SYMBOL , 1 )
+            low , high = self.predicateValue( low ) , self.predicateValue( high )
+            def rangePredicate( args , types , argIndex = argIndex , low = low , high = high ):
+                try:
+                    return low <= args[ argIndex ] <= high
+                except ( IndexError , TypeError ):
+                    return False
+            return rangePredicate
+
+        compare = self.PREDICATE_OPERATORS[ operator ]
+        value   = self.predicateValue( value )
+        def argPredicate( args , types , argIndex = argIndex , compare = compare , value = value ):
+            try:
+                return compare( args[ argIndex ] , value )
+            except ( IndexError , TypeError ):
+                return False
+        return argPredicate
+
+
+
+    def transformParams( self , params = '' ):
+        """ Split transform stage parameters into a list of floating point values. """
+        return [
+                float( param ) for param in params.split( self.TRANSFORM_PARAM_SYMBOL )
+                ]
+
+
+
+    def compileArgChain( self , steps = [] ):
+        """
+            Compile a list of per argument steps into one function.
+
+            Consecutive scale steps are folded into a single affine step, and
+            chains containing non linear steps (db, gain) are precomputed into a
+            lookup table for integer input ( 0 - 127 ).
+        """
+        STEP_NAME_INDEX     = 0
+        STEP_PARAMS_INDEX   = 1
+
+        # Fold consecutive affine steps together
+        foldedSteps = []
+        for step in steps:
+            if step[ STEP_NAME_INDEX ] == 'affine' and foldedSteps and foldedSteps[ -1 ][ STEP_NAME_INDEX ] == 'affine':
+                previousScale , previousOffset  = foldedSteps[ -1 ][ STEP_PARAMS_INDEX ]
+                scale , offset                  = step[ STEP_PARAMS_INDEX ]
+                foldedSteps[ -1 ] = (
+                        'affine'                                            ,
+                        ( previousScale * scale , previousOffset * scale + offset ) ,
+                        )
+            else:
+                foldedSteps.append( step )
+
+        # Build a function for each step
+        functions   = []
+        nonLinear   = False
+        for name , params in foldedSteps:
+            if name == 'affine':
+                def function( value , scale = params[ 0 ] , offset = params[ 1 ] ):
+                    return value * scale + offset
+            elif name == 'clamp':
+                def function( value , low = params[ 0 ] , high = params[ 1 ] ):
+                    return low if value < low else high if value > high else value
+            elif name == 'int':
+                def function( value ):
+                    return int( round( value ) )
+            elif name == 'float':
+                function = float
+            elif name == 'db':
+                nonLinear = True
+                def function( value , floor = self.TRANSFORM_DB_FLOOR ):
+                    return 20.0 * log10( value ) if value > 0 else floor
+            elif name == 'gain':
+                nonLinear = True
+                def function( value ):
+                    return 10.0 ** ( value / 20.0 )
+            functions.append( function )
+
+        # Compose the step functions
+        if len( functions ) == 1:
+            chain = functions[ 0 ]
+        else:
+            def chain( value , functions = tuple( functions ) ):
+                for function in functions:
+                    value = function( value )
+                return value
+
+        if not nonLinear:
+            return chain
+
+        # Precompute a lookup table for small integer input
+        table = tuple(
+                chain( value ) for value in range( self.TRANSFORM_LUT_SIZE )
+                )
+        def lookupChain( value , table = table , chain = chain , size = self.TRANSFORM_LUT_SIZE ):
+            if value.__class__ is int and 0 <= value < size:
+                return table[ value ]
+            return chain( value )
+        return lookupChain
+
+
+
+    def compileTransform( self , specification = '' ):
+        """
+            Compile a target transform specification into a function taking args.
+
+            Each stage is separated by | and applies to argument 0 unless an
+            argument index follows the stage name ( scale1=... ).
+                scale=inLow:inHigh:outLow:outHigh   affine range mapping
+                clamp=low:high                      limit the value
+                int , float                         retype the value
+                db , gain                           linear to dB , dB to linear
+                order=1:0                           reorder the arguments
+
+            Identical specifications return the same function, so forwardMessage
+            can compute a shared transform once per message.
+        """
+        NAME_GROUP          = 1
+        ARG_INDEX_GROUP     = 2
+        PARAMS_GROUP        = 3
+
+        if specification in self.transforms:
+            return self.transforms[ specification ]
+
+        # Parse stages into a list of ( argument steps ) and ( reorder ) stages
+        stages = []
+        for stageData in specification.split( self.OTW_TRANSFORM_SYMBOL ):
+            stageMatch = self.TRANSFORM_STAGE_PATTERN.match( stageData )
+            if not stageMatch:
+                print( 'Error: OTW file contains an invalid transform ' + stageData )
+                exit( ERROR )
+            name    = stageMatch.group( NAME_GROUP )
+            params  = stageMatch.group( PARAMS_GROUP )
+            if stageMatch.group( ARG_INDEX_GROUP ):
+                argIndex = int( stageMatch.group( ARG_INDEX_GROUP ) )
+            else:
+                argIndex = self.TRANSFORM_DEFAULT_ARG_INDEX
+
+            try:
+                if name == 'order':
+                    stages.append(
+                            ( 'order' , tuple( int( index ) for index in params.split( self.TRANSFORM_PARAM_SYMBOL ) ) )
+                            )
+                    continue
+                if name == 'scale':
+                    inLow , inHigh , outLow , outHigh = self.transformParams( params )
+                    scale   = ( outHigh - outLow ) / ( inHigh - inLow )
+                    step    = ( 'affine' , ( scale , outLow - inLow * scale ) )
+                elif name == 'clamp':
+                    low , high  = self.transformParams( params )
+                    step        = ( 'clamp' , ( low , high ) )
+                elif name in ( 'int' , 'float' , 'db' , 'gain' ):
+                    step        = ( name , None )
+                else:
+                    raise ValueError( name )
+            except ( ValueError , AttributeError , ZeroDivisionError ):
+                print( 'Error: OTW file contains an invalid transform ' + stageData )
+                exit( ERROR )
+
+            # Consecutive argument steps share a single stage
+            if not stages or stages[ -1 ][ 0 ] != 'args':
+                stages.append( ( 'args' , {} ) )
+            stages[ -1 ][ 1 ].setdefault( argIndex , [] ).append( step )
+
+        # Compile each stage
+        compiledStages = []
+        for kind , data in stages:
+            if kind == 'order':
+                def stage( args , order = data ):
+                    return [ args[ index ] for index in order if index < len( args ) ]
+            else:
+                chains = tuple(
+                        ( argIndex , self.compileArgChain( steps ) ) for argIndex , steps in sorted( data.items() )
+                        )
+                def stage( args , chains = chains ):
+                    args = list( args )
+                    for argIndex , chain in chains:
+                        try:
+                            args[ argIndex ] = chain( args[ argIndex ] )
+                        except ( IndexError , TypeError ):
+                            pass
+                    return args
+            compiledStages.append( stage )
+
+        if len( compiledStages ) == 1:
+            transform = compiledStages[ 0 ]
+        else:
+            def transform( args , compiledStages = tuple( compiledStages ) ):
+                for stage in compiledStages:
+                    args = stage( args )
+                return args
+
+        self.transforms[ specification ] = transform
+        return transform
+
+
+
+    def compileRulePath( self , rulePath = '' ):
+        """
+            Compile an OTW rule path into its prefix, a path matcher, and a capture count.
+
+            Segments after the prefix must match the incoming path, and {N}
+            segments capture the incoming segment for rewrite templates.  Capture
+            0 is always the path prefix.  Single segment rule paths keep the
+            original prefix only matching, and have no matcher.
+        """
+        CAPTURE_NUMBER_GROUP    = 1
+        FIRST_SEGMENT_INDEX     = 2
+
+        segments    = rulePath.strip( self.OTW_PATH_SYMBOL ).split( self.OTW_PATH_SYMBOL )
+        prefix      = segments[ self.PATH_PREFIX_INDEX ]
+        if len( segments ) == self.OTW_NO_PATH_REPLACEMENT_LENGTH:
+            return prefix , None , 1
+
+        # Pattern entries are ( segment index , literal , capture number )
+        pattern         = []
+        captureCount    = 1
+        for segmentIndex , segment in enumerate( segments[ 1: ] , FIRST_SEGMENT_INDEX ):
+            captureMatch = self.REWRITE_CAPTURE_PATTERN.fullmatch( segment )
+            if captureMatch:
+                captureNumber   = int( captureMatch.group( CAPTURE_NUMBER_GROUP ) )
+                captureCount    = max( captureCount , captureNumber + 1 )
+                pattern.append( ( segmentIndex , None , captureNumber ) )
+            else:
+                pattern.append( ( segmentIndex , segment , None ) )
+        pattern = tuple( pattern )
+
+        @lru_cache( maxsize = self.REWRITE_CACHE_SIZE )
+        def matchPath(
+                path                                    ,
+                pattern         = pattern               ,
+                captureCount    = captureCount          ,
+                segmentCount    = len( segments ) + 1   ,
+                ):
+            pathSegments = path.split( '/' )
+            if len( pathSegments ) < segmentCount:
+                return None
+            captures = [ pathSegments[ 1 ] ] + [ '' ] * ( captureCount - 1 )
+            for segmentIndex , literal , captureNumber in pattern:
+                if literal is None:
+                    captures[ captureNumber ] = pathSegments[ segmentIndex ]
+                elif pathSegments[ segmentIndex ] != literal:
+                    return None
+            return tuple( captures )
+
+        return prefix , matchPath , captureCount
+
+
+
+    def compileRewrite( self , template = '' ):
+        """
+            Compile a path rewrite template into a segment splicing function.
+
+            The template is split into literal pieces and capture numbers once,
+            and rewritten paths are cached by their captures.
+        """
+        if template in self.rewrites:
+            return self.rewrites[ template ]
+
+        # Split pieces alternate literal , capture number , literal , ...
+        pieces  = self.REWRITE_CAPTURE_PATTERN.split( template )
+        plan    = tuple(
+                int( piece ) if pieceIndex % 2 else piece for pieceIndex , piece in enumerate( pieces )
+                )
+
+        @lru_cache( maxsize = self.REWRITE_CACHE_SIZE )
+        def rewrite( captures , plan = plan ):
+            return ''.join(
+                    captures[ piece ] if piece.__class__ is int else piece for piece in plan
+                    )
+
+        self.rewrites[ template ] = rewrite
+        return rewrite
+
+
+
     def oscTargetData(self, target = '' ):
-        """ Take an osc target 'IP:PORT(/Path/Replacement) and return a  list of osc target data for each target. """
+        """ Take an osc target 'IP:PORT(/Path/Replacement)(|transform) and return a  list of osc target data for each target. """
         # Used to parse target information
         OTW_PATH_SYMBOL                 = '/'
         OTW_PORT_SYMBOL                 = ':'
@@ -478,6 +909,13 @@ class OTWFiles:
         OSC_TARGET_PORT_INDEX               = 1
         OSC_TARGET_PATH_REPLACEMENT_INDEX   = 2
 
+        # Split off and compile the transform
+        if self.OTW_TRANSFORM_SYMBOL in target:
+            target , specification = target.split( self.OTW_TRANSFORM_SYMBOL , 1 )
+            transform = self.compileTransform( specification )
+        else:
+            transform = None
+
         # Get ip
         ip = target.split( OTW_PORT_SYMBOL )[ OSC_TARGET_IP_INDEX ]
         
@@ -507,10 +945,18 @@ class OTWFiles:
                             )[ OSC_TARGET_PORT_SPLIT_PATH_REPLACEMENT_START_INDEX: ]
                         )
 
+        # Compile path rewrite templates
+        if alias and self.REWRITE_CAPTURE_PATTERN.search( alias ):
+            rewrite = self.compileRewrite( alias )
+        else:
+            rewrite = None
+
         return [
-            ip      ,
-            port    ,
-            alias   ,
+            ip          ,
+            port        ,
+            alias       ,
+            transform   ,
+            rewrite     ,
             ]
 
     
@@ -532,7 +978,11 @@ class OTWFiles:
                 * Targets are [ID, [IP, PORT] ]
 
             2nd create the forwarding rules list
-                * Forwarding rules are [ [Path Prefix, Truncation Bool], [Target ID, Target ID, ...] ]
+                * Forwarding rules are [ Path Prefix, Truncation Bool, [Target ID, Target ID, ...], (Predicate, ...), Path Matcher ]
+                * Rule paths with more than one segment are compiled into a path matcher,
+                  and {N} segments are captured for target rewrite templates
+                * Predicate clauses (tokens starting with ?) are compiled to closures
+                  and must all pass before the message is forwarded
 
             Finally a dictionary is returned for the OSC functions to use
                 * dictionary name is otwFileData
@@ -560,6 +1010,10 @@ class OTWFiles:
                             len( lineData )
                             ):
 
+                        # Predicate clauses are not targets
+                        if self.isPredicateClause( lineData[ dataIndex ] ):
+                            continue
+
                         # Debug print oscTargetData
                         allOscTargets.append(
                                 self.oscTargetData(
@@ -598,7 +1052,9 @@ class OTWFiles:
                 if lineData:
 
                     #parse forwarding destinations line
-                    forwardingPathPrefix = lineData[ self.PATH_PREFIX_INDEX ].strip( '/' )
+                    forwardingPathPrefix , pathMatcher , captureCount = self.compileRulePath(
+                            lineData[ self.PATH_PREFIX_INDEX ]
+                            )
 
                     # Determine the truncation indicator boolean
                     if lineData[ self.TRUNCATE_INDICATOR_INDEX ] == "+":
@@ -619,7 +1075,8 @@ class OTWFiles:
                     
                     
                     # Check all targets in OTW File agains oscTargets and store ID list
-                    idList = []
+                    idList      = []
+                    predicates  = []
 
                     '''
                         When checking for the ID of the target Path alias must also be checked
@@ -630,6 +1087,24 @@ class OTWFiles:
                             len( lineData )             ,
                             ):
 
+                        # Compile predicate clauses once, here
+                        if self.isPredicateClause( lineData[ dataIndex ] ):
+                            predicates.append(
+                                    self.compilePredicate( lineData[ dataIndex ] )
+                                    )
+                            continue
+
+                        # Rewrite templates may only use captures of this rule
+                        for captureNumber in self.REWRITE_CAPTURE_PATTERN.findall( lineData[ dataIndex ] ):
+                            if int( captureNumber ) >= captureCount:
+                                print(
+                                        'Error: OTW rule '                      +
+                                        lineData[ self.PATH_PREFIX_INDEX ]      +
+                                        ' has no capture {'                     +
+                                        captureNumber                           +
+                                        '}'
+                                        )
+                                exit( ERROR )
 
                         for target in oscTargets:
                             if self.oscTargetData(
@@ -646,6 +1121,8 @@ class OTWFiles:
                                 forwardingPathPrefix    , 
                                 truncatePathPrefix      , 
                                 idList                  ,
+                                tuple( predicates )     ,
+                                pathMatcher             ,
                                 ]
                             )
         
@@ -658,6 +1135,200 @@ class OTWFiles:
 
 
 
+class LoopAnalyzer:
+    """
+    Find forwarding loops across the forwarding rules of one or more OSC Whispers.
+
+    Each OSC Whispers is a node ( host , port ) with its own otwFileData.  The
+    analyzer walks ( node , path prefix ) states along the forwarding rules, and
+    any state that can reach itself again is a loop.  A target pointing back at
+    the same node and prefix is reported as a self target.
+
+    Predicates are ignored, and truncated or rewritten paths whose prefix can not
+    be known at load time are treated as matching every rule of the target node,
+    so the analysis errs on the side of reporting a loop.
+    """
+
+    LOCAL_HOST          = 'localhost'
+    LOCAL_ADDRESSES     = ( 'localhost' , '0.0.0.0' , '' )
+    ANY_PREFIX          = None
+
+    NODE_HOST_INDEX     = 0
+    NODE_PORT_INDEX     = 1
+
+    def __init__(
+            self            ,
+            whispersNodes   ,
+            logger          ,
+            ):
+        # Set up logger
+        self.logger = logger
+
+        # Addresses of this host
+        self.localAddresses = self.findLocalAddresses()
+
+        # Normalize node addresses
+        self.whispersNodes = {}
+        for node , otwFileData in whispersNodes.items():
+            self.whispersNodes[
+                    self.nodeKey(
+                        node[ self.NODE_HOST_INDEX ]    ,
+                        node[ self.NODE_PORT_INDEX ]    ,
+                        )
+                    ] = otwFileData
+
+        # Run initialization functions
+        self.loops = self.findLoops()
+
+
+    def findLocalAddresses( self ):
+        """ Return the set of addresses that refer to this host. """
+        localAddresses = set( self.LOCAL_ADDRESSES )
+        try:
+            hostName , aliases , addresses = gethostbyname_ex( gethostname() )
+            localAddresses.update( [ hostName ] + aliases + addresses )
+        except ( gaierror , OSError ):
+            pass
+        return localAddresses
+
+
+    def nodeKey(
+            self    ,
+            host    ,
+            port    ,
+            ):
+        """ Return a normalized ( host , port ) key for a node or target. """
+        try:
+            address = gethostbyname( host )
+        except ( gaierror , OSError ):
+            address = host
+        if host in self.localAddresses or address in self.localAddresses or address.startswith( '127.' ):
+            address = self.LOCAL_HOST
+        return ( address , int( port ) )
+
+
+    def nextPrefix(
+            self    ,
+            rule    ,
+            target  ,
+            prefix  ,
+            ):
+        """ Return the path prefix a forwarded message arrives with, or ANY_PREFIX if unknown. """
+        alias = target[ OTWFiles.OSC_TARGET_PATH_REPLACEMENT_INDEX ]
+        if alias:
+            aliasPrefix = alias.split( '/' )[ OSC.PATH_PREFIX_SPLIT_INDEX ]
+            if OTWFiles.REWRITE_CAPTURE_PATTERN.search( aliasPrefix ):
+                return prefix if aliasPrefix == '{0}' else self.ANY_PREFIX
+            return aliasPrefix
+        if rule[ OSC.TRUNCATION_INDICATOR_INDEX ]:
+            return self.ANY_PREFIX
+        return prefix
+
+
+    def edges(
+            self    ,
+            state   ,
+            ):
+        """ Return the states reachable from a ( node , prefix ) state. """
+        STATE_NODE_INDEX    = 0
+        STATE_PREFIX_INDEX  = 1
+
+        node , prefix   = state[ STATE_NODE_INDEX ] , state[ STATE_PREFIX_INDEX ]
+        otwFileData     = self.whispersNodes[ node ]
+        oscTargets      = dict(
+                ( target[ OTWFiles.OSC_TARGETS_ID_INDEX ] , target[ OTWFiles.OSC_TARGETS_TARGET_INDEX ] )
+                for target in otwFileData[ 'oscTargets' ]
+                )
+
+        nextStates = []
+        for rule in otwFileData[ 'forwardingRules' ]:
+            if prefix is not self.ANY_PREFIX and rule[ OSC.PATH_PREFIX_INDEX ] != prefix:
+                continue
+            for targetId in rule[ OSC.CLIENT_TARGET_LIST_INDEX ]:
+                target      = oscTargets[ targetId ]
+                targetNode  = self.nodeKey(
+                        target[ OTWFiles.OSC_TARGET_IP_INDEX ]      ,
+                        target[ OTWFiles.OSC_TARGET_PORT_INDEX ]    ,
+                        )
+                if targetNode not in self.whispersNodes:
+                    continue
+                nextStates.append(
+                        (
+                            targetNode                                                      ,
+                            self.nextPrefix( rule , target , rule[ OSC.PATH_PREFIX_INDEX ] ) ,
+                            )
+                        )
+        return nextStates
+
+
+    def describeState(
+            self    ,
+            state   ,
+            ):
+        """ Return a readable HOST:PORT/prefix for a state. """
+        ( host , port ) , prefix = state
+        if prefix is self.ANY_PREFIX:
+            prefix = '*'
+        return host + ':' + str( port ) + '/' + prefix
+
+
+    def findLoops( self ):
+        """ Return a list of loops, each a list of readable states. """
+        UNVISITED   = 0
+        VISITING    = 1
+        VISITED     = 2
+
+        # Every rule of every node is a starting state
+        startStates = []
+        for node , otwFileData in self.whispersNodes.items():
+            for rule in otwFileData[ 'forwardingRules' ]:
+                startStates.append( ( node , rule[ OSC.PATH_PREFIX_INDEX ] ) )
+
+        # Depth first search, a back edge to a visiting state is a loop
+        status  = {}
+        loops   = []
+        seen    = set()
+        for startState in startStates:
+            if status.get( startState , UNVISITED ) != UNVISITED:
+                continue
+            status[ startState ]    = VISITING
+            stack                   = [ ( startState , iter( self.edges( startState ) ) ) ]
+            trail                   = [ startState ]
+            while stack:
+                state , nextStates = stack[ -1 ]
+                for nextState in nextStates:
+                    nextStatus = status.get( nextState , UNVISITED )
+                    if nextStatus == VISITING:
+                        loop = trail[ trail.index( nextState ): ] + [ nextState ]
+                        if frozenset( loop ) not in seen:
+                            seen.add( frozenset( loop ) )
+                            loops.append(
+                                    [ self.describeState( loopState ) for loopState in loop ]
+                                    )
+                    elif nextStatus == UNVISITED:
+                        status[ nextState ] = VISITING
+                        stack.append( ( nextState , iter( self.edges( nextState ) ) ) )
+                        trail.append( nextState )
+                        break
+                else:
+                    status[ state ] = VISITED
+                    stack.pop()
+                    trail.pop()
+        return loops
+
+
+    def logLoops( self ):
+        """ Log every loop found as a warning. """
+        SELF_TARGET_LENGTH = 2
+        for loop in self.loops:
+            if len( loop ) == SELF_TARGET_LENGTH:
+                self.logger.log( 2 , 'Forwarding loop, self target ' + loop[ 0 ] )
+            else:
+                self.logger.log( 2 , 'Forwarding loop, ' + ' -> '.join( loop ) )
+        return
+
+
+
 ### Create functions 
 class OSC:
     """This class contains all functions for Open Sound Control operations"""
@@ -668,6 +1339,8 @@ class OSC:
     IP_INDEX                = 0
     PORT_INDEX              = 1
     PATH_REPLACEMENT_INDEX  = 2
+    TRANSFORM_INDEX         = 3
+    REWRITE_INDEX           = 4
 
     CLIENT_ID_INDEX = 0
     TARGET_INDEX    = 1
@@ -675,9 +1348,45 @@ class OSC:
     PATH_PREFIX_INDEX           = 0
     TRUNCATION_INDICATOR_INDEX  = 1
     CLIENT_TARGET_LIST_INDEX    = 2
+    PREDICATES_INDEX            = 3
+    PATH_MATCHER_INDEX          = 4
 
     PATH_PREFIX_SPLIT_INDEX = 1
 
+    # Loop guard tables are cleared when full or when their window ends
+    LOOP_FINGERPRINT_TABLE_SIZE = 4096
+    MILLISECONDS                = 1000.0
+
+    # State mirror snapshots
+    SNAPSHOT_COMMAND_PATH       = '/oscwhispers/snapshot'
+    SNAPSHOT_BUNDLE_SIZE        = 32
+
+    # State mirror values are packed as type tags , null , argument data
+    #   Fixed size arguments by type tag, arguments without data by value
+    STATE_SEPARATOR             = b'\0'
+    STATE_FORMATS               = {
+            'i'     : Struct( '>i' )    ,
+            'h'     : Struct( '>q' )    ,
+            'f'     : Struct( '>f' )    ,
+            'd'     : Struct( '>d' )    ,
+            't'     : Struct( '>d' )    ,
+            'c'     : Struct( '>I' )    ,
+            'm'     : Struct( '>BBBB' ) ,
+            }
+    STATE_CONSTANTS             = {
+            'T'     : True              ,
+            'F'     : False             ,
+            'N'     : None              ,
+            'I'     : float( 'inf' )    ,
+            }
+    STATE_LENGTH                = Struct( '>I' )
+    STATE_STRING_TYPES          = 'sS'
+    STATE_BLOB_TYPE             = 'b'
+
+    # Memory of a state mirror entry besides its path and packed value,
+    #   the dictionary slot and the path and value object headers
+    STATE_ENTRY_OVERHEAD        = 200
+
     
     
     def __init__(
@@ -686,9 +1395,38 @@ class OSC:
             forwardingRules     , 
             oscTargets          ,
             logger              ,
+            loopHopBudget       = 0     ,
+            loopWindow          = 0     ,
+            commandListenPort   = None  ,
+            stateMirrorBytes    = 0     ,
+            loopAnalyzer        = None  ,
             ):
         # Declare instatiation variables
-        self.forwardingRules = forwardingRules
+        self.forwardingRules    = forwardingRules
+        self.ruleIndex          = self.buildRuleIndex( forwardingRules )
+
+        # Runtime forwarding loop guard, hops of recently forwarded packets by
+        #   fingerprint, and whether each source address is a router
+        self.loopHopBudget      = loopHopBudget
+        self.loopWindow         = loopWindow / self.MILLISECONDS
+        self.loopWindowStart    = monotonic()
+        self.loopFingerprints   = {}
+        self.loopDropped        = set()
+        self.loopAnalyzer       = loopAnalyzer or LoopAnalyzer( {} , logger )
+        self.routerNodes        = set(
+                [ self.loopAnalyzer.nodeKey( LoopAnalyzer.LOCAL_HOST , serverListenPort ) ] +
+                [
+                    self.loopAnalyzer.nodeKey( target[ self.TARGET_INDEX ][ self.IP_INDEX ] , target[ self.TARGET_INDEX ][ self.PORT_INDEX ] )
+                    for target in oscTargets
+                    ]
+                )
+        self.routerSources      = {}
+
+        # Last value store of forwarded paths, path : packed value in least
+        #   recently updated order, and its memory ( a size of 0 disables the mirror )
+        self.stateMirrorBytes   = stateMirrorBytes
+        self.stateMirror        = {}
+        self.stateMirrorUsed    = 0
 
         # Set up logger
         self.logger = logger
@@ -706,6 +1444,12 @@ class OSC:
         # Setup the OSC server for incoming messages
         self.listenServer = self.setupOscServer( serverListenPort )
 
+        # Setup the OSC server for commands
+        self.servers = [ self.listenServer ]
+        if commandListenPort:
+            self.commandServer = self.setupCommandServer( commandListenPort )
+            self.servers.append( self.commandServer )
+
         # Setup the OSC clients
         self.oscClients = self.setupOscClients( oscTargets )
 
@@ -717,75 +1461,444 @@ class OSC:
             path    , 
             args    ,
             ):
-        #send osc messages in this function
-        libloSend = 'send(target, path'
-        for eachArg in enumerate( args ):
-            libloSend += ', args[' + str(
-                    eachArg[ ENUMERATE_ITERATE_INDEX ]
-                    )+']'
-        libloSend+=')'
-        exec( libloSend )
+        # Sent from the listen port, so forwarded packets show which router sent them
+        self.listenServer.send(
+                target  ,
+                path    ,
+                *args
+                )
         return
 
 
 
+    def buildRuleIndex(
+            self            ,
+            forwardingRules ,
+            ):
+        """ Group forwarding rules, and their predicates, by path prefix. """
+        ruleIndex = {}
+        for rule in forwardingRules:
+            ruleIndex.setdefault(
+                    rule[ self.PATH_PREFIX_INDEX ]  ,
+                    [] ,
+                    ).append( rule )
+        return ruleIndex
+
+
+
+    def matchRule(
+            self    ,
+            rule    ,
+            prefix  ,
+            path    ,
+            args    ,
+            types   ,
+            ):
+        """ Return the captures of a matching rule, or None if the rule does not match. """
+        # Rules with a path matcher must match ( and capture ) the full path
+        pathMatcher = rule[ self.PATH_MATCHER_INDEX ]
+        if pathMatcher:
+            captures = pathMatcher( path )
+            if captures is None:
+                return None
+        else:
+            captures = ( prefix , )
+
+        # Every predicate of the rule must pass
+        for predicate in rule[ self.PREDICATES_INDEX ]:
+            if not predicate( args , types ):
+                return None
+        return captures
+
+
+
+    def clientPath(
+            self        ,
+            client      ,
+            captures    ,
+            outPath     ,
+            ):
+        """ Return the path a client is sent, after any rewrite or path replacement. """
+        clientRewrite = self.oscTargets[ client ][ self.REWRITE_INDEX ]
+        if clientRewrite:
+            # Splice captured segments into the rewrite template
+            return clientRewrite( captures )
+        clientPathReplacement = self.oscTargets[ client ][ self.PATH_REPLACEMENT_INDEX ]
+        if clientPathReplacement:
+            # Replace the path
+            return clientPathReplacement
+        return outPath
+
+
+
+    def clientArgs(
+            self            ,
+            client          ,
+            args            ,
+            transformedArgs ,
+            ):
+        """ Return the arguments a client is sent, transforming once per message for shared transforms. """
+        transform = self.oscTargets[ client ][ self.TRANSFORM_INDEX ]
+        if not transform:
+            return args
+        if transform not in transformedArgs:
+            transformedArgs[ transform ] = transform( args )
+        return transformedArgs[ transform ]
+
+
+
     def forwardMessage(
             self    , 
             path    , 
             args    ,
+            types   ,
+            src     ,
             ):
         """ Forward the osc Message based on forwarding rules. """
         # This is a special function called as a liblo method (add_method) 
+        transformedArgs = {}
 
-        # Check message against the forwarding rules
-        for rule in self.forwardingRules:
-            
-            # Check the path prefix against the forwarding rules
-            if rule[ self.PATH_PREFIX_INDEX ] == self.pathPrefix( path ):
+        # Only rules for this path prefix are checked
+        prefix  = self.pathPrefix( path )
+        rules   = self.ruleIndex.get( prefix , () )
+        if not rules:
+            return
 
-                
-                # Check if the matching rule has a truncation indicator
-                if rule[ self.TRUNCATION_INDICATOR_INDEX ]:
-                    # Truncaton indicator
+        # Drop packets that exceed the loop guard hop budget
+        if self.loopHopBudget:
+            hops = self.loopHops( path , args , src )
+            if hops > self.loopHopBudget:
+                self.logLoop( path )
+                return
+            self.recordForward( path , args , hops )
+
+        # Remember the last value of forwarded paths for late joining targets
+        if self.stateMirrorBytes:
+            self.mirrorState( path , args , types )
+
+        for rule in rules:
+            captures = self.matchRule( rule , prefix , path , args , types )
+            if captures is None:
+                continue
+
+            # Check if the matching rule has a truncation indicator
+            if rule[ self.TRUNCATION_INDICATOR_INDEX ]:
+                outPath = self.truncatePathPrefix( path )
+            else:
+                outPath = path
+
+            for client in rule[ self.CLIENT_TARGET_LIST_INDEX ]:
+                clientPath = self.clientPath( client , captures , outPath )
+                clientArgs = self.clientArgs( client , args , transformedArgs )
+                if self.loopHopBudget:
+                    self.recordForward( clientPath , clientArgs , hops )
+                self.sendOSC(
+                        self.oscClients[ client ]   ,
+                        clientPath                  ,
+                        clientArgs                  ,
+                        )
+        return
+
+
+
+    def mirrorState(
+            self    ,
+            path    ,
+            args    ,
+            types   ,
+            ):
+        """
+            Store the last value of a path in the state mirror.
+
+            The mirror is an insertion ordered dictionary of path to packed
+            value, one bytes object per path, and the least recently updated
+            paths are dropped while it is over stateMirrorBytes.
+        """
+        state = self.packState( types , args )
+        if state is None:
+            return
+        stateMirror = self.stateMirror
+        if path in stateMirror:
+            self.stateMirrorUsed -= len( path ) + len( stateMirror.pop( path ) ) + self.STATE_ENTRY_OVERHEAD
+        stateMirror[ path ] = state
+        self.stateMirrorUsed += len( path ) + len( state ) + self.STATE_ENTRY_OVERHEAD
+        while self.stateMirrorUsed > self.stateMirrorBytes and stateMirror:
+            oldPath = next( iter( stateMirror ) )
+            self.stateMirrorUsed -= len( oldPath ) + len( stateMirror.pop( oldPath ) ) + self.STATE_ENTRY_OVERHEAD
+        return
 
-                    for client in rule[ self.CLIENT_TARGET_LIST_INDEX ]:
 
-                        clientPathReplacement = self.oscTargets[ client ][ self.PATH_REPLACEMENT_INDEX ]
-                        if clientPathReplacement:
-                            # Replace the path
-                            self.sendOSC(
-                                    self.oscClients[ client ]   , 
-                                    clientPathReplacement       , 
-                                    args                        ,
-                                    )
-                        else:
-                            self.sendOSC(
-                                    self.oscClients[ client ]       , 
-                                    self.truncatePathPrefix( path ) , 
-                                    args                            ,
-                                    )
 
+    def packState(
+            self    ,
+            types   ,
+            args    ,
+            ):
+        """ Return the type tags and arguments of a message packed into bytes, or None for an argument type that is not kept. """
+        packed = [ types.encode( 'ascii' ) , self.STATE_SEPARATOR ]
+        try:
+            for argType , arg in zip( types , args ):
+                if argType in self.STATE_FORMATS:
+                    # MIDI arguments are already a tuple of their four bytes
+                    if argType == 'c':
+                        arg = ( ord( arg ) , )
+                    elif argType != 'm':
+                        arg = ( arg , )
+                    packed.append( self.STATE_FORMATS[ argType ].pack( *arg ) )
+                elif argType in self.STATE_STRING_TYPES:
+                    packed.append( arg.encode( 'utf-8' ) + self.STATE_SEPARATOR )
+                elif argType == self.STATE_BLOB_TYPE:
+                    packed.append( self.STATE_LENGTH.pack( len( arg ) ) + bytes( arg ) )
+                elif argType not in self.STATE_CONSTANTS:
+                    return None
+        except ( TypeError , ValueError , UnicodeError ):
+            return None
+        return b''.join( packed )
+
+
+
+    def unpackState( self , state ):
+        """ Return ( types , args ) of a packed state mirror value, args as liblo delivers them. """
+        typeEnd = state.index( self.STATE_SEPARATOR )
+        types   = state[ : typeEnd ].decode( 'ascii' )
+        offset  = typeEnd + 1
+        args    = []
+        for argType in types:
+            if argType in self.STATE_FORMATS:
+                argFormat = self.STATE_FORMATS[ argType ]
+                values = argFormat.unpack_from( state , offset )
+                offset += argFormat.size
+                if argType == 'm':
+                    args.append( values )
+                elif argType == 'c':
+                    args.append( chr( values[ 0 ] ) )
+                else:
+                    args.append( values[ 0 ] )
+            elif argType in self.STATE_STRING_TYPES:
+                stringEnd = state.index( self.STATE_SEPARATOR , offset )
+                args.append( state[ offset : stringEnd ].decode( 'utf-8' ) )
+                offset = stringEnd + 1
+            elif argType == self.STATE_BLOB_TYPE:
+                blobLength = self.STATE_LENGTH.unpack_from( state , offset )[ 0 ]
+                offset += self.STATE_LENGTH.size
+                args.append( list( state[ offset : offset + blobLength ] ) )
+                offset += blobLength
+            else:
+                args.append( self.STATE_CONSTANTS[ argType ] )
+        return types , args
+
+
+
+    def snapshotMessages(
+            self    ,
+            client  ,
+            ):
+        """ Return the messages that bring a client up to date with the state mirror. """
+        messages = []
+        for path , state in self.stateMirror.items():
+            prefix          = self.pathPrefix( path )
+            types , args    = self.unpackState( state )
+            transformedArgs = {}
+            for rule in self.ruleIndex.get( prefix , () ):
+                if client not in rule[ self.CLIENT_TARGET_LIST_INDEX ]:
+                    continue
+                captures = self.matchRule( rule , prefix , path , args , types )
+                if captures is None:
+                    continue
+                if rule[ self.TRUNCATION_INDICATOR_INDEX ]:
+                    outPath = self.truncatePathPrefix( path )
                 else:
+                    outPath = path
+                messages.append(
+                        Message(
+                            self.clientPath( client , captures , outPath )  ,
+                            *self.clientArgs( client , args , transformedArgs )
+                            )
+                        )
+        return messages
 
-                    for client in rule[ self.CLIENT_TARGET_LIST_INDEX ]:
-                        clientPathReplacement = self.oscTargets[ client ][ self.PATH_REPLACEMENT_INDEX ]
-                        if clientPathReplacement:
-                            # Replace the path
-                            self.sendOSC(
-                                    self.oscClients[ client ]   , 
-                                    clientPathReplacement       , 
-                                    args                        ,
-                                    )
-                        else:
-                            self.sendOSC(
-                                    self.oscClients[ client ]   , 
-                                    path                        , 
-                                    args                        ,
-                                    )
+
+
+    def sendSnapshot(
+            self    ,
+            client  ,
+            ):
+        """ Replay the state mirror to a client as a few dense bundles. """
+        messages = self.snapshotMessages( client )
+        for bundleStart in range( 0 , len( messages ) , self.SNAPSHOT_BUNDLE_SIZE ):
+            self.listenServer.send(
+                    self.oscClients[ client ]   ,
+                    Bundle(
+                        *messages[ bundleStart : bundleStart + self.SNAPSHOT_BUNDLE_SIZE ]
+                        )                       ,
+                    )
+        self.logger.log(
+                1                                                       ,
+                'Sent a snapshot of '                                   +
+                str( len( messages ) )                                  +
+                ' paths to '                                            +
+                self.oscTargets[ client ][ self.IP_INDEX ]              +
+                ':'                                                     +
+                str( self.oscTargets[ client ][ self.PORT_INDEX ] )     ,
+                )
+        return
+
+
+
+    def commandMessage(
+            self    ,
+            path    ,
+            args    ,
+            types   ,
+            src     ,
+            ):
+        """
+            Handle a message on the command port.
+
+            /oscwhispers/snapshot                   replay the state mirror to the sender
+            /oscwhispers/snapshot i PORT            replay to the sender host on PORT
+            /oscwhispers/snapshot s IP i PORT       replay to IP:PORT
+        """
+        if path != self.SNAPSHOT_COMMAND_PATH:
+            return
+
+        if types == 'si':
+            host , port = args
+        elif types == 'i':
+            host , port = src.hostname , args[ 0 ]
+        else:
+            host , port = src.hostname , src.port
+        try:
+            address = gethostbyname( host )
+        except ( gaierror , OSError ):
+            address = host
+
+        # Replay to every target on that address, whatever its path replacement
+        for client , target in enumerate( self.oscTargets ):
+            if int( target[ self.PORT_INDEX ] ) != int( port ):
+                continue
+            try:
+                targetAddress = gethostbyname( target[ self.IP_INDEX ] )
+            except ( gaierror , OSError ):
+                targetAddress = target[ self.IP_INDEX ]
+            if targetAddress == address:
+                self.sendSnapshot( client )
+        return
+
+
+
+    def recv(
+            self    ,
+            timeout ,
+            ):
+        """ Wait up to timeout seconds for the listen and command servers, and handle ready messages. """
+        readyServers , _ , _ = select( self.servers , [] , [] , timeout )
+        for server in readyServers:
+            server.recv( 0 )
         return
 
 
 
+    def isRouter(
+            self    ,
+            src     ,
+            ):
+        """ True when a packet came from the listen port of this OSC Whispers or of one of its targets. """
+        source = ( src.hostname , src.port )
+        if source not in self.routerSources:
+            if len( self.routerSources ) >= self.LOOP_FINGERPRINT_TABLE_SIZE:
+                self.routerSources.clear()
+            self.routerSources[ source ] = self.loopAnalyzer.nodeKey( src.hostname , src.port ) in self.routerNodes
+        return self.routerSources[ source ]
+
+
+
+    def loopFingerprint(
+            self    ,
+            path    ,
+            args    ,
+            ):
+        try:
+            return hash( ( path , *args ) )
+        except TypeError:
+            # Unhashable arguments ( blobs ) are fingerprinted by path only
+            return hash( path )
+
+
+
+    def loopHops(
+            self    ,
+            path    ,
+            args    ,
+            src     ,
+            ):
+        """
+            Return the number of forwarding hops a packet has made.
+
+            Forwarded packets are sent from the listen port, so a packet that
+            comes back around a loop arrives from the listen port of this OSC
+            Whispers or of one of its targets.  Such a packet, repeating one
+            forwarded within the loop window, is one hop further along than
+            that packet.  Packets from anywhere else are new, with 0 hops, so
+            repeated traffic from controllers is never counted.
+        """
+        now = monotonic()
+        if now - self.loopWindowStart > self.loopWindow or len( self.loopFingerprints ) >= self.LOOP_FINGERPRINT_TABLE_SIZE:
+            self.loopFingerprints.clear()
+            self.loopWindowStart = now
+
+        if not self.isRouter( src ):
+            return 0
+        hops = self.loopFingerprints.get( self.loopFingerprint( path , args ) )
+        return 0 if hops is None else hops + 1
+
+
+
+    def recordForward(
+            self    ,
+            path    ,
+            args    ,
+            hops    ,
+            ):
+        """ Remember the hops of a packet received or sent while forwarding, for loopHops. """
+        fingerprint = self.loopFingerprint( path , args )
+        self.loopFingerprints[ fingerprint ] = max( hops , self.loopFingerprints.get( fingerprint , 0 ) )
+        return
+
+
+
+    def logLoop(
+            self    ,
+            path    ,
+            ):
+        # Log each looping path only once, until the table fills
+        if path not in self.loopDropped:
+            if len( self.loopDropped ) >= self.LOOP_FINGERPRINT_TABLE_SIZE:
+                self.loopDropped.clear()
+            self.loopDropped.add( path )
+            self.logger.log( 2 , 'Forwarding loop guard dropping packets for ' + path )
+        return
+
+
+
+    def setupCommandServer(
+            self                ,
+            commandListenPort   ,
+            ):
+        """ Setup the OSC server for OSC Whispers commands. """
+        try:
+            oscCommandServer = Server( commandListenPort )
+            oscCommandServer.add_method(
+                    None                ,
+                    None                ,
+                    self.commandMessage ,
+                    )
+        except ServerError as error:
+            exit( error )
+        return oscCommandServer
+
+
+
     def setupOscServer(
             self                , 
             serverListenPort    ,
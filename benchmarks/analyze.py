@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+OSC Analyze Benchmark
+    analyze.py
+
+    Written by: Shane Hutter
+
+    Required Dependencies:  python >= 3.5, numpy
+
+      Writes a synthetic capture file, times OSC Analyze loading and decoding
+      it, and checks that every decoded path and value matches what was
+      written.
+
+      --large puts the messages past 4 GiB into the file, behind one sparse
+      block, so the decoder is checked with offsets that do not fit 32 bits.
+      The file only uses disk space for the real blocks.
+
+          python3 benchmarks/analyze.py
+          python3 benchmarks/analyze.py --count 1000000 --large
+
+      The OSC Analyze benchmark is a part of osctoolkit
+
+      osctoolkit is free software; you can redistribute it and/or modify
+      it under the terms of the GNU Lesser General Public License as published
+      by the Free Software Foundation, either version 3 of the License, or
+      (at your option) any later version.
+
+      osctoolkit is distributed in the hope that it will be useful,
+      but WITHOUT ANY WARRANTY; without even the implied warranty of
+      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+      GNU Lesser General Public License for more details.
+
+      You should have received a copy of the GNU Lesser General Public License
+      along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Import modules
+from argparse       import ArgumentParser
+from os.path        import dirname, abspath, join
+from tempfile       import TemporaryDirectory
+from time           import perf_counter
+import sys
+
+sys.path.insert( 0 , dirname( dirname( abspath( __file__ ) ) ) )
+from OSCToolkit.OSCCapture  import (
+        CaptureWriter   , BLOCK_HEADER  , BLOCK_MAGIC   , RECORD_HEADER ,
+        )
+from OSCToolkit.OSCAnalyze  import TrafficAnalysis
+from OSCToolkit.OSCShout    import encodeMessage
+
+
+BENCHMARK_PATHS     = 64
+BENCHMARK_PORT      = 5000
+MESSAGE_INTERVAL_NS = 1000
+
+# Largest payload one block can hold, its size is 32 bits
+SPARSE_PAYLOAD      = ( 1 << 32 ) - 1
+
+
+
+def benchmarkPath( number ):
+    return '/bench/' + str( number % BENCHMARK_PATHS )
+
+
+def writeCapture(
+        captureFileName ,
+        count           ,
+        large           ,
+        ):
+    """ Write count messages, each with its number as a float argument. """
+    writer = CaptureWriter( captureFileName , rotateSize = 0 )
+
+    # One message at the start of a block of holes
+    if large:
+        datagram = bytes( encodeMessage( benchmarkPath( 0 ) , [ 0.0 ] ) )
+        writer.captureFile.write( BLOCK_HEADER.pack( BLOCK_MAGIC , 1 , SPARSE_PAYLOAD ) )
+        writer.captureFile.write( RECORD_HEADER.pack( 0 , BENCHMARK_PORT , 0 , len( datagram ) ) )
+        writer.captureFile.write( datagram )
+        writer.captureFile.flush()
+        writer.captureFile.truncate( writer.captureFile.tell() + SPARSE_PAYLOAD - len( datagram ) )
+
+    for number in range( int( large ) , count ):
+        writer.add(
+                number * MESSAGE_INTERVAL_NS                                            ,
+                BENCHMARK_PORT                                                          ,
+                bytes( encodeMessage( benchmarkPath( number ) , [ float( number ) ] ) ) ,
+                )
+    writer.sync()
+    writer.captureFile.close()
+    return
+
+
+def checkAnalysis(
+        analysis    ,
+        count       ,
+        ):
+    """ Return the number of messages decoded with the wrong path or value. """
+    if len( analysis.times ) != count:
+        return abs( count - len( analysis.times ) )
+    wrong = 0
+    for number , ( pathId , value ) in enumerate( zip( analysis.pathIds , analysis.values ) ):
+        if analysis.pathNames[ pathId ] != benchmarkPath( number ) or value != number:
+            wrong += 1
+    return wrong
+
+
+def parseArgs():
+    parser = ArgumentParser(
+            description = 'Benchmark and check OSC Analyze on a synthetic capture file.' ,
+            )
+    parser.add_argument(
+            '-n'                                                    ,
+            '--count'                                               ,
+            type    = int                                           ,
+            default = 200000                                        ,
+            help    = 'Messages in the capture file.'               ,
+            )
+    parser.add_argument(
+            '--large'                                               ,
+            action  = 'store_true'                                  ,
+            help    = 'Put the messages past 4 GiB, behind a sparse block.' ,
+            )
+    parser.add_argument(
+            '-d'                                                    ,
+            '--dir'                                                 ,
+            default = None                                          ,
+            help    = 'Directory for the capture file, on a filesystem with sparse files.' ,
+            )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parseArgs()
+    with TemporaryDirectory( dir = args.dir ) as captureDir:
+        captureFileName = join( captureDir , 'bench.osccap' )
+        writeCapture( captureFileName , args.count , args.large )
+
+        start       = perf_counter()
+        analysis    = TrafficAnalysis( [ captureFileName ] , 1.0 , 1.0 )
+        elapsed     = perf_counter() - start
+        wrong       = checkAnalysis( analysis , args.count )
+
+    print( '{:.0f} messages/s decoded , {:d} messages in {:.3f} s'.format( args.count / elapsed , args.count , elapsed ) )
+    if wrong:
+        sys.exit( 'Decoded ' + str( wrong ) + ' messages wrong' )
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+OSC Midi Client Latency Benchmark
+    midi_latency.py
+
+    Written by: Shane Hutter
+
+    Required Dependencies:  python >= 3.5, mido, rtmidi ( --virtual only )
+
+      Measures MIDI in to OSC out latency of the OSC Midi Client translator.
+
+      Each MIDI event is timestamped when it enters the MIDI side, and again
+      when its OSC message is received on a local UDP socket.  By default
+      events go straight into the port callback, the way the MIDI backend
+      thread calls it.  With --virtual they go through a virtual MIDI port
+      and the real MIDI backend as well.
+
+      With --devices, that many threads play the part of MIDI devices, all
+      sending at once at --rate events per second each.  Every device sends a
+      numbered controller sequence, so the receiver can check that the events
+      of each device stay in order, and count the events each device lost.
+
+          python3 benchmarks/midi_latency.py
+          python3 benchmarks/midi_latency.py --count 100000 --virtual
+          python3 benchmarks/midi_latency.py --devices 16 --bundle
+
+      The MIDI latency benchmark is a part of osctoolkit
+
+      osctoolkit is free software; you can redistribute it and/or modify
+      it under the terms of the GNU Lesser General Public License as published
+      by the Free Software Foundation, either version 3 of the License, or
+      (at your option) any later version.
+
+      osctoolkit is distributed in the hope that it will be useful,
+      but WITHOUT ANY WARRANTY; without even the implied warranty of
+      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+      GNU Lesser General Public License for more details.
+
+      You should have received a copy of the GNU Lesser General Public License
+      along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Import modules
+from argparse       import ArgumentParser
+from os.path        import dirname, abspath
+from socket         import socket, AF_INET, SOCK_DGRAM, SOL_SOCKET, SO_RCVBUF
+from time           import perf_counter, sleep
+from threading      import Thread
+import sys
+
+sys.path.insert( 0 , dirname( dirname( abspath( __file__ ) ) ) )
+from OSCToolkit.OSCMidiClient   import MidiToOSC
+from mido                       import Message
+
+
+BENCHMARK_PORT_NAME = 'oscmidi-benchmark'
+RECEIVE_TIMEOUT     = 1.0
+RECEIVE_BUFFER      = 8 * ( 1 << 20 )
+MICROSECONDS        = 1000000.0
+PERCENTILES         = ( 50 , 90 , 99 , 99.9 , )
+
+# Device events are numbered by channel , controller and value, so each
+#   device can send this many before the numbers wrap
+MIDI_DATA_VALUES    = 128
+MIDI_CHANNELS       = 16
+DEVICE_EVENTS_MAX   = MIDI_CHANNELS * MIDI_DATA_VALUES * MIDI_DATA_VALUES
+
+
+
+def benchmarkEvents( count ):
+    """ A mix of note, controller, and pitchwheel events. """
+    events = (
+            Message( 'note_on'          , channel = 0 , note = 60 , velocity = 100 )    ,
+            Message( 'control_change'   , channel = 1 , control = 7 , value = 64 )      ,
+            Message( 'pitchwheel'       , channel = 2 , pitch = 1000 )                  ,
+            Message( 'note_off'         , channel = 0 , note = 60 , velocity = 0 )      ,
+            )
+    return [ events[ index % len( events ) ].bytes() for index in range( count ) ]
+
+
+def measureLatency(
+        sendMidi    ,
+        receiver    ,
+        events      ,
+        ):
+    """ Send each event and wait for its OSC message, return the latencies in seconds. """
+    latencies = []
+    for midiData in events:
+        start = perf_counter()
+        sendMidi( midiData )
+        receiver.recv( 1024 )
+        latencies.append( perf_counter() - start )
+    return latencies
+
+
+def displayLatencies(
+        mode        ,
+        latencies   ,
+        elapsed     ,
+        ):
+    latencies = sorted( latencies )
+    print(
+            mode + ': '                                                     +
+            str( len( latencies ) ) + ' events, '                           +
+            '%.0f' % ( len( latencies ) / elapsed ) + ' events/s'
+            )
+    print(
+            '    latency '                                                  +
+            ', '.join(
+                'p' + '%g' % percentile + ' ' + '%.1f' % (
+                    latencies[ min( int( len( latencies ) * percentile / 100 ) , len( latencies ) - 1 ) ] * MICROSECONDS
+                    ) + ' us'
+                for percentile in PERCENTILES
+                )                                                           +
+            ', max ' + '%.1f' % ( latencies[ -1 ] * MICROSECONDS ) + ' us'
+            )
+
+
+def deviceEvents( count ):
+    """ Numbered controller events, the number is ( channel * 128 + controller ) * 128 + value. """
+    return [
+            Message(
+                'control_change'                                                    ,
+                channel = number // ( MIDI_DATA_VALUES * MIDI_DATA_VALUES )         ,
+                control = number // MIDI_DATA_VALUES % MIDI_DATA_VALUES             ,
+                value   = number % MIDI_DATA_VALUES                                 ,
+                ).bytes()
+            for number in range( count )
+            ]
+
+
+def playDevice(
+        midiCallback    ,
+        events          ,
+        rate            ,
+        ):
+    """ Call a port callback with each event at rate events per second. """
+    start = perf_counter()
+    for number , midiData in enumerate( events ):
+        wait = start + number / rate - perf_counter()
+        if wait > 0:
+            sleep( wait )
+        midiCallback( midiData )
+
+
+def measureDevices(
+        midiToOSC   ,
+        receiver    ,
+        devices     ,
+        count       ,
+        rate        ,
+        ):
+    """ Send from every device thread at once, and check the order of each device. """
+    callbacks   = [ midiToOSC.addPort( 'device' + str( device ) ) for device in range( devices ) ]
+    events      = [ deviceEvents( count ) for device in range( devices ) ]
+    senders     = [
+            Thread(
+                target  = playDevice                            ,
+                args    = ( callback , deviceEvents , rate )    ,
+                )
+            for callback , deviceEvents in zip( callbacks , events )
+            ]
+
+    # Device name and controller number of every received message, in arrival order
+    received    = []
+    start       = perf_counter()
+    for sender in senders:
+        sender.start()
+    try:
+        while len( received ) < devices * count:
+            datagram = receiver.recv( 65536 )
+            received.extend( splitDatagram( datagram ) )
+    except OSError:
+        pass
+    elapsed = perf_counter() - start
+    for sender in senders:
+        sender.join()
+
+    # Every device should see 0 , 1 , 2 , ... , a lower number is out of order
+    nextNumber  = {}
+    perDevice   = {}
+    outOfOrder  = 0
+    for device , number in received:
+        if number < nextNumber.get( device , 0 ):
+            outOfOrder += 1
+        nextNumber[ device ]    = number + 1
+        perDevice[ device ]     = perDevice.get( device , 0 ) + 1
+
+    print(
+            str( devices ) + ' devices: '                                       +
+            str( len( received ) ) + ' of ' + str( devices * count ) + ' events in ' +
+            '%.3f' % elapsed + ' s, '                                           +
+            '%.0f' % ( len( received ) / elapsed ) + ' events/s, '              +
+            str( outOfOrder ) + ' out of order, '                               +
+            str( midiToOSC.droppedEvents() ) + ' dropped from the queues'
+            )
+    if perDevice:
+        print(
+                '    events received per device, least ' + str( min( perDevice.values() ) ) +
+                ', most ' + str( max( perDevice.values() ) )
+                )
+
+
+def splitDatagram( datagram ):
+    """ Return [ ( device , number ) ] for an OSC message or bundle of controller messages. """
+    from struct import unpack_from
+
+    if datagram.startswith( b'#bundle' ):
+        messages    = []
+        offset      = 16
+        while offset < len( datagram ):
+            size , = unpack_from( '>i' , datagram , offset )
+            messages.extend( splitDatagram( datagram[ offset + 4 : offset + 4 + size ] ) )
+            offset += 4 + size
+        return messages
+
+    pathParts       = datagram[ : datagram.index( b'\0' ) ].decode().split( '/' )
+    control , value = unpack_from( '>ii' , datagram , len( datagram ) - 8 )
+    channel         = int( pathParts[ 3 ] ) - 1
+    return [ ( pathParts[ 2 ] , ( channel * MIDI_DATA_VALUES + control ) * MIDI_DATA_VALUES + value ) ]
+
+
+def parseArgs():
+    parser = ArgumentParser(
+            description = 'Measure MIDI in to OSC out latency of OSC Midi Client.' ,
+            )
+    parser.add_argument(
+            '-n'                                                    ,
+            '--count'                                               ,
+            type    = int                                           ,
+            default = 20000                                         ,
+            help    = 'Number of MIDI events.'                      ,
+            )
+    parser.add_argument(
+            '--virtual'                                             ,
+            action  = 'store_true'                                  ,
+            help    = 'Also send through a virtual MIDI port ( needs rtmidi ).' ,
+            )
+    parser.add_argument(
+            '-d'                                                    ,
+            '--devices'                                             ,
+            type    = int                                           ,
+            default = 0                                             ,
+            help    = 'Send from this many devices at once, each sending --count events.' ,
+            )
+    parser.add_argument(
+            '-r'                                                    ,
+            '--rate'                                                ,
+            type    = float                                         ,
+            default = 1000.0                                        ,
+            help    = 'Events per second from each device.'         ,
+            )
+    parser.add_argument(
+            '-b'                                                    ,
+            '--bundle'                                              ,
+            action  = 'store_true'                                  ,
+            help    = 'Bundle events that are waiting together.'    ,
+            )
+    args = parser.parse_args()
+    if args.devices and args.count > DEVICE_EVENTS_MAX:
+        parser.error( '--count can be at most ' + str( DEVICE_EVENTS_MAX ) + ' with --devices' )
+    return args
+
+
+if __name__ == '__main__':
+    args = parseArgs()
+
+    # The OSC target is a local socket, so receiving is part of the measurement
+    receiver = socket( AF_INET , SOCK_DGRAM )
+    receiver.setsockopt( SOL_SOCKET , SO_RCVBUF , RECEIVE_BUFFER )
+    receiver.bind( ( '127.0.0.1' , 0 ) )
+    receiver.settimeout( RECEIVE_TIMEOUT )
+    midiToOSC = MidiToOSC(
+            '127.0.0.1'                     ,
+            receiver.getsockname()[ 1 ]     ,
+            args.bundle                     ,
+            )
+    midiToOSC.start()
+
+    # Many devices at once
+    if args.devices:
+        measureDevices( midiToOSC , receiver , args.devices , args.count , args.rate )
+        midiToOSC.close()
+        sys.exit()
+
+    events = benchmarkEvents( args.count )
+
+    # Straight into the port callback
+    midiCallback = midiToOSC.addPort( BENCHMARK_PORT_NAME )
+    start = perf_counter()
+    latencies = measureLatency( midiCallback , receiver , events )
+    displayLatencies( 'callback' , latencies , perf_counter() - start )
+
+    # Through a virtual MIDI port and the MIDI backend
+    if args.virtual:
+        from mido import open_output, get_input_names
+        with open_output( BENCHMARK_PORT_NAME , virtual = True ) as midiOutput:
+            # The backend may decorate the virtual port name with its client name
+            deviceNames = [ name for name in get_input_names() if BENCHMARK_PORT_NAME in name ]
+            if not deviceNames:
+                sys.exit( 'The virtual MIDI port is not visible as an input device' )
+            midiToOSC.openPorts( [] , deviceNames[ : 1 ] )
+            start = perf_counter()
+            latencies = measureLatency(
+                    lambda midiData : midiOutput.send( Message.from_bytes( midiData ) ) ,
+                    receiver                                                            ,
+                    events                                                              ,
+                    )
+            displayLatencies( 'virtual port' , latencies , perf_counter() - start )
+    midiToOSC.close()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+OSC Midi Loopback Benchmark
+    midi_loopback.py
+
+    Written by: Shane Hutter
+
+    Required Dependencies:  python >= 3.5, pyliblo ( without --direct )
+
+      Measures throughput and latency of the MIDI to OSC path of OSC Midi
+      Client, and the OSC to MIDI path of OSC Midi Server, on the in memory
+      loopback MIDI backend, so no MIDI hardware or MIDI system is needed.
+
+          MIDI to OSC   loopback output -> MidiToOSC -> UDP -> receiver
+          OSC to MIDI   UDP -> liblo server -> OSCToMidi -> loopback input
+
+      --latency and --wire add the simulated delay of a MIDI system and the
+      timing of a MIDI cable to every loopback delivery.  --direct calls the
+      OSC to MIDI translator without the liblo server.
+
+          python3 benchmarks/midi_loopback.py
+          python3 benchmarks/midi_loopback.py --count 50000 --bundle
+          python3 benchmarks/midi_loopback.py --wire --latency 1
+
+      The MIDI loopback benchmark is a part of osctoolkit
+
+      osctoolkit is free software; you can redistribute it and/or modify
+      it under the terms of the GNU Lesser General Public License as published
+      by the Free Software Foundation, either version 3 of the License, or
+      (at your option) any later version.
+
+      osctoolkit is distributed in the hope that it will be useful,
+      but WITHOUT ANY WARRANTY; without even the implied warranty of
+      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+      GNU Lesser General Public License for more details.
+
+      You should have received a copy of the GNU Lesser General Public License
+      along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Import modules
+from argparse       import ArgumentParser
+from os.path        import dirname, abspath
+from socket         import socket, AF_INET, SOCK_DGRAM, SOL_SOCKET, SO_RCVBUF
+from threading      import Thread, Event
+from time           import perf_counter
+import sys
+
+sys.path.insert( 0 , dirname( dirname( abspath( __file__ ) ) ) )
+from OSCToolkit.OSCMidiBackend  import LoopbackBackend, MIDI_WIRE_BYTE_RATE
+from OSCToolkit.OSCMidiClient   import MidiToOSC
+from OSCToolkit.OSCMidiServer   import OSCToMidi
+from OSCToolkit.OSCShout        import encodeMessage
+
+
+BENCHMARK_PORT_NAME = 'bench'
+RECEIVE_TIMEOUT     = 2.0
+RECEIVE_BUFFER      = 8 * ( 1 << 20 )
+SERVER_TIMEOUT_MS   = 50
+MICROSECONDS        = 1000000.0
+MILLISECONDS        = 1000.0
+PERCENTILES         = ( 50 , 90 , 99 , )
+
+# Controller events, status , controller , value
+CONTROL_CHANGE      = 0xB0
+BENCHMARK_EVENTS    = [ bytes( ( CONTROL_CHANGE , 7 , value ) ) for value in range( 128 ) ]
+BENCHMARK_PATH      = '/oscmidi/' + BENCHMARK_PORT_NAME + '/1/cc/7'
+
+
+
+def displayResult(
+        name        ,
+        latencies   ,
+        count       ,
+        elapsed     ,
+        ):
+    latencies = sorted( latencies )
+    print(
+            '{:<12} {:>9.0f} events/s   latency '.format( name , count / elapsed )  +
+            ', '.join(
+                'p' + '%g' % percentile + ' ' + '%.1f' % (
+                    latencies[ min( int( len( latencies ) * percentile / 100 ) , len( latencies ) - 1 ) ] * MICROSECONDS
+                    ) + ' us'
+                for percentile in PERCENTILES
+                )
+            )
+
+
+def countMessages( datagram ):
+    """ Messages in an OSC datagram, counting the elements of a bundle. """
+    if not datagram.startswith( b'#bundle' ):
+        return 1
+    messages    = 0
+    offset      = 16
+    while offset < len( datagram ):
+        messages    += 1
+        offset      += 4 + int.from_bytes( datagram[ offset : offset + 4 ] , 'big' )
+    return messages
+
+
+def midiToOSCBenchmark(
+        backend     ,
+        count       ,
+        latencyRuns ,
+        bundle      ,
+        ):
+    """ Write MIDI to a loopback output, receive the OSC. """
+    receiver = socket( AF_INET , SOCK_DGRAM )
+    receiver.setsockopt( SOL_SOCKET , SO_RCVBUF , RECEIVE_BUFFER )
+    receiver.bind( ( '127.0.0.1' , 0 ) )
+    receiver.settimeout( RECEIVE_TIMEOUT )
+
+    # The queue holds the whole burst, this measures throughput, not dropping
+    midiToOSC = MidiToOSC(
+            '127.0.0.1'                     ,
+            receiver.getsockname()[ 1 ]     ,
+            bundle                          ,
+            queueSize   = count             ,
+            midiBackend = backend           ,
+            )
+    midiToOSC.openPorts( [ BENCHMARK_PORT_NAME ] , [] )
+    midiOutput = backend.openOutput( BENCHMARK_PORT_NAME )
+
+    # Latency, one event at a time
+    latencies = []
+    for number in range( latencyRuns ):
+        start = perf_counter()
+        midiOutput.write( BENCHMARK_EVENTS[ number % len( BENCHMARK_EVENTS ) ] )
+        receiver.recv( 65536 )
+        latencies.append( perf_counter() - start )
+
+    # Throughput, every event at once
+    received    = 0
+    start       = perf_counter()
+    for number in range( count ):
+        midiOutput.write( BENCHMARK_EVENTS[ number % len( BENCHMARK_EVENTS ) ] )
+    try:
+        while received < count:
+            received += countMessages( receiver.recv( 65536 ) )
+    except OSError:
+        pass
+    elapsed = perf_counter() - start
+
+    midiToOSC.close()
+    displayResult( 'MIDI to OSC' , latencies , received , elapsed )
+    if received < count:
+        print( '    received ' + str( received ) + ' of ' + str( count ) )
+
+
+def oscToMidiBenchmark(
+        backend     ,
+        count       ,
+        latencyRuns ,
+        direct      ,
+        ):
+    """ Send OSC to the translator, receive the MIDI on a loopback input. """
+    oscToMidi = OSCToMidi( backend )
+    oscToMidi.addOutput( BENCHMARK_PORT_NAME , backend.openOutput( BENCHMARK_PORT_NAME ) )
+
+    # Count MIDI messages arriving on the loopback input
+    arrived     = [ 0 ]
+    target      = [ 0 ]
+    allArrived  = Event()
+    def midiCallback( midiData ):
+        arrived[ 0 ] += 1
+        if arrived[ 0 ] >= target[ 0 ]:
+            allArrived.set()
+    midiInput = backend.openInput( BENCHMARK_PORT_NAME , midiCallback )
+
+    # OSC goes through the liblo server, unless it is called directly
+    if direct:
+        def sendOSC( value ):
+            oscToMidi.oscMessage( BENCHMARK_PATH , ( value , ) )
+    else:
+        oscServer   = oscToMidi.setupOSCServer( 0 )
+        serving     = [ True ]
+        def serve():
+            while serving[ 0 ]:
+                oscServer.recv( SERVER_TIMEOUT_MS )
+        serverThread = Thread( target = serve , daemon = True )
+        serverThread.start()
+        sender = socket( AF_INET , SOCK_DGRAM )
+        sender.connect( ( '127.0.0.1' , oscServer.port ) )
+        encoded = [ bytes( encodeMessage( BENCHMARK_PATH , [ value ] ) ) for value in range( 128 ) ]
+        def sendOSC( value ):
+            sender.send( encoded[ value ] )
+
+    def expect( total ):
+        allArrived.clear()
+        target[ 0 ] = total
+
+    def waitFor( total ):
+        if arrived[ 0 ] < total:
+            allArrived.wait( RECEIVE_TIMEOUT )
+
+    # Latency, one message at a time
+    latencies = []
+    for number in range( latencyRuns ):
+        expect( number + 1 )
+        start = perf_counter()
+        sendOSC( number % 128 )
+        waitFor( number + 1 )
+        latencies.append( perf_counter() - start )
+
+    # Throughput, every message at once
+    expect( latencyRuns + count )
+    start = perf_counter()
+    for number in range( count ):
+        sendOSC( number % 128 )
+    waitFor( latencyRuns + count )
+    elapsed = perf_counter() - start
+    received = arrived[ 0 ] - latencyRuns
+
+    if not direct:
+        serving[ 0 ] = False
+        serverThread.join()
+    midiInput.close()
+    displayResult( 'OSC to MIDI' , latencies , received , elapsed )
+    if received < count:
+        print( '    received ' + str( received ) + ' of ' + str( count ) )
+
+
+def parseArgs():
+    parser = ArgumentParser(
+            description = 'Benchmark the MIDI to OSC and OSC to MIDI paths on the loopback MIDI backend.' ,
+            )
+    parser.add_argument(
+            '-n'                                                    ,
+            '--count'                                               ,
+            type    = int                                           ,
+            default = 20000                                         ,
+            help    = 'Events for the throughput runs.'             ,
+            )
+    parser.add_argument(
+            '-L'                                                    ,
+            '--latency-runs'                                        ,
+            type    = int                                           ,
+            default = 2000                                          ,
+            help    = 'Events for the latency runs, sent one at a time.' ,
+            )
+    parser.add_argument(
+            '--latency'                                             ,
+            type    = float                                         ,
+            default = 0.0                                           ,
+            metavar = 'MS'                                          ,
+            help    = 'Simulated MIDI system latency.'              ,
+            )
+    parser.add_argument(
+            '--wire'                                                ,
+            action  = 'store_true'                                  ,
+            help    = 'Simulate the timing of a MIDI cable.'        ,
+            )
+    parser.add_argument(
+            '-b'                                                    ,
+            '--bundle'                                              ,
+            action  = 'store_true'                                  ,
+            help    = 'Bundle MIDI events that arrive together.'    ,
+            )
+    parser.add_argument(
+            '--direct'                                              ,
+            action  = 'store_true'                                  ,
+            help    = 'Call the OSC to MIDI translator without the liblo server.' ,
+            )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args    = parseArgs()
+    backend = LoopbackBackend(
+            latency         = args.latency / MILLISECONDS                       ,
+            wireByteRate    = MIDI_WIRE_BYTE_RATE if args.wire else None        ,
+            )
+    try:
+        midiToOSCBenchmark( backend , args.count , args.latency_runs , args.bundle )
+        oscToMidiBenchmark( backend , args.count , args.latency_runs , args.direct )
+    finally:
+        backend.close()
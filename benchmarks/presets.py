@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+OSC Presets Benchmark
+    presets.py
+
+    Written by: Shane Hutter
+
+    Required Dependencies:  python >= 3.5
+
+      Measures how long OSC Presets takes to load a large OTP file, and how
+      long firing a preset takes once it is loaded.
+
+      An OTP file of --presets presets, each with --messages messages spread
+      over --targets local UDP targets, is generated in a temporary directory.
+      Presets are then fired in a random order, and the time from firing to
+      the return of the last send is measured.
+
+      With --library the presets are compiled into a preset library, and the
+      time to open it and to fire from it is measured as well.  The first fire
+      of a preset reads it from the library, later fires reuse it.
+
+      With --sequences the first presets are also played as looping cue
+      sequences for --seconds, and how late their cues fired is displayed.
+
+          python3 benchmarks/presets.py
+          python3 benchmarks/presets.py --presets 100000 --messages 16
+          python3 benchmarks/presets.py --library
+          python3 benchmarks/presets.py --sequences 8 --seconds 10
+
+      The presets benchmark is a part of osctoolkit
+
+      osctoolkit is free software; you can redistribute it and/or modify
+      it under the terms of the GNU Lesser General Public License as published
+      by the Free Software Foundation, either version 3 of the License, or
+      (at your option) any later version.
+
+      osctoolkit is distributed in the hope that it will be useful,
+      but WITHOUT ANY WARRANTY; without even the implied warranty of
+      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+      GNU Lesser General Public License for more details.
+
+      You should have received a copy of the GNU Lesser General Public License
+      along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Import modules
+from argparse       import ArgumentParser
+from os.path        import dirname, abspath, join
+from random         import Random
+from socket         import socket, AF_INET, SOCK_DGRAM
+from tempfile       import TemporaryDirectory
+from time           import perf_counter, sleep
+import sys
+
+sys.path.insert( 0 , dirname( dirname( abspath( __file__ ) ) ) )
+from OSCToolkit.OSCPresets      import OTPFiles, OSCPresets, PresetLibrary, compilePresetLibrary, displayCueJitter
+
+
+MICROSECONDS        = 1000000.0
+PERCENTILES         = ( 50 , 90 , 99 , )
+CUE_INTERVAL        = 0.01
+CUES_PER_SEQUENCE   = 10
+
+
+
+def writeOtpFile(
+        otpFileName ,
+        presets     ,
+        messages    ,
+        targetPorts ,
+        ):
+    """ Write presets of fader messages, spread over the targets. """
+    with open( otpFileName , 'w' ) as otpFile:
+        for preset in range( presets ):
+            for message in range( messages ):
+                otpFile.write(
+                        'preset' + str( preset )                                            +
+                        ' 127.0.0.1:' + str( targetPorts[ message % len( targetPorts ) ] )  +
+                        '/mixer/ch' + str( message ) + '/vol '                              +
+                        str( ( preset + message ) % 100 / 100.0 ) + '\n'
+                        )
+
+
+def measureFires(
+        oscPresets  ,
+        presetIds   ,
+        fires       ,
+        ):
+    """ Fire presets in a random order, return the sorted fire times. """
+    random      = Random( 0 )
+    fireTimes   = []
+    for fire in range( fires ):
+        presetId    = presetIds[ random.randrange( len( presetIds ) ) ]
+        start       = perf_counter()
+        oscPresets.fire( presetId )
+        fireTimes.append( perf_counter() - start )
+    return sorted( fireTimes )
+
+
+def cueSequences(
+        presetIds   ,
+        sequences   ,
+        ):
+    """ Return looping cue sequences, each stepping through presets every CUE_INTERVAL. """
+    return {
+            'sequence' + str( sequence ) : (
+                CUE_INTERVAL * CUES_PER_SEQUENCE ,
+                tuple(
+                    ( cue * CUE_INTERVAL , presetIds[ ( sequence * CUES_PER_SEQUENCE + cue ) % len( presetIds ) ] )
+                    for cue in range( CUES_PER_SEQUENCE )
+                    ) ,
+                )
+            for sequence in range( sequences )
+            }
+
+
+def displayFireTimes(
+        name        ,
+        fireTimes   ,
+        ):
+    print(
+            name + ': '                                                     +
+            ', '.join(
+                'p' + '%g' % percentile + ' ' + '%.1f' % (
+                    fireTimes[ min( int( len( fireTimes ) * percentile / 100 ) , len( fireTimes ) - 1 ) ] * MICROSECONDS
+                    ) + ' us'
+                for percentile in PERCENTILES
+                )
+            )
+
+
+def parseArgs():
+    parser = ArgumentParser(
+            description = 'Measure OTP loading and preset firing of OSC Presets.' ,
+            )
+    parser.add_argument(
+            '-p'                                                    ,
+            '--presets'                                             ,
+            type    = int                                           ,
+            default = 50000                                         ,
+            help    = 'Presets in the OTP file.'                    ,
+            )
+    parser.add_argument(
+            '-m'                                                    ,
+            '--messages'                                            ,
+            type    = int                                           ,
+            default = 8                                             ,
+            help    = 'Messages in each preset.'                    ,
+            )
+    parser.add_argument(
+            '-t'                                                    ,
+            '--targets'                                             ,
+            type    = int                                           ,
+            default = 2                                             ,
+            help    = 'Targets the messages of each preset are spread over.' ,
+            )
+    parser.add_argument(
+            '-n'                                                    ,
+            '--fires'                                               ,
+            type    = int                                           ,
+            default = 20000                                         ,
+            help    = 'Presets fired.'                              ,
+            )
+    parser.add_argument(
+            '-L'                                                    ,
+            '--library'                                             ,
+            action  = 'store_true'                                  ,
+            help    = 'Also compile a preset library, and fire from it.' ,
+            )
+    parser.add_argument(
+            '-s'                                                    ,
+            '--sequences'                                           ,
+            type    = int                                           ,
+            default = 0                                             ,
+            help    = 'Looping cue sequences played at once.'       ,
+            )
+    parser.add_argument(
+            '-d'                                                    ,
+            '--seconds'                                             ,
+            type    = float                                         ,
+            default = 5.0                                           ,
+            help    = 'Seconds the cue sequences are played for.'   ,
+            )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parseArgs()
+
+    # Local targets, which are never read, so only sending is measured
+    receivers = []
+    for target in range( args.targets ):
+        receiver = socket( AF_INET , SOCK_DGRAM )
+        receiver.bind( ( '127.0.0.1' , 0 ) )
+        receivers.append( receiver )
+
+    with TemporaryDirectory() as otpDir:
+        otpFileName = join( otpDir , 'benchmark.otp' )
+        writeOtpFile(
+                otpFileName                                                     ,
+                args.presets                                                    ,
+                args.messages                                                   ,
+                [ receiver.getsockname()[ 1 ] for receiver in receivers ]       ,
+                )
+
+        start       = perf_counter()
+        otpFiles    = OTPFiles( [ otpFileName ] )
+        parsed      = perf_counter()
+        oscPresets  = OSCPresets( otpFiles.presetMessages )
+        loaded      = perf_counter()
+
+        print(
+                str( oscPresets.presetCount() ) + ' presets of ' + str( args.messages ) + ' messages: '  +
+                'parsed in ' + '%.2f' % ( parsed - start ) + ' s, '                                         +
+                'encoded in ' + '%.2f' % ( loaded - parsed ) + ' s'
+                )
+        presetIds = list( oscPresets.presets )
+        displayFireTimes( 'fire' , measureFires( oscPresets , presetIds , args.fires ) )
+        oscPresets.close()
+
+        if args.sequences:
+            oscPresets = OSCPresets(
+                    otpFiles.presetMessages                             ,
+                    cueSequences = cueSequences( presetIds , args.sequences ) ,
+                    )
+            for sequenceId in oscPresets.cueSequences:
+                oscPresets.fire( sequenceId )
+            sleep( args.seconds )
+            displayCueJitter( oscPresets )
+            oscPresets.close()
+
+        if args.library:
+            libraryFileName = join( otpDir , 'benchmark.otpl' )
+            start           = perf_counter()
+            compilePresetLibrary( otpFiles.presetMessages , libraryFileName )
+            compiled        = perf_counter()
+            presetLibrary   = PresetLibrary( libraryFileName )
+            opened          = perf_counter()
+            print(
+                    'library: compiled in ' + '%.2f' % ( compiled - start ) + ' s, '                  +
+                    'opened in ' + '%.1f' % ( ( opened - compiled ) * MICROSECONDS ) + ' us'
+                    )
+
+            # Every preset fired once, read from the library
+            firstFires = []
+            for presetId in presetIds[ : args.fires ]:
+                start = perf_counter()
+                presetLibrary.fire( presetId )
+                firstFires.append( perf_counter() - start )
+            displayFireTimes( 'library first fire' , sorted( firstFires ) )
+            displayFireTimes( 'library fire' , measureFires( presetLibrary , presetIds[ : args.fires ] , args.fires ) )
+            presetLibrary.close()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+OSC Toolkit Startup Benchmark
+    startup.py
+
+    Written by: Shane Hutter
+
+    Required Dependencies:  python >= 3.5
+
+      Measures the import time of each osctoolkit command line tool with
+      python -X importtime, and fails when a tool goes over its budget, or
+      exits with an error.
+
+      Each tool is run with --help, and again doing real work, so the imports
+      deferred until a message is sent, a port is listened on, or MIDI is
+      opened ( liblo and mido ) are measured too.  The import time is the sum
+      of the cumulative times of every top level import that the bare
+      interpreter does not already make at startup.  The fastest of several
+      runs is compared against the time budget, as it is the least disturbed
+      by other load.  Even so the fastest run varies by a third between
+      invocations, so the time budgets are about twice the usual time, and
+      --scale raises them on slower machines.  The number of modules imported
+      does not vary, and its budget catches a new module level import
+      anywhere.
+
+          python3 benchmarks/startup.py
+          python3 benchmarks/startup.py --runs 20 --top 10
+          python3 benchmarks/startup.py --scale 2
+
+      The startup benchmark is a part of osctoolkit
+
+      osctoolkit is free software; you can redistribute it and/or modify
+      it under the terms of the GNU Lesser General Public License as published
+      by the Free Software Foundation, either version 3 of the License, or
+      (at your option) any later version.
+
+      osctoolkit is distributed in the hope that it will be useful,
+      but WITHOUT ANY WARRANTY; without even the implied warranty of
+      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+      GNU Lesser General Public License for more details.
+
+      You should have received a copy of the GNU Lesser General Public License
+      along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Import modules
+from argparse       import ArgumentParser
+from subprocess     import run, PIPE, DEVNULL
+from os.path        import dirname, abspath, join
+from socket         import socket, AF_INET, SOCK_DGRAM
+from sys            import executable, exit
+
+
+# Repository root, where the entry points live
+REPO_DIR = dirname( dirname( abspath( __file__ ) ) )
+
+# Local ports the real runs send to and listen on, filled in at startup
+SEND_PORT   = '{sendPort}'
+LISTEN_PORT = '{listenPort}'
+
+# Runs of each tool ( name , arguments , import time budget in milliseconds , modules imported )
+#   osclisten would listen until stopped, so its real run only opens the listen port
+STARTUP_BUDGETS = (
+        ( 'oscshout'            , [ 'oscshout' , '--help' ]                                         , 60.0  , 40    , ) ,
+        ( 'oscshout send'       , [ 'oscshout' , '127.0.0.1:' + SEND_PORT + '/startup' , '1' ]           , 60.0  , 42    , ) ,
+        ( 'osclisten'           , [ 'osclisten' , '--help' ]                                        , 60.0  , 42    , ) ,
+        ( 'osclisten listen'    , [
+            '-c' , 'from OSCToolkit.OSCListen import *; setupOSCServers( [ ' + LISTEN_PORT + ' ] )' ,
+            ]                                                                                       , 20.0  , 20    , ) ,
+        ( 'oscwhispers'         , [ 'oscwhispers' , '--help' ]                                      , 100.0 , 72    , ) ,
+        ( 'oscmidi-client list' , [ 'oscmidi-client.py' , '--list' ]                                , 300.0 , 190   , ) ,
+        )
+
+# -X importtime line fields ( self us , cumulative us , module )
+IMPORT_TIME_PREFIX  = 'import time:'
+SELF_INDEX          = 0
+CUMULATIVE_INDEX    = 1
+MODULE_INDEX        = 2
+MILLISECONDS        = 1000.0
+
+
+
+def importTimes( command ):
+    """
+        Run a command with -X importtime and return its [ ( self us , cumulative us , module ) ] lines,
+        raises RuntimeError with its last line of error output when it fails.
+    """
+    result = run(
+            [ executable , '-X' , 'importtime' ] + command  ,
+            cwd     = REPO_DIR                              ,
+            stdout  = DEVNULL                               ,
+            stderr  = PIPE                                  ,
+            universal_newlines = True                       ,
+            )
+    times   = []
+    errors  = []
+    for line in result.stderr.splitlines():
+        if not line.startswith( IMPORT_TIME_PREFIX ):
+            errors.append( line )
+            continue
+        fields = line[ len( IMPORT_TIME_PREFIX ) : ].split( '|' )
+        try:
+            times.append(
+                    (
+                        int( fields[ SELF_INDEX ] )         ,
+                        int( fields[ CUMULATIVE_INDEX ] )   ,
+                        fields[ MODULE_INDEX ].rstrip()     ,
+                        )
+                    )
+        except ValueError:
+            # Header line
+            continue
+    if result.returncode:
+        raise RuntimeError(
+                errors[ -1 ] if errors else 'exit status ' + str( result.returncode )
+                )
+    return times
+
+
+def topLevel( module ):
+    """ Top level imports have one space of indentation. """
+    return not module.startswith( '  ' )
+
+
+def startupImports():
+    """ Return the modules the bare interpreter imports at startup. """
+    return set(
+            module.strip() for selfTime , cumulativeTime , module in importTimes( [ '-c' , 'pass' ] )
+            )
+
+
+def measureTool(
+        arguments       ,
+        baseModules     ,
+        ):
+    """ Return ( import ms , [ ( self us , module ) ] ) for one run of a tool, arguments[ 0 ] is the entry point or -c. """
+    if arguments[ 0 ] != '-c':
+        arguments = [ join( REPO_DIR , arguments[ 0 ] ) ] + arguments[ 1 : ]
+    times = importTimes( arguments )
+    total = sum(
+            cumulativeTime for selfTime , cumulativeTime , module in times
+            if topLevel( module ) and module.strip() not in baseModules
+            )
+    modules = [
+            ( selfTime , module.strip() ) for selfTime , cumulativeTime , module in times
+            if module.strip() not in baseModules
+            ]
+    return total / MILLISECONDS , modules
+
+
+def parseArgs():
+    parser = ArgumentParser(
+            description = 'Measure the import time of each osctoolkit command line tool.' ,
+            )
+    parser.add_argument(
+            '-n'                                                    ,
+            '--runs'                                                ,
+            type    = int                                           ,
+            default = 9                                             ,
+            help    = 'Runs per tool, the fastest is reported.'     ,
+            )
+    parser.add_argument(
+            '-t'                                                    ,
+            '--top'                                                 ,
+            type    = int                                           ,
+            default = 5                                             ,
+            help    = 'Show the slowest imports of each tool.'      ,
+            )
+    parser.add_argument(
+            '-s'                                                    ,
+            '--scale'                                               ,
+            type    = float                                         ,
+            default = 1.0                                           ,
+            help    = 'Multiply the time budgets, for slower machines.' ,
+            )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args        = parseArgs()
+    baseModules = startupImports()
+    overBudget  = []
+
+    # Sent to and listened on by the real runs, never read
+    receiver    = socket( AF_INET , SOCK_DGRAM )
+    receiver.bind( ( '127.0.0.1' , 0 ) )
+    listener    = socket( AF_INET , SOCK_DGRAM )
+    listener.bind( ( '127.0.0.1' , 0 ) )
+    ports       = {
+            'sendPort'      : receiver.getsockname()[ 1 ]   ,
+            'listenPort'    : listener.getsockname()[ 1 ]   ,
+            }
+    listener.close()
+
+    for tool , arguments , timeBudget , moduleBudget in STARTUP_BUDGETS:
+        arguments   = [ argument.format( **ports ) for argument in arguments ]
+        timeBudget  = timeBudget * args.scale
+        try:
+            runs = [ measureTool( arguments , baseModules ) for runNumber in range( args.runs ) ]
+        except RuntimeError as error:
+            overBudget.append( tool )
+            print( '{:<20} FAILED  {}'.format( tool , error ) )
+            continue
+        importTime , modules = min( runs )
+        overTime    = importTime > timeBudget
+        overModules = len( modules ) > moduleBudget
+        if overTime or overModules:
+            overBudget.append( tool )
+        print(
+                '{:<20} {:>8.2f} ms ( budget {:>5.1f} ) {:>4} modules ( budget {:>3} )  {}'.format(
+                    tool                                                        ,
+                    importTime                                                  ,
+                    timeBudget                                                  ,
+                    len( modules )                                              ,
+                    moduleBudget                                                ,
+                    'OVER BUDGET' if overTime or overModules else 'ok'          ,
+                    )
+                )
+
+        # Slowest imports of the fastest run
+        for selfTime , module in sorted( modules , reverse = True )[ : args.top ]:
+            print( '    {:>8.2f} ms  {}'.format( selfTime / MILLISECONDS , module ) )
+
+    if overBudget:
+        exit( 'Over budget or failed: ' + ', '.join( overBudget ) )
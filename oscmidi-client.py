@@ -30,6 +30,7 @@ OSC Midi Client
 """
 
 from OSCToolkit.OSCMidiClient   import *
+from signal                     import pause
 
 if __name__ == "__main__":
 
@@ -41,11 +42,38 @@ if __name__ == "__main__":
             ]
     config = ConfigFile( CONFIG_FILE_LOCATIONS )
 
-    ## Debug print config and arg data
-    # Consider building funtions of this and others into a debug module
-    for data in config.configData:
-        print(
-                data + " " + str(
-                    config.configData[ data ]
-                    )
+    ## Parse arguments
+    arguments = ParseArgs( config.configData )
+    if arguments.argData[ 'listMidiDevices' ]:
+        listMidiDevices()
+        exit()
+
+    if not arguments.argData[ 'midiVirtualPorts' ] and not arguments.argData[ 'midiDevices' ]:
+        exit( 'No virtual MIDI ports or MIDI devices to listen to' )
+
+    ## Open MIDI ports, each queues its events from its own callback for one sender
+    midiToOSC = MidiToOSC(
+            arguments.argData[ 'oscTargetIp' ]      ,
+            arguments.argData[ 'oscTargetPort' ]    ,
+            arguments.argData[ 'bundleEvents' ]     ,
+            config.configData[ 'eventQueueSize' ]   ,
+            ccRate = arguments.argData[ 'ccRate' ]  ,
+            )
+    midiToOSC.openPorts(
+            arguments.argData[ 'midiVirtualPorts' ] ,
+            arguments.argData[ 'midiDevices' ]      ,
+            )
+
+    if config.configData[ 'verboseVirtualMidiPorts' ] or config.configData[ 'verboseMidiDevices' ]:
+        displayMidiPorts(
+                arguments.argData[ 'midiVirtualPorts' ] ,
+                arguments.argData[ 'midiDevices' ]      ,
                 )
+
+    ## Main loop, nothing to poll
+    try:
+        pause()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        midiToOSC.close()
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+"""
+OSC Midi Server
+    oscmidi-server.py
+
+      Written By: Shane Hutter
+
+      Required Dependencies:  python >= 3.5, pyliblo, python-mido, python-rtmidi
+
+      This python script, and all of osctoolkit is licensed
+      under the GNU GPL version 3
+
+      OSC Midi Server listens for Open Sound Control messages, and translates
+      them into midi events on virtual midi ports, midi devices, and raw midi
+      device files.
+
+      OSC Midi Server is a part of osctoolkit
+
+      osctoolkit is free software; you can redistribute it and/or modify
+      it under the terms of the GNU Lesser General Public License as published
+      by the Free Software Foundation, either version 3 of the License, or
+      (at your option) any later version.
+
+      osctoolkit is distributed in the hope that it will be useful,
+      but WITHOUT ANY WARRANTY; without even the implied warranty of
+      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+      GNU Lesser General Public License for more details.
+
+      You should have received a copy of the GNU Lesser General Public License
+      along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from OSCToolkit.OSCMidiServer   import *
+
+if __name__ == "__main__":
+
+    ## Load configuration file
+    CONFIG_FILE_LOCATIONS = [
+            'osctoolkit.conf'                       , 
+            '/home/$USER/.config/osctoolkit.conf'   , 
+            '/etc/osctoolkit.conf'                  ,
+            ]
+    config = ConfigFile( CONFIG_FILE_LOCATIONS )
+
+    ## Parse arguments
+    arguments = ParseArgs( config.configData )
+    if arguments.argData[ 'listMidiDevices' ]:
+        listMidiDevices()
+        exit()
+
+    ## Open MIDI outputs, every path is compiled as each output is added
+    oscToMidi = OSCToMidi()
+    openMidiOutputs(
+            oscToMidi                               ,
+            arguments.argData[ 'midiVirtualPorts' ] ,
+            arguments.argData[ 'midiDevices' ]      ,
+            arguments.argData[ 'rawMidiDevices' ]   ,
+            )
+    if not oscToMidi.midiOutputs:
+        exit( 'No virtual MIDI ports, MIDI devices, or raw MIDI devices to send to' )
+
+    oscServer = oscToMidi.setupOSCServer( arguments.argData[ 'listenPort' ] )
+
+    if config.configData[ 'verboseListenPort' ]:
+        print( 'Listening for OSC on port number: ' + str( arguments.argData[ 'listenPort' ] ) )
+    if config.configData[ 'verboseMidiPorts' ]:
+        displayMidiOutputs( oscToMidi )
+
+    ## Main loop
+    try:
+        while True:
+            oscServer.recv()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        displayRunningStatus( oscToMidi )
+        oscToMidi.close()
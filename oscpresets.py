@@ -1,13 +1,17 @@
-#!/usr/bin/env python
-'''
+#!/usr/bin/python3
+"""
 OSC Presets
-  oscpresets.py
-    
-    Written by: Shane Hutter
+    oscpresets.py
 
-    Required Dependencies:  python >= 3.5, pyliblo
+      Written by: Shane Hutter
 
-      OSC Presets will send out a list of Open Sound Control messages, after receiving an OSC Message.
+      Required Dependencies:  python >= 3.5, pyliblo
+
+      This python script, and all of osctoolkit is licensed
+      under the GNU GPL version 3
+
+      OSC Presets will send out a list of Open Sound Control messages, after
+      receiving an OSC Message.
 
       OSC Presets is a part of osctoolkit
 
@@ -23,84 +27,63 @@ OSC Presets
 
       You should have received a copy of the GNU Lesser General Public License
       along with this program. If not, see <http://www.gnu.org/licenses/>.
-'''
-
-import sys, liblo
-
-#PROGRAM CONST
-CLEAN=0
-ERROR=1
-ENUM_ITERATE_INDEX=0
-ENUM_VALUE_INDEX=1
-OTP_FILE_ARG=1
-REQUIRED_ARGUMENTS=2
-LOOP_DELAY=1
-HELP_CALL_ARG=1
-HELP_ONLY_ARGUMENTS=2
-
-#CONFIG CONST
-CONFIG_PROPERTY_ARG=0
-CONFIG_VALUE_ARG=1
-
-#Other Vars
-
-#Help and exit
-def helpAndExit(exitStatus):
-    print('Usage:')
-    print('  oscpresets [FILENAME]')
-    print()
-    print('Optional arguments:')
-    print('  -h, --help    Display help and exit.')
-    print()
-    print('Further Documentation:')
-    print('  https://github.com/ShaneHutter/osctoolkit/wiki')
-    print()
-    sys.exit(exitStatus)
-
-#check for help call
-if len(sys.argv)>= HELP_ONLY_ARGUMENTS:
-    if sys.argv[HELP_CALL_ARG]=='-h' or sys.argv[HELP_CALL_ARG]=='--help':
-        helpAndExit(CLEAN)
-
-#Check if the required number of arguments where passed
-if len(sys.argv)!=REQUIRED_ARGUMENTS:
-    helpAndExit(ERROR)
-
-#load config file and declare global vars
-try:
-    configFileName='osctoolkit.conf'
-    configFile=open(configFileName,'r')
-except:
-    configFileName='/etc/osctoolkit.conf'
-    configFile=open(configFileName,'r')
-finally:
-    configLines=configFile.read().split('\n')
-    configFile.close()
-for lineRead in configLines:
-    if (lineRead!="") and (lineRead.strip().startswith('#')==False):
-        #verbosity settings
-        if lineRead.split()[CONFIG_PROPERTY_ARG]=='oscpresets.verbose_listen_port':
-            global verboseListenPort
-            verboseListenPort=bool(int(lineRead.split()[CONFIG_VALUE_ARG]))
-        if lineRead.split()[CONFIG_PROPERTY_ARG]=='oscpresets.verbose_recieved_id':
-            global verboseRecievedId
-            verboseRecievedId=bool(int(lineRead.split()[CONFIG_VALUE_ARG]))
-
-        #OSC settings
-        if lineRead.split()[CONFIG_PROPERTY_ARG]=='oscpresets.listen_port':
-            global listenPort
-            listenPort=bool(int(lineRead.split()[CONFIG_VALUE_ARG]))
-                        
-
-#register OSC input from config
-            
-#Load OTP file
-
-#register OSC ouputs from OTP file
-
-#register methods for recieved OSC messages
-
-#Main loop
-    #listen for osc messages
-
-sys.exit(CLEAN)
+"""
+
+from OSCToolkit.OSCPresets      import *
+
+if __name__ == "__main__":
+
+    ## Load configuration file
+    CONFIG_FILE_LOCATIONS = [
+            'osctoolkit.conf'                       ,
+            '/home/$USER/.config/osctoolkit.conf'   ,
+            '/etc/osctoolkit.conf'                  ,
+            ]
+    config = ConfigFile( CONFIG_FILE_LOCATIONS )
+
+    ## Parse arguments
+    arguments = ParseArgs( config.configData )
+
+    ## Compile OTP files into a preset library
+    if arguments.argData[ 'compileLibrary' ]:
+        otpFiles = OTPFiles( arguments.argData[ 'otpFiles' ] )
+        presetCount = compilePresetLibrary(
+                otpFiles.presetMessages                 ,
+                arguments.argData[ 'compileLibrary' ]   ,
+                otpFiles.cueSequences                   ,
+                )
+        print( 'Compiled ' + str( presetCount ) + ' presets into ' + arguments.argData[ 'compileLibrary' ] )
+        exit()
+
+    ## Open a preset library, presets are read as they fire
+    if arguments.argData[ 'presetLibrary' ]:
+        oscPresets = PresetLibrary(
+                arguments.argData[ 'presetLibrary' ]        ,
+                config.configData[ 'verboseRecievedId' ]    ,
+                )
+
+    ## Load OTP files, every preset is encoded as it is loaded
+    else:
+        otpFiles = OTPFiles( arguments.argData[ 'otpFiles' ] )
+        oscPresets = OSCPresets(
+                otpFiles.presetMessages                     ,
+                config.configData[ 'verboseRecievedId' ]    ,
+                otpFiles.cueSequences                       ,
+                )
+
+    oscServer = oscPresets.setupOSCServer( arguments.argData[ 'listenPort' ] )
+
+    if config.configData[ 'verboseListenPort' ]:
+        print( 'Listening for OSC on port number: ' + str( arguments.argData[ 'listenPort' ] ) )
+        print( 'Presets loaded: ' + str( oscPresets.presetCount() ) )
+        print( 'Cue sequences loaded: ' + str( len( oscPresets.cueSequences ) ) )
+
+    ## Main loop
+    try:
+        while True:
+            oscServer.recv()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        displayCueJitter( oscPresets )
+        oscPresets.close()
@@ -21,14 +21,19 @@ setup(
                     'osclisten'     ,
                     'oscshout'      ,
                     'oscwhispers'   ,
+                    'oscanalyze'    ,
+                    'oscpresets.py' ,
                     ]                                   ,
                 )   ,   
             ( '/etc'                    ,   # Configuration files
                 [ 'osctoolkit.conf' , ]                 ,
                 )   ,
-            ( '/usr/share/osctoolkit'   ,   # User resources
+            ( '/usr/share/osctoolkit/otw'   ,   # User resources
                 [ 'example.otw' , ]                     ,
                 )   ,
+            ( '/usr/share/osctoolkit/otp'   ,
+                [ 'example.otp' , ]                     ,
+                )   ,
             ( '/usr/lib/systemd/system'   ,   # Systemd units/timers
                 [ 'systemd/oscwhispersd.service' , ]    ,
                 )   ,   